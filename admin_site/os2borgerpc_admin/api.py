@@ -2,7 +2,7 @@ from ninja import NinjaAPI
 from ninja.security import HttpBearer
 from django.contrib.admin.views.decorators import user_passes_test
 
-from system.models import APIKey
+from system.access import get_api_key_site
 from system.api import router as system_router
 
 # from changelog.api import router as changelog_router
@@ -13,12 +13,14 @@ from system.api import router as system_router
 # The header format is: "Authorizization: Bearer <SOME_API_KEY_HERE>"
 # Example curl call:
 # curl --header 'Authorization: Bearer <SOME_API_KEY_HERE>' http://localhost:9999/api/system/pcs
+# The site of the key is kept as request.auth_site for the endpoints
 class GlobalAuth(HttpBearer):
     def authenticate(self, request, key):
-        valid_key_check = APIKey.objects.filter(key=key).first()
+        site = get_api_key_site(key)
 
-        if valid_key_check:
-            return valid_key_check.key
+        if site:
+            request.auth_site = site
+            return key
 
 
 # Initialize, and require regular API key authentication to all endpoints except the docs endpoint, make docs endpoint
@@ -17,6 +17,9 @@ def application(environ, start_response):
     job_routes = {
         '/jobs/check_notifications': 'check_notifications',
         '/jobs/clean_up_database': 'clean_up_database',
+        '/jobs/create_partitions': 'create_partitions',
+        '/jobs/reconcile_security_event_counters': 'reconcile_security_event_counters',
+        '/jobs/verify_configuration_data': 'verify_configuration_data --repair',
     }
     command = job_routes.get(path, None)
         
@@ -37,7 +40,7 @@ def application(environ, start_response):
         
 def run(command):
     try:
-        subprocess.run(['python', 'manage.py', command], check=True, text=True, capture_output=True)
+        subprocess.run(['python', 'manage.py', *command.split()], check=True, text=True, capture_output=True)
         return None
     except subprocess.CalledProcessError as e:
         return "Internal server error: " + e.stderr.strip() if e.stderr else 'An error occurred without stderr output.'
\ No newline at end of file
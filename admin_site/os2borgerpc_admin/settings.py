@@ -70,6 +70,23 @@ DATABASES = {
     }
 }
 
+# The cached site memberships, script catalogs and API keys are cleared by
+# signals when they change, which only works if every worker uses the same
+# cache. Without a Redis server nothing is cached.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+        }
+    }
+
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/3.1/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "").split(",")
@@ -280,6 +297,12 @@ CITIZEN_LOGIN_API_VALIDATOR = os.environ.get(
 # Cicero specific stuff.
 CICERO_URL = os.environ.get("CICERO_URL")
 
+# Compare configuration values read from the JSON document of a Configuration
+# with the ConfigurationEntry rows and log any differences.
+CONFIGURATION_VERIFY_READS = (
+    os.getenv("CONFIGURATION_VERIFY_READS", "false").lower() == "true"
+)
+
 # All Python Markdown's officially supported extensions can be added here without
 # any extra setup.
 # Third-party extensions can also be imported and used, asuming they (and their
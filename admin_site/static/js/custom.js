@@ -330,18 +330,49 @@ var BibOS
           triggerElem.attr("data-bs-content", data)
           popover.setContent()
 
-          const parser = new DOMParser();
-          const dataHTML = parser.parseFromString(data, 'text/html');
-
-          const jobLog = dataHTML.getElementById("job-log").innerText
-
-          addEventListenerForClipBoardButton(jobLog)
+          const jobLog = document.getElementById("job-log")
+          if (jobLog) {
+            addEventListenerForClipBoardButton(jobLog)
+            t.streamJobLog(jobLog, id)
+          }
         },
         'error': function() {
         }
       })
       return false
     },
+    streamJobLog: function(jobLog, id) {
+      // Fetch the rest of the log, and keep polling for new output until the
+      // job is finished or another job's info is shown.
+      var t = this
+      var url = jobLog.getAttribute('data-log-url')
+      var offset = parseInt(jobLog.getAttribute('data-next-offset'))
+      var finished = jobLog.getAttribute('data-finished') == 'true'
+
+      var fetchChunk = function() {
+        if (t.shownJobInfo != id || !document.body.contains(jobLog)) {
+          return
+        }
+        $.ajax({
+          'type': 'GET',
+          'url': url,
+          'data': {'offset': offset},
+          'success': function(data) {
+            jobLog.append(data.chunk)
+            offset = data.next_offset
+            if (offset < data.log_length) {
+              fetchChunk()
+            } else if (!data.finished) {
+              setTimeout(fetchChunk, 5000)
+            }
+          }
+        })
+      }
+
+      if (!finished || offset < parseInt(jobLog.getAttribute('data-log-length'))) {
+        fetchChunk()
+      }
+    },
   })
   window.BibOS = window.BibOS || new BibOS()
   var b = window.BibOS
@@ -366,7 +397,9 @@ var BibOS
 function calcPaginationRange(pag_data, obj_per_page) {
   const first = ((pag_data.page - 1) * obj_per_page ) + 1
   const last = ((pag_data.page - 1) * obj_per_page ) + pag_data.results.length
-  const range = first + "-" + last + " af " + pag_data.count
+  // Large result sets are only counted up to a limit
+  const count = pag_data.count_is_estimate ? pag_data.count + "+" : pag_data.count
+  const range = first + "-" + last + " af " + count
   return range
 }
 
@@ -401,12 +434,15 @@ function getCookie(name) {
 }
 
 /* Currently only used by the job log copy button */
-function addEventListenerForClipBoardButton(log) {
+function addEventListenerForClipBoardButton(logElem) {
   let btn = document.getElementById("clipboard-button")
+  if (!btn) {
+    return
+  }
 
   btn.addEventListener('click', () => {
 
-    navigator.clipboard.writeText(log)
+    navigator.clipboard.writeText(logElem.innerText)
 
     btn.getElementsByClassName("copy-btn-text-orig")[0].classList.add('d-none')
     btn.lastElementChild.classList.remove('d-none')
@@ -3,6 +3,7 @@ $(function(){
         this.elem = $(container_elem)
         this.searchConditions = {}
         this.searchUrl = window.bibos_job_search_url || './search/'
+        this.exportUrl = window.bibos_job_export_url || './export/'
         this.statusSelectors = []
         BibOS.addTemplate('job-entry', template_container_id)
     }
@@ -148,6 +149,12 @@ $(function(){
             })
         },
 
+        // Download the jobs matching the filters, which the server streams
+        exportJobs: function(format) {
+            window.location = this.exportUrl + '?' +
+                $('#jobsearch-filterform').serialize() + '&format=' + format
+        },
+
         reset: function() {
             $('#jobsearch-filterform')[0].reset()
             $('#jobsearch-filterform li.selected').removeClass('selected')
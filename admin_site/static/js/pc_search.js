@@ -0,0 +1,109 @@
+// A list of the computers of a site, loaded a page at a time from the
+// computer search of the site, with a search field narrowing it down.
+//
+// Options:
+//   list: The ul element to fill
+//   input: The search input element [optional]
+//   url: The URL of the computer search
+//   params: Extra search parameters, e.g. {activated: 1} [optional]
+//   renderItem: Function returning the li element of a computer
+//   emptyText: Text shown when no computers match [optional]
+
+(function() {
+
+    const SEARCH_DELAY = 250
+
+    const PCSearch = function(options) {
+        this.list = options.list
+        this.input = options.input
+        this.url = options.url
+        this.params = options.params || {}
+        this.renderItem = options.renderItem
+        this.emptyText = options.emptyText || gettext("There are no computers")
+        this.request = 0
+        this.timer = null
+
+        if (this.input) {
+            const pc_search = this
+            this.input.addEventListener('input', function() {
+                clearTimeout(pc_search.timer)
+                pc_search.timer = setTimeout(function() {
+                    pc_search.search()
+                }, SEARCH_DELAY)
+            })
+            // Don't submit the form the search field may be part of
+            this.input.addEventListener('keydown', function(event) {
+                if (event.key === 'Enter') {
+                    event.preventDefault()
+                }
+            })
+        }
+    }
+
+    PCSearch.prototype.load = function(page) {
+        const pc_search = this
+        // The URL may come with search parameters of its own
+        const url = new URL(this.url, window.location.href)
+        for (let name in this.params) {
+            url.searchParams.set(name, this.params[name])
+        }
+        if (this.input && this.input.value.trim()) {
+            url.searchParams.set('q', this.input.value.trim())
+        }
+        if (page) {
+            url.searchParams.set('page', page)
+        }
+        // Only the answer to the latest request is shown
+        const request = ++this.request
+        return fetch(url, {credentials: 'same-origin'})
+            .then(function(response) {
+                return response.json()
+            })
+            .then(function(data) {
+                if (request === pc_search.request) {
+                    pc_search.render(data, Boolean(page))
+                }
+            })
+    }
+
+    PCSearch.prototype.search = function() {
+        return this.load(null)
+    }
+
+    PCSearch.prototype.render = function(data, append) {
+        const pc_search = this
+        const more = this.list.querySelector('.pc-search-more')
+        if (more) {
+            more.remove()
+        }
+        if (!append) {
+            this.list.innerHTML = ''
+        }
+        for (let pc of data.results) {
+            this.list.appendChild(this.renderItem(pc))
+        }
+        if (!append && data.results.length === 0) {
+            const item = document.createElement('li')
+            item.innerText = this.emptyText
+            this.list.appendChild(item)
+        }
+        if (data.has_next) {
+            const item = document.createElement('li')
+            item.className = 'pc-search-more'
+            const button = document.createElement('button')
+            button.type = 'button'
+            button.className = 'btn btn-link item-list-link'
+            button.innerText = gettext("Show more")
+            button.addEventListener('click', function(event) {
+                // Keep dropdowns containing the list open
+                event.stopPropagation()
+                pc_search.load(data.next_page_number)
+            })
+            item.appendChild(button)
+            this.list.appendChild(item)
+        }
+    }
+
+    window.BibOS.PCSearch = PCSearch
+
+})()
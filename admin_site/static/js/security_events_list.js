@@ -3,6 +3,7 @@ $(function(){
         this.elem = $(container_elem)
         this.searchUrl = window.security_event_search_url
         this.updateUrl = window.security_events_update_url
+        this.exportUrl = window.security_event_export_url
         this.statusSelectors = []
         BibOS.addTemplate('securityevent-entry', template_container_id)
     }
@@ -181,6 +182,11 @@ $(function(){
                 }
             })
         },
+        // Download the events matching the filters, which the server streams
+        exportEvents: function(format) {
+            window.location = this.exportUrl + '?' +
+                $('#securityeventsearch-filterform').serialize() + '&format=' + format
+        },
         reset: function() {
             $('#securityeventsearch-filterform')[0].reset()
             $('#securityeventsearch-filterform li.selected').removeClass('selected')
@@ -0,0 +1,144 @@
+"""Who may access which site, resolved once per request.
+
+Site pages used to look up the site of the URL in the access check, in the
+view and in each mixin, and to load every site of the user to check the
+membership. The SiteAccess of a request holds the site and the membership
+of the user on it, and the memberships of each user are cached until they
+change.
+
+The REST API is accessed with API keys, each of which belongs to a site.
+The site of each key is cached as well, under a hash of the key.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import cached_property
+
+from account.models import SiteMembership
+from system.models import APIKey, Site
+
+# The cached memberships of a user are cleared when one of them changes,
+# the timeout only bounds how long an unused entry is kept
+SITE_MEMBERSHIPS_CACHE_TIMEOUT = 60 * 60
+
+
+def _site_memberships_key(user_id):
+    return f"site_memberships_{user_id}"
+
+
+def get_site_memberships(user):
+    """Return the memberships of user as a dict of site id to
+    (membership id, user profile id, site user type).
+
+    The memberships are kept on the user object for the rest of the request,
+    as Django does with the permissions of a user, and cached between
+    requests."""
+    if not hasattr(user, "_site_memberships"):
+        key = _site_memberships_key(user.id)
+        memberships = cache.get(key)
+        if memberships is None:
+            memberships = {
+                site_id: (membership_id, user_profile_id, site_user_type)
+                for (
+                    membership_id,
+                    site_id,
+                    user_profile_id,
+                    site_user_type,
+                ) in SiteMembership.objects.filter(user_profile__user=user).values_list(
+                    "id", "site_id", "user_profile_id", "site_user_type"
+                )
+            }
+            cache.set(key, memberships, SITE_MEMBERSHIPS_CACHE_TIMEOUT)
+        user._site_memberships = memberships
+    return user._site_memberships
+
+
+def invalidate_site_memberships(user_id):
+    cache.delete(_site_memberships_key(user_id))
+
+
+class SiteAccess:
+    """The site of a request and the membership of the user on it."""
+
+    def __init__(self, user, site):
+        self.user = user
+        self.site = site
+
+    @cached_property
+    def membership(self):
+        """The SiteMembership of the user on the site or None. It is built
+        from the cached memberships rather than fetched."""
+        if not self.user.is_authenticated:
+            return None
+        membership = get_site_memberships(self.user).get(self.site.id)
+        if membership is None:
+            return None
+        membership_id, user_profile_id, site_user_type = membership
+        return SiteMembership(
+            id=membership_id,
+            site=self.site,
+            user_profile_id=user_profile_id,
+            site_user_type=site_user_type,
+        )
+
+    @property
+    def site_user_type(self):
+        return self.membership.site_user_type if self.membership else None
+
+    @property
+    def is_allowed(self):
+        """Whether the user may access the site at all."""
+        return self.user.is_superuser or self.membership is not None
+
+
+def get_site_access(request, site_uid):
+    """Return the SiteAccess of request for the site with site_uid, looking
+    up the site the first time."""
+    access = getattr(request, "site_access", None)
+    if access is None or access.site.uid != site_uid:
+        site = get_object_or_404(Site, uid=site_uid)
+        access = SiteAccess(request.user, site)
+        request.site_access = access
+    return access
+
+
+# Saving or deleting a key clears its cached site, so an entry only expires
+# to free the cache of keys no longer in use
+API_KEY_CACHE_TIMEOUT = 60 * 60
+
+
+def _api_key_cache_key(key):
+    # The key itself is a secret, so don't use it in the cache key
+    return "api_key_" + hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get_api_key_site(key):
+    """Return the site of the API key key, or None if there is no such key.
+    Unknown keys are cached too, so they don't cost a query each time."""
+    cache_key = _api_key_cache_key(key)
+    cached = cache.get(cache_key)
+    if cached is None:
+        api_key = APIKey.objects.select_related("site").filter(key=key).first()
+        cached = (api_key.key, api_key.site) if api_key else ("", None)
+        cache.set(cache_key, cached, API_KEY_CACHE_TIMEOUT)
+    stored_key, site = cached
+    if site is None or not constant_time_compare(stored_key, key):
+        return None
+    return site
+
+
+def invalidate_api_key(key):
+    cache.delete(_api_key_cache_key(key))
+
+
+def get_site_from_request(request):
+    """Obtains the site based on the API Key, as found by the authentication,
+    or else from the request headers"""
+    site = getattr(request, "auth_site", None)
+    if site is None:
+        key = request.headers["Authorization"].split(" ")[-1]
+        site = get_api_key_site(key)
+    return site
@@ -1,7 +1,7 @@
 from hashlib import md5
 
 from django.contrib import admin
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.utils.html import format_html_join, escape, mark_safe
 from django.utils.translation import gettext_lazy as _
@@ -21,7 +21,9 @@ from system.models import (
     ImageVersion,
     Input,
     Job,
+    JobLog,
     LoginLog,
+    LoginLogRollup,
     EventRuleServer,
     Product,
     PC,
@@ -85,6 +87,12 @@ class ConfigurationAdmin(admin.ModelAdmin):
         PCInlineForConfiguration,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The inventory fields of the PCs are copies of some of the entries
+        form.instance.refresh_from_db(fields=["data"])
+        form.instance.update_pc_inventory()
+
 
 class PCInline(admin.TabularInline):
     model = PC.pc_groups.through
@@ -261,27 +269,26 @@ class CustomerAdmin(admin.ModelAdmin):
         FeaturePermissionInlineForCustomerAdmin,
     )
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            computers_count=Count("sites__pcs"),
+            borgerpc_computers_count=Count(
+                "sites__pcs", filter=Q(sites__pcs__os2_product="os2borgerpc")
+            ),
+            kioskpc_computers_count=Count(
+                "sites__pcs", filter=Q(sites__pcs__os2_product="os2borgerpc kiosk")
+            ),
+        )
+
     def number_of_computers(self, obj):
-        computers_count = PC.objects.filter(site__customer=obj).count()
-        return computers_count
+        return obj.computers_count
 
     def number_of_borgerpc_computers(self, obj):
-        borgerpc_computers_count = (
-            PC.objects.filter(site__in=obj.sites.all())
-            .filter(configuration__entries__value="os2borgerpc")
-            .count()
-        )
-
-        return borgerpc_computers_count
+        return obj.borgerpc_computers_count
 
     def number_of_kioskpc_computers(self, obj):
-        kioskpc_computers_count = (
-            PC.objects.filter(site__in=obj.sites.all())
-            .filter(configuration__entries__value="os2borgerpc kiosk")
-            .count()
-        )
-
-        return kioskpc_computers_count
+        return obj.kioskpc_computers_count
 
     def feature_permissions(self, obj):
         return list(obj.feature_permission.all())
@@ -290,6 +297,9 @@ class CustomerAdmin(admin.ModelAdmin):
     feature_permissions.short_description = _("Feature permissions")
     number_of_kioskpc_computers.short_description = _("Number of KioskPC computers")
     number_of_borgerpc_computers.short_description = _("Number of BorgerPC computers")
+    number_of_computers.admin_order_field = "computers_count"
+    number_of_kioskpc_computers.admin_order_field = "kioskpc_computers_count"
+    number_of_borgerpc_computers.admin_order_field = "borgerpc_computers_count"
 
 
 class SiteAdmin(admin.ModelAdmin):
@@ -306,28 +316,31 @@ class SiteAdmin(admin.ModelAdmin):
     inlines = (PCInlineForSiteAdmin,)
     readonly_fields = ("created",)
 
-    def number_of_borgerpc_computers(self, obj):
-        borgerpc_computers_count = (
-            PC.objects.filter(site=obj)
-            .filter(configuration__entries__value="os2borgerpc")
-            .count()
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            computers_count=Count("pcs"),
+            borgerpc_computers_count=Count(
+                "pcs", filter=Q(pcs__os2_product="os2borgerpc")
+            ),
+            kioskpc_computers_count=Count(
+                "pcs", filter=Q(pcs__os2_product="os2borgerpc kiosk")
+            ),
         )
 
-        return borgerpc_computers_count
+    def number_of_borgerpc_computers(self, obj):
+        return obj.borgerpc_computers_count
 
     def number_of_kioskpc_computers(self, obj):
-        kioskpc_computers_count = (
-            PC.objects.filter(site=obj)
-            .filter(configuration__entries__value="os2borgerpc kiosk")
-            .count()
-        )
-
-        return kioskpc_computers_count
+        return obj.kioskpc_computers_count
 
     def number_of_computers(self, obj):
-        return obj.pcs.count()
+        return obj.computers_count
 
     number_of_computers.short_description = _("Number of computers")
+    number_of_computers.admin_order_field = "computers_count"
+    number_of_kioskpc_computers.admin_order_field = "kioskpc_computers_count"
+    number_of_borgerpc_computers.admin_order_field = "borgerpc_computers_count"
 
 
 class LoginLogAdmin(admin.ModelAdmin):
@@ -342,6 +355,31 @@ class LoginLogAdmin(admin.ModelAdmin):
         return qs.filter(site__in=request.user.user_profile.sites.all())
 
 
+class LoginLogRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "site",
+        "period",
+        "start",
+        "sessions",
+        "unique_identifiers",
+        "minutes",
+    )
+    list_filter = ("period", "site")
+    date_hierarchy = "start"
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request).select_related("site")
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(site__in=request.user.user_profile.sites.all())
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 class FeaturePermissionAdmin(admin.ModelAdmin):
     def customers_with_access(self, obj):
         return list(obj.customers.all())
@@ -379,10 +417,11 @@ class PCAdmin(admin.ModelAdmin):
         return mark_safe(f'<a href="{link}">{escape(obj.site.__str__())}</a>')
 
     def os2borgerpc_client_version(self, obj):
-        return obj.configuration.get("_os2borgerpc.client_version")
+        return obj.client_version
 
     site_link.short_description = _("Site")
     site_link.admin_order_field = "site"
+    os2borgerpc_client_version.admin_order_field = "client_version"
 
     def get_search_results(self, request, queryset, search_term):
         queryset, may_have_duplicates = super().get_search_results(
@@ -397,6 +436,13 @@ class PCAdmin(admin.ModelAdmin):
         return queryset, may_have_duplicates
 
 
+class JobLogInline(admin.StackedInline):
+    model = JobLog
+    fields = ("output",)
+    readonly_fields = ("output",)
+    can_delete = False
+
+
 class JobAdmin(admin.ModelAdmin):
     list_display = (
         "__str__",
@@ -409,7 +455,16 @@ class JobAdmin(admin.ModelAdmin):
     )
     list_filter = ("status",)
     search_fields = ("batch__script__name", "user__username", "pc__name")
-    readonly_fields = ("created", "started", "finished", "batch", "pc")
+    readonly_fields = (
+        "created",
+        "started",
+        "finished",
+        "batch",
+        "pc",
+        "has_log",
+        "log_length",
+    )
+    inlines = [JobLogInline]
 
 
 class CountryAdmin(admin.ModelAdmin):
@@ -619,6 +674,7 @@ ar(FeaturePermission, FeaturePermissionAdmin)
 ar(ImageVersion, ImageVersionAdmin)
 ar(Job, JobAdmin)
 ar(LoginLog, LoginLogAdmin)
+ar(LoginLogRollup, LoginLogRollupAdmin)
 ar(PC, PCAdmin)
 ar(PCGroup, PCGroupAdmin)
 ar(Product, ProductAdmin)
@@ -1,27 +1,46 @@
-from datetime import date, datetime, timedelta
-from typing import List
-from django.db.models import Q
+from datetime import date, timedelta
+from itertools import groupby
+from typing import List, Optional
+from django.db.models import Avg, Q, Sum
 
-from ninja import Router
+from ninja import File, Query, Router
+from ninja.files import UploadedFile
 from ninja.pagination import paginate
 from ninja.errors import ValidationError
 
 
+from .access import get_site_from_request
+from .api_pagination import CursorPagination
+from .exports import (
+    CONTENT_TYPES,
+    JOB_COLUMNS,
+    LOGIN_LOG_COLUMNS,
+    NDJSON,
+    SECURITY_EVENT_COLUMNS,
+    export_filename,
+    export_response,
+)
 from .models import (
-    APIKey,
     Configuration,
     ConfigurationEntry,
     Job,
+    LoginLog,
+    LoginLogRollup,
     PC,
+    PCDailyLogins,
     SecurityEvent,
 )
 from .api_schemas import (
     ConfigurationEntrySchema,
     JobSchema,
+    LoginStatisticsSchema,
     PCSchema,
     PCLoginsSchema,
+    PreregistrationSchema,
     SecurityEventSchema,
+    SiteLoginsSchema,
 )
+from .registration import preregister_computers, read_preregistration_csv
 
 router = Router()
 
@@ -39,15 +58,6 @@ router = Router()
 # the endpoint is called in /api/docs (e.g. "list_users" becomes "List Users")
 
 
-def get_site_from_request(request):
-    """Obtains the site based on the API Key, from the request headers"""
-    key = request.headers["Authorization"].split(" ")[-1]
-    valid_key_check = APIKey.objects.filter(key=key).first()
-
-    if valid_key_check:
-        return valid_key_check.site
-
-
 def validate_sensible_dates(from_date, to_date):
     if from_date > to_date:
         raise ValidationError("from_date is after to_date")
@@ -55,24 +65,9 @@ def validate_sensible_dates(from_date, to_date):
         raise ValidationError("to_date is in the future")
 
 
-def filter_logins(all_logins, from_date, to_date):
-    # Turn the string into a python list of tuples with any spaces removed
-    # In other words it'll look like this:
-    # [('2023-10-10', '4'), ('2023-10-11', '4'), ('2023-10-12', '3'), ('2023-10-16', '0')]
-    all_logins_parsed = [
-        tuple(x.replace(" ", "").split(":")) for x in all_logins.split(",")
-    ]
-
-    # Further turn the above into the format [(date, string)]
-    all_logins_parsed = [
-        (datetime.strptime(login[0], "%Y-%m-%d").date(), login[1])
-        for login in all_logins_parsed
-    ]
-    return ", ".join(
-        f"{date}: {logins}"
-        for date, logins in all_logins_parsed
-        if from_date <= date <= to_date
-    )
+def validate_export_format(export_format):
+    if export_format not in CONTENT_TYPES:
+        raise ValidationError("format must be either csv or ndjson")
 
 
 # Computers
@@ -80,13 +75,34 @@ def filter_logins(all_logins, from_date, to_date):
     "/computers",
     response=List[PCSchema],
     url_name="computers",
-    description="Fetch list of all Computers.",
+    description="Fetch list of all Computers, by increasing ID. Pass since to fetch the Computers changed or deleted since then instead. Changes are only listed once every database transaction that was open when they were made has ended, so a long transaction delays them.",
 )
+@paginate(CursorPagination)
 def list_pcs(request):
     site = get_site_from_request(request)
-    pcs = PC.objects.filter(site=site)
+    pcs = PC.objects.filter(site=site).prefetch_related("pc_groups").order_by("id")
 
-    return pcs or []
+    return pcs
+
+
+@router.post(
+    "/computers/preregister",
+    response=PreregistrationSchema,
+    url_name="preregister_computers",
+)
+def preregister_pcs(request, file: UploadedFile = File(...)):
+    """
+    Pre-registers computers from a CSV file with the columns **mac**, **name** and, optionally, **site**.
+    The computers are created on the site of the API key, and completed when they register.
+    Computers which exist already are left alone, and their MAC addresses returned as **existing**.
+    If any line of the file is invalid, no computers are created.
+    """
+    site = get_site_from_request(request)
+    computers, errors = read_preregistration_csv(file, site)
+    if errors:
+        raise ValidationError(errors)
+    created, existing = preregister_computers(site, computers)
+    return {"created": len(created), "existing": existing}
 
 
 # Events
@@ -96,12 +112,14 @@ def list_pcs(request):
     response=List[SecurityEventSchema],
     url_name="events",
 )
-@paginate
+@paginate(CursorPagination, pass_parameter="paging")
 def list_events(
     request,
     from_date: date = date.today() - timedelta(days=90),
     to_date: date = date.today(),
     status=SecurityEvent.NEW,
+    oldest_first: bool = False,
+    **kwargs,
 ):
     """
     Fetches events (Security Events and Offline Events).
@@ -109,21 +127,36 @@ def list_events(
      - **status**: New
        - Other options available, which you can pass along in the request to get different results:
        - Status: New, Assigned, Resolved
+
+    The events are returned newest first, or oldest first with **oldest_first**.
+    Pass the **next_cursor** of a page as **cursor** to get the next page. With
+    **oldest_first**, the last page also has a **next_cursor**, which gives the
+    events added since.
+
+    Pass **since** rather than **cursor** to fetch the events changed since, along
+    with the ids of the events **deleted** since, regardless of date and status.
+    Pass the **next_since** of a page as **since** to get the next page, until a
+    page has no changes. Keep the last **next_since** to fetch the changes since
+    later on. Deleted events are kept track of for 90 days. Changes are only
+    listed once every database transaction that was open when they were made
+    has ended, so a long transaction delays them.
     """
-    validate_sensible_dates(from_date, to_date)
     site = get_site_from_request(request)
-    # Do we filter on do occurred_time, reported_time or created? Or multiple of them? Maybe occurred?
     events = SecurityEvent.objects.filter(
-        (Q(problem__site=site) | Q(event_rule_server__site=site)),
-        occurred_time__range=[
-            from_date,
-            to_date + timedelta(days=1),
-        ],  # +1 to include the full to_date
-        status=status.upper(),
-    ).order_by(
-        "-id"
-    )  # or -occurred_time, but ID is probably faster
-    return events
+        Q(problem__site=site) | Q(event_rule_server__site=site)
+    ).select_related("problem", "event_rule_server", "pc")
+    if not kwargs["paging"].since:
+        validate_sensible_dates(from_date, to_date)
+        # Do we filter on do occurred_time, reported_time or created? Or multiple of them? Maybe occurred?
+        events = events.filter(
+            occurred_time__range=[
+                from_date,
+                to_date + timedelta(days=1),
+            ],  # +1 to include the full to_date
+            status=status.upper(),
+        )
+    # or occurred_time, but ID is probably faster
+    return events.order_by("id" if oldest_first else "-id")
 
 
 # Configurations
@@ -145,7 +178,21 @@ def get_pc_configuration(request, configuration_id):
         return 204, None
 
 
-# Logins per day for all PCs (part of the Configuration)
+def format_logins(daily_logins):
+    """Format (date, count) pairs as "2023-10-10: 4, 2023-10-11: 3", the format
+    the clients report logins per day in."""
+    return ", ".join(f"{day}: {count}" for day, count in daily_logins)
+
+
+def filter_daily_logins(daily_logins, from_date, to_date):
+    # both set or either set: filter, neither set: don't filter
+    if from_date != date(1970, 1, 1) or to_date != date.today():
+        validate_sensible_dates(from_date, to_date)
+        daily_logins = daily_logins.filter(date__range=[from_date, to_date])
+    return daily_logins
+
+
+# Logins per day for all PCs (reported by the PCs as part of the Configuration)
 # logins per day: send them in this format?: [('2023-01-02', 7), ('2023-01-01', 3)]  ...ie. a list of tuples with the
 # name and the number of logins, from the latest to the earliest?
 # if we don't have the number for a given day, set it to -1, None or something?
@@ -161,17 +208,22 @@ def get_pcs_logins_per_day(
     to_date: date = date.today(),
 ):
     site = get_site_from_request(request)
-    pcs = PC.objects.filter(site=site, is_activated=True)
-    pc_names_with_logins = []
-    for pc in pcs:
-        logins = pc.get_config_value("login_counts")
-        # both set or either set: filter, neither set: don't filter
-        if from_date != date(1970, 1, 1) or to_date != date.today():
-            validate_sensible_dates(from_date, to_date)
-            if logins:
-                logins = filter_logins(logins, from_date, to_date)
-        if logins:
-            pc_names_with_logins.append({"pc_name": pc.name, "logins_per_day": logins})
+    daily_logins = filter_daily_logins(
+        PCDailyLogins.objects.filter(pc__site=site, pc__is_activated=True),
+        from_date,
+        to_date,
+    )
+    daily_logins = daily_logins.order_by("pc__name", "pc_id", "date").values_list(
+        "pc_id", "pc__name", "date", "count"
+    )
+
+    pc_names_with_logins = [
+        {
+            "pc_name": pc_name,
+            "logins_per_day": format_logins((day, count) for _, _, day, count in rows),
+        }
+        for (_, pc_name), rows in groupby(daily_logins, key=lambda row: row[:2])
+    ]
 
     if pc_names_with_logins:
         return 200, pc_names_with_logins
@@ -179,6 +231,36 @@ def get_pcs_logins_per_day(
         return 204, None
 
 
+# Logins per day summed and averaged over all PCs on the site
+@router.get(
+    "/computers/logins-per-day/summary",
+    response={200: List[SiteLoginsSchema], 204: None},
+    url_name="computers-logins-per-day-summary",
+    description="Fetch the total and average number of logins per day across all computers.",
+)
+def get_site_logins_per_day(
+    request,
+    from_date: date = date(1970, 1, 1),
+    to_date: date = date.today(),
+):
+    site = get_site_from_request(request)
+    daily_logins = filter_daily_logins(
+        PCDailyLogins.objects.filter(pc__site=site, pc__is_activated=True),
+        from_date,
+        to_date,
+    )
+    summary = (
+        daily_logins.values("date")
+        .annotate(total_logins=Sum("count"), average_logins=Avg("count"))
+        .order_by("date")
+    )
+
+    if summary:
+        return 200, summary
+    else:
+        return 204, None
+
+
 # Logins per day for a single PC
 @router.get(
     "/computers/{int:pc_id}/logins-per-day",
@@ -193,20 +275,14 @@ def get_pc_logins_per_day(
     to_date: date = date.today(),
 ):
     site = get_site_from_request(request)
-    try:
-        pc = PC.objects.get(site=site, id=pc_id)
-        logins = pc.get_config_value("login_counts")
-    except PC.DoesNotExist:
-        pc = None
-    if pc and logins:
-        # both set or either set: filter, neither set: don't filter
-        if from_date != date(1970, 1, 1) or to_date != date.today():
-            validate_sensible_dates(from_date, to_date)
-            logins = filter_logins(logins, from_date, to_date)
+    pc = PC.objects.filter(site=site, id=pc_id).first()
+    if pc:
+        daily_logins = filter_daily_logins(pc.daily_logins.all(), from_date, to_date)
+        logins = format_logins(
+            daily_logins.order_by("date").values_list("date", "count")
+        )
 
         return 200, {"pc_name": pc.name, "logins_per_day": logins}
-    elif pc:
-        return 200, {"pc_name": pc.name, "logins_per_day": ""}
     else:
         return 204, None
         # OR:
@@ -218,27 +294,143 @@ def get_pc_logins_per_day(
     "/jobs",
     response=List[JobSchema],
     url_name="jobs",
-    description="Fetch a list of all Jobs.",
+    description="Fetch a list of all Jobs, newest first, or oldest first with oldest_first. Pass the next_cursor of a page as cursor to get the next page. Pass since to fetch the Jobs changed or deleted since then, regardless of date, instead. Changes are only listed once every database transaction that was open when they were made has ended, so a long transaction delays them.",
 )
-@paginate
+@paginate(CursorPagination, pass_parameter="paging")
 def get_jobs(
     request,
     from_date: date = date.today() - timedelta(days=90),
     to_date: date = date.today(),
+    oldest_first: bool = False,
+    **kwargs,
+):
+    site = get_site_from_request(request)
+    jobs = Job.objects.filter(batch__site=site).select_related("pc")
+    if not kwargs["paging"].since:
+        validate_sensible_dates(from_date, to_date)
+        jobs = jobs.filter(
+            created__range=[
+                from_date,
+                to_date + timedelta(days=1),
+            ],  # +1 to include the full to_date
+        )
+    # or created, but ID is probably faster
+    return jobs.order_by("id" if oldest_first else "-id")
+
+
+# Citizen login statistics, from the hourly or daily rollups of the login logs
+@router.get(
+    "/login-statistics",
+    response={200: List[LoginStatisticsSchema], 204: None},
+    url_name="login-statistics",
+    description="Fetch the number of citizen sessions, unique citizens and minutes of use per day or hour.",
+)
+def get_login_statistics(
+    request,
+    period: str = LoginLogRollup.DAY,
+    from_date: date = date.today() - timedelta(days=90),
+    to_date: date = date.today(),
 ):
     validate_sensible_dates(from_date, to_date)
+    if period not in [LoginLogRollup.HOUR, LoginLogRollup.DAY]:
+        raise ValidationError("period must be either hour or day")
     site = get_site_from_request(request)
-    jobs = Job.objects.filter(
-        batch__site=site,
-        created__range=[
-            from_date,
-            to_date + timedelta(days=1),
-        ],  # +1 to include the full to_date
-    ).order_by(
-        "-id"
-    )  # or -created, but ID is probably faster
-
-    return jobs or []
+    rollups = LoginLogRollup.objects.filter(
+        site=site,
+        period=period,
+        start__gte=from_date,
+        start__lt=to_date + timedelta(days=1),  # +1 to include the full to_date
+    ).order_by("start")
+
+    if rollups:
+        return 200, rollups
+    else:
+        return 204, None
+
+
+# Exports, streamed row by row however many rows there are
+@router.get("/jobs/export", url_name="jobs-export")
+def export_jobs(
+    request,
+    export_format: str = Query(NDJSON, alias="format"),
+    from_date: date = date.today() - timedelta(days=90),
+    to_date: date = date.today(),
+    status: List[str] = Query(None),
+    pc: Optional[int] = None,
+    batch: Optional[int] = None,
+    group: Optional[int] = None,
+):
+    """
+    Exports the jobs created from **from_date** to **to_date**, oldest first, as newline delimited JSON or, with **format** csv, as CSV.
+    The jobs may be filtered like on the job list, by **status**, which may be given more than once, and by the ID of a **pc**, **batch** or **group**.
+    """
+    validate_export_format(export_format)
+    validate_sensible_dates(from_date, to_date)
+    site = get_site_from_request(request)
+    jobs = Job.objects.search(
+        site, statuses=status, pc=pc, batch=batch, group=group
+    ).filter(
+        created__range=[from_date, to_date + timedelta(days=1)],
+    )
+    return export_response(
+        jobs.order_by("pk"),
+        JOB_COLUMNS,
+        export_format,
+        export_filename("jobs", site),
+    )
+
+
+@router.get("/events/export", url_name="events-export")
+def export_events(
+    request,
+    export_format: str = Query(NDJSON, alias="format"),
+    from_date: date = date.today() - timedelta(days=90),
+    to_date: date = date.today(),
+    status: List[str] = Query(None),
+    level: List[str] = Query(None),
+):
+    """
+    Exports the events which occurred from **from_date** to **to_date**, oldest first, as newline delimited JSON or, with **format** csv, as CSV.
+    The events may be filtered like on the event list, by **status** and **level**, each of which may be given more than once.
+    """
+    validate_export_format(export_format)
+    validate_sensible_dates(from_date, to_date)
+    site = get_site_from_request(request)
+    events = SecurityEvent.objects.search(
+        site, levels=level, statuses=[s.upper() for s in status or []]
+    ).filter(
+        occurred_time__range=[from_date, to_date + timedelta(days=1)],
+    )
+    return export_response(
+        events.order_by("pk"),
+        SECURITY_EVENT_COLUMNS,
+        export_format,
+        export_filename("events", site),
+    )
+
+
+@router.get("/login-logs/export", url_name="login-logs-export")
+def export_login_logs(
+    request,
+    export_format: str = Query(NDJSON, alias="format"),
+    from_date: date = date.today() - timedelta(days=90),
+    to_date: date = date.today(),
+):
+    """
+    Exports the citizen logins from **from_date** to **to_date**, oldest first, as newline delimited JSON or, with **format** csv, as CSV.
+    """
+    validate_export_format(export_format)
+    validate_sensible_dates(from_date, to_date)
+    site = get_site_from_request(request)
+    login_logs = LoginLog.objects.filter(
+        site=site, date__range=[from_date, to_date]
+    ).order_by("date", "login_time", "pk")
+    return export_response(
+        login_logs,
+        LOGIN_LOG_COLUMNS,
+        export_format,
+        export_filename("login_log", site),
+    )
 
 
 # Individual endpoints moved down here for now, as they may not be needed:
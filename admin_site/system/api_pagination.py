@@ -0,0 +1,222 @@
+"""Cursor pagination of the REST API.
+
+Lists are paged by id rather than by offset, so a page costs the same however
+far into a list it is, and rows being added or removed don't make a client
+skip or repeat rows. Each page comes with the cursor of the page after it.
+
+In lists ordered by increasing id the cursor of the last page is returned as
+well, and points past the newest row, so a client harvesting a list can keep
+its cursor and ask again later for the rows added since.
+
+A list can also be followed as a change feed. Given a since token, rather
+than a cursor, a page has the rows changed after the token, ordered by the
+time they were changed, the ids of the rows deleted after it, and the token
+of the page after it. A client harvesting a list can thus fetch the changes
+since it last asked rather than the whole list. The changes are kept track
+of by database triggers, see migration 0100.
+
+The time a row was changed is taken when it is written, not when the change
+is committed, so a change may be committed after a later one has been passed
+on. Changes are therefore only passed on from before the start of the oldest
+transaction still open in the database, when all of them have been committed.
+A long transaction holds the feed back until it ends, for up to an hour.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+from django.db import connection
+from django.db.models import Q
+
+from ninja import Field, Schema
+from ninja.errors import ValidationError
+from ninja.pagination import PaginationBase
+
+from system.access import get_site_from_request
+from system.models import Tombstone
+from system.pagination import NEXT, decode_cursor, encode_cursor, keyset_filter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+CHANGES_ORDERING = ["updated_at", "id"]
+
+# How far the change feeds may be held back by a long transaction
+MAX_CHANGE_LAG = timedelta(hours=1)
+
+
+def change_horizon():
+    """Return the start of the oldest transaction open in the database, or
+    the current time if there is none. Any row changed before then has been
+    committed, as a row changed by a transaction is marked with a time after
+    the transaction started.
+
+    Only the transactions of client connections count, not those of
+    background processes such as autovacuum, nor the transaction of this
+    request, which has no changes for the feed to wait for. A transaction
+    open for longer than MAX_CHANGE_LAG holds the feed back no further, so
+    the changes it makes may be missed; it is logged, as it is most likely
+    a stuck connection.
+
+    The transactions of other database users are only seen by superusers and
+    members of pg_read_all_stats, so the database should be written to by
+    the admin site's user alone."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT localtimestamp, min(xact_start)::timestamp"
+            " FROM pg_stat_activity"
+            " WHERE datname = current_database()"
+            " AND backend_type = 'client backend'"
+            " AND state <> 'idle'"
+            " AND pid <> pg_backend_pid()"
+        )
+        now, oldest_start = cursor.fetchone()
+    if oldest_start is None:
+        return now
+    if oldest_start < now - MAX_CHANGE_LAG:
+        logger.warning(
+            "A database transaction has been open since %s, changes made in "
+            "it may be left out of the change feeds",
+            oldest_start,
+        )
+        return now - MAX_CHANGE_LAG
+    return oldest_start
+
+
+def decode_since(since):
+    """Return the keys (changed at, id, deleted at, tombstone id) after which
+    the changes of a since token follow, or None if since is neither a token
+    nor a date and time."""
+    data = decode_cursor(since)
+    if data is not None:
+        keys = data.get("k")
+        if data.get("o") != CHANGES_ORDERING or not isinstance(keys, list):
+            return None
+        try:
+            changed_at, last_id, deleted_at, last_tombstone_id = keys
+            if not isinstance(last_id, int) or not isinstance(last_tombstone_id, int):
+                return None
+            return (
+                datetime.fromisoformat(changed_at),
+                last_id,
+                datetime.fromisoformat(deleted_at),
+                last_tombstone_id,
+            )
+        except (TypeError, ValueError):
+            return None
+    try:
+        start = datetime.fromisoformat(since)
+    except ValueError:
+        return None
+    if start.tzinfo is not None:
+        start = start.astimezone().replace(tzinfo=None)
+    return (start, 0, start, 0)
+
+
+class CursorPagination(PaginationBase):
+    class Input(Schema):
+        cursor: Optional[str] = Field(
+            None, description="The next_cursor of the previous page"
+        )
+        since: Optional[str] = Field(
+            None,
+            description="The next_since of the previous page, or the date and "
+            "time to fetch the changes since",
+        )
+        limit: int = Field(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)
+
+    class Output(Schema):
+        items: List[Any]
+        next_cursor: Optional[str] = None
+        deleted: Optional[List[int]] = None
+        next_since: Optional[str] = None
+
+    @staticmethod
+    def _ordering(queryset):
+        ordering = [str(field) for field in queryset.query.order_by]
+        if ordering not in (["id"], ["-id"]):
+            raise ValueError("Cursor pagination needs a queryset ordered by id")
+        return ordering
+
+    def paginate_queryset(self, queryset, pagination, request, **params):
+        if pagination.since:
+            if pagination.cursor:
+                raise ValidationError(
+                    [{"since": "since can't be combined with cursor"}]
+                )
+            return self.paginate_changes(queryset, pagination, request)
+
+        ordering = self._ordering(queryset)
+        descending = ordering == ["-id"]
+
+        last_id = None
+        if pagination.cursor:
+            data = decode_cursor(pagination.cursor)
+            keys = data.get("k") if data else None
+            if (
+                data is None
+                or data["o"] != ordering
+                or not isinstance(keys, list)
+                or len(keys) != 1
+                or not isinstance(keys[0], int)
+            ):
+                raise ValidationError([{"cursor": "Invalid cursor"}])
+            last_id = keys[0]
+            queryset = queryset.filter(keyset_filter([("pk", descending)], keys))
+
+        items = list(queryset[: pagination.limit + 1])
+        more = len(items) > pagination.limit
+        items = items[: pagination.limit]
+        if items:
+            last_id = items[-1].id
+
+        next_cursor = None
+        if last_id is not None and (more or not descending):
+            next_cursor = encode_cursor(ordering, NEXT, [last_id], 0)
+        return {"items": items, "next_cursor": next_cursor}
+
+    def paginate_changes(self, queryset, pagination, request):
+        keys = decode_since(pagination.since)
+        if keys is None:
+            raise ValidationError([{"since": "Invalid since"}])
+        changed_at, last_id, deleted_at, last_tombstone_id = keys
+        before = change_horizon()
+
+        # The lower bounds let the indexes on the times be used
+        items = list(
+            queryset.filter(
+                Q(updated_at__gt=changed_at) | Q(updated_at=changed_at, pk__gt=last_id),
+                updated_at__gte=changed_at,
+                updated_at__lt=before,
+            ).order_by(*CHANGES_ORDERING)[: pagination.limit]
+        )
+        tombstones = list(
+            Tombstone.objects.filter(
+                Q(deleted_at__gt=deleted_at)
+                | Q(deleted_at=deleted_at, pk__gt=last_tombstone_id),
+                site=get_site_from_request(request),
+                model=queryset.model._meta.model_name,
+                deleted_at__gte=deleted_at,
+                deleted_at__lt=before,
+            )
+            .order_by("deleted_at", "id")
+            .values_list("deleted_at", "id", "object_id")[: pagination.limit]
+        )
+        if items:
+            changed_at, last_id = items[-1].updated_at, items[-1].id
+        if tombstones:
+            deleted_at, last_tombstone_id = tombstones[-1][:2]
+
+        return {
+            "items": items,
+            "deleted": [object_id for _deleted_at, _id, object_id in tombstones],
+            "next_since": encode_cursor(
+                CHANGES_ORDERING,
+                NEXT,
+                [changed_at, last_id, deleted_at, last_tombstone_id],
+                0,
+            ),
+        }
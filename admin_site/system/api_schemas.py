@@ -1,4 +1,7 @@
-from .models import ConfigurationEntry, Job, PC, SecurityEvent
+from datetime import date
+from typing import List
+
+from .models import ConfigurationEntry, Job, LoginLogRollup, PC, SecurityEvent
 from ninja import ModelSchema, Schema
 from ninja.orm import create_schema
 
@@ -14,12 +17,6 @@ from ninja.orm import create_schema
 
 
 class PCSchema(ModelSchema):
-    ip_addresses: str
-
-    @staticmethod
-    def resolve_ip_addresses(obj):
-        return obj.get_config_value("_ip_addresses") or ""
-
     class Config:
         model = PC
         model_fields = [
@@ -32,6 +29,8 @@ class PCSchema(ModelSchema):
             "created",
             "pc_groups",
             "configuration",
+            "ip_addresses",
+            "updated_at",
         ]
 
 
@@ -69,6 +68,7 @@ class SecurityEventSchema(ModelSchema):
             "status",
             "assigned_user",
             "note",
+            "updated_at",
         ]
 
 
@@ -87,9 +87,34 @@ class JobSchema(ModelSchema):
 
     class Config:
         model = Job
-        model_fields = ["id", "status", "created", "started", "finished", "pc"]
+        model_fields = [
+            "id",
+            "status",
+            "created",
+            "started",
+            "finished",
+            "pc",
+            "updated_at",
+        ]
+
+
+class PreregistrationSchema(Schema):
+    created: int
+    existing: List[str]
 
 
 class PCLoginsSchema(Schema):
     pc_name: str
     logins_per_day: str
+
+
+class SiteLoginsSchema(Schema):
+    date: date
+    total_logins: int
+    average_logins: float
+
+
+class LoginStatisticsSchema(ModelSchema):
+    class Config:
+        model = LoginLogRollup
+        model_fields = ["start", "sessions", "unique_identifiers", "minutes"]
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SystemConfig(AppConfig):
+    name = "system"
+
+    def ready(self):
+        # Connect the signal handlers
+        import system.signals  # noqa: F401
@@ -341,6 +341,12 @@ class PCForm(forms.ModelForm):
             "site",
             "created",
             "last_seen",
+            "is_preregistered",
+            # Kept up to date from the configuration, see PC.update_inventory
+            "os2_product",
+            "os_release",
+            "client_version",
+            "ip_addresses",
         )
 
 
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ninja.testing import TestClient
+
+from os2borgerpc_admin.api import api
+from system.models import APIKey, Site
+
+ENDPOINTS = ["computers", "events", "jobs"]
+
+
+class Command(BaseCommand):
+    help = "Measure the queries and time used to fetch pages of the REST API lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("site", help="UID of the site to fetch the lists of")
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            choices=ENDPOINTS,
+            help="Endpoint to fetch. May be given more than once. Defaults to all.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Rows per page. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=3,
+            help="Number of pages to follow the cursors through. Defaults to 3.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of times to fetch the pages. Defaults to 5.",
+        )
+
+    def fetch_pages(self, client, endpoint, limit, pages):
+        """Fetch up to pages pages of endpoint, and return the number of rows
+        and the queries used for each page."""
+        results = []
+        cursor = None
+        for _i in range(pages):
+            path = f"/system/{endpoint}?limit={limit}"
+            if cursor:
+                path += f"&cursor={cursor}"
+            with CaptureQueriesContext(connection) as queries:
+                data = client.get(path).json()
+            results.append((len(data["items"]), len(queries)))
+            cursor = data["next_cursor"]
+            if not data["items"] or not cursor:
+                break
+        return results
+
+    def handle(self, *args, **options):
+        """Fetch the first pages of the REST API lists of a site with an API
+        key of the site, and report the number of rows and queries per page
+        and the best time for all of them."""
+
+        site = Site.objects.filter(uid=options["site"]).first()
+        if not site:
+            raise CommandError(f"No site with the UID {options['site']}")
+        api_key = APIKey.objects.filter(site=site).first()
+        if not api_key:
+            raise CommandError("The benchmark needs an API key for the site")
+
+        client = TestClient(api, headers={"Authorization": f"Bearer {api_key.key}"})
+        for endpoint in options["endpoints"] or ENDPOINTS:
+            timings = []
+            for _i in range(options["repeat"]):
+                start = time.perf_counter()
+                results = self.fetch_pages(
+                    client, endpoint, options["limit"], options["pages"]
+                )
+                timings.append(time.perf_counter() - start)
+            pages = ", ".join(
+                f"{rows} rows/{queries} queries" for rows, queries in results
+            )
+            self.stdout.write(
+                f"/{endpoint}: {pages}, {min(timings) * 1000:.1f} ms "
+                f"for {len(results)} pages"
+            )
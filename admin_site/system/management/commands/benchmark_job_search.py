@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from system.models import Site
+from system.views import JobSearch
+
+
+class Command(BaseCommand):
+    help = "Measure the queries and time used to render pages of the jobs list"
+
+    def add_arguments(self, parser):
+        parser.add_argument("site", help="UID of the site to list the jobs of")
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            action="append",
+            dest="page_sizes",
+            help="Jobs per page. May be given more than once. Defaults to 20 and 500.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of times to render each page. Defaults to 5.",
+        )
+
+    def handle(self, *args, **options):
+        """Render the first page of the jobs list of a site as a superuser and
+        report the number of jobs, queries and the best time per page size."""
+
+        site = Site.objects.filter(uid=options["site"]).first()
+        if not site:
+            raise CommandError(f"No site with the UID {options['site']}")
+        user = User.objects.filter(is_superuser=True).first()
+        if not user:
+            raise CommandError("The benchmark needs a superuser")
+
+        url = reverse("jobsearch", args=[site.uid])
+        for page_size in options["page_sizes"] or [20, 500]:
+            view = JobSearch.as_view(paginate_by=page_size)
+            timings = []
+            for _i in range(options["repeat"]):
+                request = RequestFactory().get(url)
+                request.user = user
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = view(request, slug=site.uid)
+                    content = b"".join(response.streaming_content)
+                    timings.append(time.perf_counter() - start)
+            rows = content.count(b'"restart_url"')
+            self.stdout.write(
+                f"Page size {page_size}: {rows} jobs, "
+                f"{len(queries)} queries, {min(timings) * 1000:.1f} ms"
+            )
@@ -1,5 +1,12 @@
 from django.core.management.base import BaseCommand
-from system.models import SecurityEvent, Citizen
+from system.models import (
+    SecurityEvent,
+    SecurityEventCounter,
+    Citizen,
+    PCDailyLogins,
+    Tombstone,
+)
+from system.partitioning import drop_partitions_before
 from datetime import datetime, timedelta
 
 
@@ -7,14 +14,25 @@ class Command(BaseCommand):
     help = "Remove old unnecessary database objects"
 
     def handle(self, *args, **options):
-        """Remove security events older than a year and citizens whose last successful login
-        was more than two days ago"""
+        """Remove security events and daily login counts older than a year, citizens
+        whose last successful login was more than two days ago and tombstones older
+        than their retention"""
 
         now = datetime.now()
         a_year_ago = now - timedelta(days=365)
         two_days_ago = now - timedelta(days=2)
 
-        # Delete old security events
+        # Delete security events reported more than a year ago. The table is
+        # partitioned by the time the events occurred, so whole months are
+        # removed by dropping their partitions unless they contain events
+        # reported later, which leaves few rows to delete.
+        drop_partitions_before(SecurityEvent, a_year_ago.date(), "reported_time")
         SecurityEvent.objects.filter(reported_time__lt=a_year_ago).delete()
+        # Dropping partitions bypasses the triggers counting outstanding events
+        SecurityEventCounter.reconcile()
+        # Delete old login counts
+        PCDailyLogins.objects.filter(date__lt=a_year_ago.date()).delete()
         # Delete old citizen objects
         Citizen.objects.filter(last_successful_login__lt=two_days_ago).delete()
+        # Delete the tombstones the change feed of the REST API no longer needs
+        Tombstone.objects.filter(deleted_at__lt=now - Tombstone.RETENTION).delete()
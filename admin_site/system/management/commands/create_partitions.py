@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from system.partitioning import PARTITIONED_MODELS, create_partitions
+
+
+class Command(BaseCommand):
+    help = "Create the monthly partitions of the partitioned tables ahead of time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=3,
+            help="Number of months ahead to create partitions for",
+        )
+
+    def handle(self, *args, **options):
+        """Create the partitions of security events and login logs for the current
+        month and the coming months, if they don't exist yet."""
+
+        for model in PARTITIONED_MODELS:
+            for name in create_partitions(model, options["months"]):
+                self.stdout.write(f"Created partition {name}")
@@ -0,0 +1,107 @@
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from system.models import PC, Configuration, Site
+from system.registration import computer_uid, preregister_computers
+from system.rpc import register_new_computer_v2
+
+
+def random_mac():
+    return ":".join(f"{byte:02x}" for byte in secrets.token_bytes(6))
+
+
+class Command(BaseCommand):
+    help = "Measure the time used to register many computers at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument("site", help="UID of the site to register on")
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=1000,
+            help="Number of computers to register. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=50,
+            help="Number of registrations at a time. Defaults to 50.",
+        )
+        parser.add_argument(
+            "--preregister",
+            action="store_true",
+            help="Pre-register the computers before registering them.",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the computers afterwards rather than deleting them.",
+        )
+
+    def register(self, site, mac):
+        try:
+            register_new_computer_v2(
+                mac,
+                f"loadtest-{mac.replace(':', '')}",
+                site.uid,
+                {"mac": mac, "uid": computer_uid(mac), "os2_product": "os2borgerpc"},
+            )
+            return None
+        except Exception as e:
+            return str(e)
+        finally:
+            # Each thread has a connection of its own
+            connection.close()
+
+    def handle(self, *args, **options):
+        """Register computers with random MAC addresses on a site from many
+        threads at once, and report the time used and the failures. The
+        computers are deleted afterwards unless --keep is given."""
+
+        site = Site.objects.filter(uid=options["site"]).first()
+        if not site:
+            raise CommandError(f"No site with the UID {options['site']}")
+
+        macs = [random_mac() for _i in range(options["count"])]
+        if options["preregister"]:
+            start = time.perf_counter()
+            preregister_computers(
+                site, [(mac, f"loadtest-{mac.replace(':', '')}") for mac in macs]
+            )
+            self.stdout.write(
+                f"Pre-registered {len(macs)} computers in "
+                f"{time.perf_counter() - start:.2f} s"
+            )
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            errors = [
+                error
+                for error in executor.map(lambda mac: self.register(site, mac), macs)
+                if error
+            ]
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Registered {len(macs) - len(errors)} of {len(macs)} computers "
+            f"in {elapsed:.2f} s, {len(macs) / elapsed:.1f} per second"
+        )
+        for error in sorted(set(errors)):
+            self.stdout.write(f"{errors.count(error)} x {error}")
+
+        uids = [computer_uid(mac) for mac in macs]
+        registered = PC.objects.filter(uid__in=uids, is_preregistered=False)
+        if registered.count() != len(macs) - len(errors):
+            self.stderr.write(
+                f"{registered.count()} computers were registered, "
+                f"expected {len(macs) - len(errors)}"
+            )
+
+        if not options["keep"]:
+            pcs = PC.objects.filter(uid__in=uids)
+            configuration_ids = list(pcs.values_list("configuration_id", flat=True))
+            pcs.delete()
+            Configuration.objects.filter(pk__in=configuration_ids).delete()
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from system.models import LoginLog, LoginLogRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly and daily login statistics from the login logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-date",
+            type=date.fromisoformat,
+            help="First date to recompute (YYYY-MM-DD). Defaults to the first login.",
+        )
+        parser.add_argument(
+            "--to-date",
+            type=date.fromisoformat,
+            help="Last date to recompute (YYYY-MM-DD). Defaults to today.",
+        )
+
+    def handle(self, *args, **options):
+        """Rebuild the LoginLogRollups of all sites for the given date range."""
+
+        from_date = options["from_date"]
+        if from_date is None:
+            first_log = LoginLog.objects.order_by("date").first()
+            if not first_log:
+                return
+            from_date = first_log.date
+        to_date = options["to_date"] or date.today()
+
+        LoginLogRollup.rebuild(from_date, to_date)
+        self.stdout.write(f"Rebuilt login statistics from {from_date} to {to_date}")
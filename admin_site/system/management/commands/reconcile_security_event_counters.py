@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from system.models import SecurityEventCounter
+
+
+class Command(BaseCommand):
+    help = "Correct the counters of outstanding security events of the sites"
+
+    def handle(self, *args, **options):
+        """Recount the unresolved security events above NORMAL level of every
+        site and correct the counters shown in the navigation which have
+        drifted, e.g. because partitions of old events were dropped."""
+
+        corrections = SecurityEventCounter.reconcile()
+        for site_id, (counted, correct) in corrections.items():
+            self.stdout.write(
+                f"Corrected the outstanding security events of site {site_id} "
+                f"from {counted} to {correct}"
+            )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from system.models import Configuration
+
+
+class Command(BaseCommand):
+    help = "Check that the data of all configurations matches their entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Rebuild the data of configurations that don't match",
+        )
+
+    def handle(self, *args, **options):
+        """Compare the data document of each configuration with the one built
+        from its entries, optionally rebuilding the ones that differ."""
+
+        mismatches = Configuration.objects.alias(
+            entries_data=Configuration.data_from_entries()
+        ).exclude(data=F("entries_data"))
+
+        count = 0
+        for configuration in mismatches.iterator():
+            count += 1
+            self.stdout.write(f"Configuration {configuration.name} does not match")
+            if options["repair"]:
+                configuration.refresh_data()
+
+        self.stdout.write(f"{count} configurations did not match their entries")
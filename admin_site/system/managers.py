@@ -1,7 +1,57 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Coalesce
+
+
+class PCQuerySet(models.QuerySet):
+    def with_status(self):
+        """Annotate has_failed_jobs, which PC.status uses rather than
+        querying the jobs of each PC."""
+        from system.models import Job
+
+        return self.annotate(
+            has_failed_jobs=Exists(
+                Job.objects.filter(pc=OuterRef("pk"), status=Job.FAILED)
+            )
+        )
+
+
+class JobQuerySet(models.QuerySet):
+    def search(self, site, statuses=None, pc=None, batch=None, group=None, user=None):
+        """Get the jobs of site matching the filters of the job list. Jobs of
+        hidden scripts the customer of the site has no access to are left
+        out for users who aren't superusers."""
+        queryset = self.filter(batch__site=site)
+        if user is not None and not user.is_superuser:
+            queryset = queryset.filter(
+                Q(batch__script__is_hidden=False)
+                | Q(
+                    batch__script__feature_permission__in=site.customer.feature_permission.all()
+                )
+            )
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        if pc:
+            queryset = queryset.filter(pc=pc)
+        if batch:
+            queryset = queryset.filter(batch=batch)
+        if group:
+            queryset = queryset.filter(pc__pc_groups=group)
+        return queryset
 
 
 class SecurityEventQuerySet(models.QuerySet):
+    def search(self, site, levels=None, statuses=None):
+        """Get the events of site matching the filters of the event list."""
+        queryset = self.filter(Q(problem__site=site) | Q(event_rule_server__site=site))
+        if levels:
+            queryset = queryset.filter(
+                Q(problem__level__in=levels) | Q(event_rule_server__level__in=levels)
+            )
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        return queryset
+
     def latest_event(self):
         """Get latest security event for pc."""
         return self.order_by("-reported_time").first()
@@ -20,3 +70,17 @@ class SecurityEventQuerySet(models.QuerySet):
                 .exclude(status=SecurityEvent.RESOLVED)
             )
         )
+
+    def outstanding(self):
+        """Get the unresolved events with a level above NORMAL, annotated
+        with the site and level of their rule."""
+        from system.models import EventLevels, SecurityEvent
+
+        return (
+            self.annotate(
+                rule_site=Coalesce("problem__site", "event_rule_server__site"),
+                rule_level=Coalesce("problem__level", "event_rule_server__level"),
+            )
+            .exclude(rule_level=EventLevels.NORMAL)
+            .exclude(status=SecurityEvent.RESOLVED)
+        )
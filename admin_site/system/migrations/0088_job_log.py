@@ -0,0 +1,77 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def move_job_logs(apps, schema_editor):
+    Job = apps.get_model("system", "Job")
+    JobLog = apps.get_model("system", "JobLog")
+
+    jobs_with_log = Job.objects.exclude(log_output="")
+    jobs_with_log.update(has_log=True, log_length=Length("log_output"))
+
+    batch = []
+    for pk, log_output in jobs_with_log.values_list("pk", "log_output").iterator(
+        chunk_size=1000
+    ):
+        batch.append(JobLog(job_id=pk, output=log_output))
+        if len(batch) >= 1000:
+            JobLog.objects.bulk_create(batch)
+            batch = []
+    JobLog.objects.bulk_create(batch)
+
+
+def restore_job_logs(apps, schema_editor):
+    Job = apps.get_model("system", "Job")
+    JobLog = apps.get_model("system", "JobLog")
+
+    for log in JobLog.objects.iterator(chunk_size=1000):
+        Job.objects.filter(pk=log.job_id).update(log_output=log.output)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0087_alter_script_executable_code"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobLog",
+            fields=[
+                (
+                    "job",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="log",
+                        serialize=False,
+                        to="system.job",
+                    ),
+                ),
+                (
+                    "output",
+                    models.TextField(
+                        blank=True, max_length=128000, verbose_name="log output"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="has_log",
+            field=models.BooleanField(default=False, verbose_name="has log"),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="log_length",
+            field=models.PositiveIntegerField(default=0, verbose_name="log length"),
+        ),
+        migrations.RunPython(move_job_logs, restore_job_logs),
+        migrations.RemoveField(
+            model_name="job",
+            name="log_output",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_log_length(apps, schema_editor, function):
+    Job = apps.get_model("system", "Job")
+    JobLog = apps.get_model("system", "JobLog")
+
+    length = (
+        JobLog.objects.filter(job=models.OuterRef("pk"))
+        .annotate(length=models.Func(models.F("output"), function=function))
+        .values("length")[:1]
+    )
+    Job.objects.filter(has_log=True).update(
+        log_length=Coalesce(models.Subquery(length), models.Value(0))
+    )
+
+
+def count_log_bytes(apps, schema_editor):
+    """Count the length of the job logs in UTF-8 bytes, like the offsets of
+    the log chunks sent by the clients."""
+    count_log_length(apps, schema_editor, "OCTET_LENGTH")
+
+
+def count_log_characters(apps, schema_editor):
+    count_log_length(apps, schema_editor, "CHAR_LENGTH")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0088_job_log"),
+    ]
+
+    operations = [
+        migrations.RunPython(count_log_bytes, count_log_characters),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0089_job_log_length_bytes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pc",
+            name="client_version",
+            field=models.CharField(
+                blank=True, default="", max_length=255, verbose_name="client version"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pc",
+            name="ip_addresses",
+            field=models.CharField(
+                blank=True, default="", max_length=4096, verbose_name="IP addresses"
+            ),
+        ),
+        migrations.AddField(
+            model_name="pc",
+            name="os2_product",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                max_length=255,
+                verbose_name="product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pc",
+            name="os_release",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                max_length=255,
+                verbose_name="OS release",
+            ),
+        ),
+    ]
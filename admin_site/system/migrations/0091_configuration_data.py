@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0090_pc_inventory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="configuration",
+            name="data",
+            field=models.JSONField(blank=True, default=dict, verbose_name="data"),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE system_configuration c SET data = COALESCE(
+                (
+                    SELECT jsonb_object_agg(e.key, e.value ORDER BY e.id)
+                    FROM system_configurationentry e
+                    WHERE e.owner_configuration_id = c.id
+                ),
+                '{}'::jsonb
+            )
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="configuration",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["data"], name="configuration_data_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:07
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+# Only the parser is used, the historical model is used for the rows
+from system.models import PCDailyLogins as CurrentPCDailyLogins
+
+
+def import_login_counts(apps, schema_editor):
+    PC = apps.get_model("system", "PC")
+    PCDailyLogins = apps.get_model("system", "PCDailyLogins")
+
+    pcs = PC.objects.filter(configuration__data__has_key="login_counts")
+    for pc_id, login_counts in pcs.values_list(
+        "id", "configuration__data__login_counts"
+    ).iterator(chunk_size=1000):
+        counts = CurrentPCDailyLogins.parse_login_counts(login_counts or "")
+        PCDailyLogins.objects.bulk_create(
+            [
+                PCDailyLogins(pc_id=pc_id, date=day, count=count)
+                for day, count in counts.items()
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0091_configuration_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PCDailyLogins",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="date")),
+                (
+                    "count",
+                    models.PositiveIntegerField(default=0, verbose_name="logins"),
+                ),
+                (
+                    "pc",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_logins",
+                        to="system.pc",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["pc", "date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("pc", "date"), name="unique_pc_date"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(import_login_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0092_pcdailylogins"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoginLogRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")],
+                        max_length=4,
+                        verbose_name="period",
+                    ),
+                ),
+                ("start", models.DateTimeField(verbose_name="start")),
+                (
+                    "sessions",
+                    models.PositiveIntegerField(default=0, verbose_name="sessions"),
+                ),
+                (
+                    "unique_identifiers",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="unique identifiers"
+                    ),
+                ),
+                (
+                    "minutes",
+                    models.PositiveIntegerField(default=0, verbose_name="minutes"),
+                ),
+            ],
+            options={
+                "ordering": ["site", "period", "start"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="loginlog",
+            index=models.Index(
+                fields=["site", "date", "identifier"],
+                name="loginlog_site_date_identifier",
+            ),
+        ),
+        migrations.AddField(
+            model_name="loginlogrollup",
+            name="site",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="login_log_rollups",
+                to="system.site",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="loginlogrollup",
+            constraint=models.UniqueConstraint(
+                fields=("site", "period", "start"), name="unique_site_period_start"
+            ),
+        ),
+    ]
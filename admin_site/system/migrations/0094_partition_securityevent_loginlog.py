@@ -0,0 +1,174 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:30
+
+from django.db import migrations
+
+# The upper bound of the partition holding the existing rows: the end of
+# the current month, or of the month of the latest row
+BOUNDARY_SQL = """greatest(
+            date_trunc('month', now()) + interval '1 month',
+            date_trunc('month', max({column})) + interval '1 month'
+        )"""
+
+
+def partition_bound_sql(table, column):
+    """Add a CHECK constraint for the bound of the partition the existing rows
+    of table will be attached as, and validate it.
+
+    Adding the constraint as NOT VALID only locks the table briefly, and
+    validating it in a separate transaction lets rows be read and written
+    meanwhile. ATTACH PARTITION then sees that the constraint implies the
+    bound of the partition and skips scanning the rows."""
+    constraint = f"{table}_partition_bound"
+    return [
+        f"""
+        DO $$
+        DECLARE
+            boundary timestamp;
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_partitioned_table
+                WHERE partrelid = '{table}'::regclass
+            ) OR EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = '{table}'::regclass AND conname = '{constraint}'
+            ) THEN
+                RETURN;
+            END IF;
+            SELECT {BOUNDARY_SQL.format(column=column)} INTO boundary FROM {table};
+            EXECUTE format(
+                'ALTER TABLE {table} ADD CONSTRAINT {constraint} '
+                'CHECK ({column} IS NOT NULL AND {column} < %L) NOT VALID',
+                boundary
+            );
+        END $$;
+        """,
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = '{table}'::regclass AND conname = '{constraint}'
+                AND NOT convalidated
+            ) THEN
+                ALTER TABLE {table} VALIDATE CONSTRAINT {constraint};
+            END IF;
+        END $$;
+        """,
+    ]
+
+
+def partition_table_sql(table, column):
+    """Turn table into a table partitioned by month on column.
+
+    Rather than copying the existing rows, the existing table is attached as
+    the partition of everything up to the end of the current month (or of the
+    latest row), so this only takes the time needed to build the new primary
+    key index: the bound of the partition is already checked by the
+    constraint added by partition_bound_sql. Partitions for the following
+    months are created by the create_partitions command, and rows outside of
+    any partition end up in the default partition. A table which is already
+    partitioned is left as it is."""
+    legacy = f"{table}_legacy"
+    sequence = f"{table}_partitioned_id_seq"
+    return f"""
+    DO $$
+    DECLARE
+        boundary timestamp;
+        next_id bigint;
+        index_definitions text[];
+        foreign_keys text[];
+        statement text;
+        r record;
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = '{table}'::regclass
+        ) THEN
+            RETURN;
+        END IF;
+
+        LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;
+
+        -- The bound checked by the constraint, or a later one if the month
+        -- has changed since it was added
+        SELECT {BOUNDARY_SQL.format(column=column)}, coalesce(max(id), 0) + 1
+        INTO boundary, next_id FROM {table};
+
+        -- Remember the indexes and foreign keys to recreate them on the
+        -- partitioned table
+        SELECT coalesce(array_agg(pg_get_indexdef(indexrelid)), '{{}}')
+        INTO index_definitions
+        FROM pg_index WHERE indrelid = '{table}'::regclass AND NOT indisunique;
+        SELECT coalesce(array_agg(format(
+            'ALTER TABLE {table} ADD CONSTRAINT %I %s',
+            conname, pg_get_constraintdef(oid)
+        )), '{{}}')
+        INTO foreign_keys
+        FROM pg_constraint WHERE conrelid = '{table}'::regclass AND contype = 'f';
+
+        -- Move the existing table and its indexes and foreign keys out of
+        -- the way
+        ALTER TABLE {table} RENAME TO {legacy};
+        FOR r IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                 WHERE i.indrelid = '{legacy}'::regclass LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', r.relname, left('legacy_' || r.relname, 63));
+        END LOOP;
+        FOR r IN SELECT conname FROM pg_constraint
+                 WHERE conrelid = '{legacy}'::regclass AND contype = 'f' LOOP
+            EXECUTE format('ALTER TABLE {legacy} RENAME CONSTRAINT %I TO %I', r.conname, left('legacy_' || r.conname, 63));
+        END LOOP;
+
+        CREATE TABLE {table} (LIKE {legacy} INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ({column});
+        ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_partition_bound;
+        CREATE SEQUENCE {sequence};
+        PERFORM setval('{sequence}', next_id, false);
+        ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}');
+        ALTER SEQUENCE {sequence} OWNED BY {table}.id;
+
+        ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS;
+        ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT;
+        EXECUTE format(
+            'ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%L)',
+            boundary
+        );
+        ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {table}_partition_bound;
+        CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+
+        ALTER TABLE {table} ADD PRIMARY KEY (id, {column});
+        FOREACH statement IN ARRAY index_definitions LOOP
+            EXECUTE statement;
+        END LOOP;
+        FOREACH statement IN ARRAY foreign_keys LOOP
+            EXECUTE statement;
+        END LOOP;
+    END $$;
+    """
+
+
+PARTITIONED_TABLES = [
+    ("system_securityevent", "occurred_time"),
+    ("system_loginlog", "date"),
+]
+
+
+class Migration(migrations.Migration):
+    # Each statement runs in its own transaction, so validating the
+    # constraints doesn't keep the tables locked
+    atomic = False
+
+    dependencies = [
+        ("system", "0093_loginlogrollup"),
+    ]
+
+    # Reversing this leaves the tables partitioned: the models are the same
+    # either way, and turning a partitioned table back into a plain one
+    # would mean copying every row. Applying it again skips the tables which
+    # are already partitioned.
+    operations = [
+        migrations.RunSQL(statement, migrations.RunSQL.noop)
+        for table, column in PARTITIONED_TABLES
+        for statement in partition_bound_sql(table, column)
+    ] + [
+        migrations.RunSQL(partition_table_sql(table, column), migrations.RunSQL.noop)
+        for table, column in PARTITIONED_TABLES
+    ]
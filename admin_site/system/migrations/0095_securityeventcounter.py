@@ -0,0 +1,160 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The site an event counts as outstanding for: the site of its rule, if the
+# event isn't resolved and the level of the rule is above NORMAL
+EVENT_SITE_FUNCTION = """
+CREATE FUNCTION system_securityevent_outstanding_site(
+    integer, integer, varchar
+) RETURNS integer LANGUAGE sql STABLE AS $$
+    SELECT site_id FROM system_securityproblem
+    WHERE id = $1 AND level <> 'Normal' AND $3 <> 'RESOLVED'
+    UNION ALL
+    SELECT site_id FROM system_eventruleserver
+    WHERE id = $2 AND level <> 'Normal' AND $3 <> 'RESOLVED'
+    LIMIT 1
+$$;
+"""
+
+ADD_FUNCTION = """
+CREATE FUNCTION system_securityeventcounter_add(
+    site integer, delta integer
+) RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    IF site IS NOT NULL AND delta <> 0 THEN
+        INSERT INTO system_securityeventcounter (site_id, outstanding)
+        VALUES (site, delta)
+        ON CONFLICT (site_id) DO UPDATE SET
+            outstanding = system_securityeventcounter.outstanding
+                + EXCLUDED.outstanding;
+    END IF;
+END $$;
+"""
+
+EVENT_TRIGGER = """
+CREATE FUNCTION system_securityevent_count() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    old_site integer;
+    new_site integer;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        old_site := system_securityevent_outstanding_site(
+            OLD.problem_id, OLD.event_rule_server_id, OLD.status
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        new_site := system_securityevent_outstanding_site(
+            NEW.problem_id, NEW.event_rule_server_id, NEW.status
+        );
+    END IF;
+    IF old_site IS DISTINCT FROM new_site THEN
+        PERFORM system_securityeventcounter_add(old_site, -1);
+        PERFORM system_securityeventcounter_add(new_site, 1);
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_securityevent_count
+AFTER INSERT OR DELETE OR UPDATE OF status, problem_id, event_rule_server_id
+ON system_securityevent
+FOR EACH ROW EXECUTE FUNCTION system_securityevent_count();
+"""
+
+# Moves the outstanding events of a rule when its level or site changes. The
+# argument is the column of the security events referring to the rule.
+RULE_TRIGGER = """
+CREATE FUNCTION system_eventrule_count() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    old_site integer;
+    new_site integer;
+    outstanding integer;
+BEGIN
+    IF OLD.level <> 'Normal' THEN
+        old_site := OLD.site_id;
+    END IF;
+    IF NEW.level <> 'Normal' THEN
+        new_site := NEW.site_id;
+    END IF;
+    IF old_site IS DISTINCT FROM new_site THEN
+        EXECUTE format(
+            'SELECT count(*) FROM system_securityevent'
+            ' WHERE %I = $1 AND status <> %L',
+            TG_ARGV[0],
+            'RESOLVED'
+        ) INTO outstanding USING NEW.id;
+        PERFORM system_securityeventcounter_add(old_site, -outstanding);
+        PERFORM system_securityeventcounter_add(new_site, outstanding);
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_securityproblem_count
+AFTER UPDATE OF level, site_id ON system_securityproblem
+FOR EACH ROW EXECUTE FUNCTION system_eventrule_count('problem_id');
+
+CREATE TRIGGER system_eventruleserver_count
+AFTER UPDATE OF level, site_id ON system_eventruleserver
+FOR EACH ROW EXECUTE FUNCTION system_eventrule_count('event_rule_server_id');
+"""
+
+COUNT_EVENTS = """
+INSERT INTO system_securityeventcounter (site_id, outstanding)
+SELECT site_id, count(*)
+FROM (
+    SELECT system_securityevent_outstanding_site(
+        problem_id, event_rule_server_id, status
+    ) AS site_id
+    FROM system_securityevent
+) events
+WHERE site_id IS NOT NULL
+GROUP BY site_id;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER system_eventruleserver_count ON system_eventruleserver;
+DROP TRIGGER system_securityproblem_count ON system_securityproblem;
+DROP TRIGGER system_securityevent_count ON system_securityevent;
+DROP FUNCTION system_eventrule_count();
+DROP FUNCTION system_securityevent_count();
+DROP FUNCTION system_securityeventcounter_add(integer, integer);
+DROP FUNCTION system_securityevent_outstanding_site(integer, integer, varchar);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0094_partition_securityevent_loginlog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SecurityEventCounter",
+            fields=[
+                (
+                    "site",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="security_event_counter",
+                        serialize=False,
+                        to="system.site",
+                    ),
+                ),
+                (
+                    "outstanding",
+                    models.IntegerField(default=0, verbose_name="outstanding"),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            EVENT_SITE_FUNCTION + ADD_FUNCTION + EVENT_TRIGGER + RULE_TRIGGER,
+            DROP_TRIGGERS,
+        ),
+        migrations.RunSQL(COUNT_EVENTS, migrations.RunSQL.noop),
+    ]
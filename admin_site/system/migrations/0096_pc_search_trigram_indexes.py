@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:25
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0095_securityeventcounter"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="pc",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"), name="gin_trgm_ops"
+                ),
+                name="pc_name_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pc",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("location"),
+                    name="gin_trgm_ops",
+                ),
+                name="pc_location_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pc",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("uid"), name="gin_trgm_ops"
+                ),
+                name="pc_uid_trgm",
+            ),
+        ),
+    ]
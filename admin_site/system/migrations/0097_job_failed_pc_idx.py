@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0096_pc_search_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status", "FAILED")),
+                fields=["pc"],
+                name="job_failed_pc_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0097_job_failed_pc_idx"),
+    ]
+
+    operations = [
+        # Keep the last of any duplicate entries, as the data document of the
+        # configuration has the value of the last one
+        migrations.RunSQL(
+            """
+            DELETE FROM system_configurationentry e
+            USING system_configurationentry later
+            WHERE later.owner_configuration_id = e.owner_configuration_id
+            AND later.key = e.key
+            AND later.id > e.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name="configurationentry",
+            constraint=models.UniqueConstraint(
+                fields=("owner_configuration", "key"), name="unique_configuration_key"
+            ),
+        ),
+    ]
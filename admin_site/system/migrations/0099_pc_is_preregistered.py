@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0098_configurationentry_unique_configuration_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pc",
+            name="is_preregistered",
+            field=models.BooleanField(default=False, verbose_name="pre-registered"),
+        ),
+    ]
@@ -0,0 +1,263 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:45
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+# Sets updated_at when a row is inserted or changed. The clock time is used
+# rather than the start of the transaction, so that a change shows up in the
+# change feed of the REST API shortly after it is committed, even if it was
+# made by a long transaction.
+UPDATED_AT_TRIGGER = """
+CREATE FUNCTION system_set_updated_at() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- Saving an object without changing it doesn't count as a change
+        IF NEW IS NOT DISTINCT FROM OLD THEN
+            RETURN NEW;
+        END IF;
+    END IF;
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END $$;
+
+CREATE TRIGGER system_pc_updated_at
+BEFORE INSERT OR UPDATE ON system_pc
+FOR EACH ROW EXECUTE FUNCTION system_set_updated_at();
+
+CREATE TRIGGER system_job_updated_at
+BEFORE INSERT OR UPDATE ON system_job
+FOR EACH ROW EXECUTE FUNCTION system_set_updated_at();
+
+CREATE TRIGGER system_securityevent_updated_at
+BEFORE INSERT OR UPDATE ON system_securityevent
+FOR EACH ROW EXECUTE FUNCTION system_set_updated_at();
+
+CREATE TRIGGER system_configurationentry_updated_at
+BEFORE INSERT OR UPDATE ON system_configurationentry
+FOR EACH ROW EXECUTE FUNCTION system_set_updated_at();
+"""
+
+# The configuration entries of a PC are fetched from the PC, so a change to
+# them marks the PC as changed. Once per statement, as the entries of a
+# configuration are written in bulk.
+CONFIGURATION_TRIGGER = """
+CREATE FUNCTION system_configurationentry_touch_pc() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE system_pc SET updated_at = clock_timestamp()
+    WHERE configuration_id IN (
+        SELECT owner_configuration_id FROM changed_entries
+    );
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_configurationentry_insert_touch_pc
+AFTER INSERT ON system_configurationentry
+REFERENCING NEW TABLE AS changed_entries
+FOR EACH STATEMENT EXECUTE FUNCTION system_configurationentry_touch_pc();
+
+CREATE TRIGGER system_configurationentry_update_touch_pc
+AFTER UPDATE ON system_configurationentry
+REFERENCING NEW TABLE AS changed_entries
+FOR EACH STATEMENT EXECUTE FUNCTION system_configurationentry_touch_pc();
+
+CREATE TRIGGER system_configurationentry_delete_touch_pc
+AFTER DELETE ON system_configurationentry
+REFERENCING OLD TABLE AS changed_entries
+FOR EACH STATEMENT EXECUTE FUNCTION system_configurationentry_touch_pc();
+"""
+
+# Writes a tombstone for each deleted row, on the site the row belonged to.
+# Once per statement, as old events and jobs are deleted in bulk.
+TOMBSTONE_TRIGGERS = """
+CREATE FUNCTION system_pc_tombstones() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO system_tombstone (model, object_id, site_id, deleted_at)
+    SELECT 'pc', id, site_id, clock_timestamp() FROM deleted_rows;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_pc_tombstones
+AFTER DELETE ON system_pc
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT EXECUTE FUNCTION system_pc_tombstones();
+
+-- A PC moved to another site is gone from the site it was on
+CREATE FUNCTION system_pc_moved() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO system_tombstone (model, object_id, site_id, deleted_at)
+    VALUES ('pc', OLD.id, OLD.site_id, clock_timestamp());
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_pc_moved
+AFTER UPDATE OF site_id ON system_pc
+FOR EACH ROW WHEN (OLD.site_id IS DISTINCT FROM NEW.site_id)
+EXECUTE FUNCTION system_pc_moved();
+
+CREATE FUNCTION system_job_tombstones() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO system_tombstone (model, object_id, site_id, deleted_at)
+    SELECT 'job', deleted_rows.id, system_batch.site_id, clock_timestamp()
+    FROM deleted_rows
+    JOIN system_batch ON system_batch.id = deleted_rows.batch_id;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_job_tombstones
+AFTER DELETE ON system_job
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT EXECUTE FUNCTION system_job_tombstones();
+
+CREATE FUNCTION system_securityevent_tombstones() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO system_tombstone (model, object_id, site_id, deleted_at)
+    SELECT 'securityevent', id, site_id, clock_timestamp()
+    FROM (
+        SELECT deleted_rows.id, COALESCE(
+            system_securityproblem.site_id, system_eventruleserver.site_id
+        ) AS site_id
+        FROM deleted_rows
+        LEFT JOIN system_securityproblem
+            ON system_securityproblem.id = deleted_rows.problem_id
+        LEFT JOIN system_eventruleserver
+            ON system_eventruleserver.id = deleted_rows.event_rule_server_id
+    ) deleted_events
+    WHERE site_id IS NOT NULL;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER system_securityevent_tombstones
+AFTER DELETE ON system_securityevent
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT EXECUTE FUNCTION system_securityevent_tombstones();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER system_securityevent_tombstones ON system_securityevent;
+DROP TRIGGER system_job_tombstones ON system_job;
+DROP TRIGGER system_pc_moved ON system_pc;
+DROP TRIGGER system_pc_tombstones ON system_pc;
+DROP TRIGGER system_configurationentry_delete_touch_pc ON system_configurationentry;
+DROP TRIGGER system_configurationentry_update_touch_pc ON system_configurationentry;
+DROP TRIGGER system_configurationentry_insert_touch_pc ON system_configurationentry;
+DROP TRIGGER system_configurationentry_updated_at ON system_configurationentry;
+DROP TRIGGER system_securityevent_updated_at ON system_securityevent;
+DROP TRIGGER system_job_updated_at ON system_job;
+DROP TRIGGER system_pc_updated_at ON system_pc;
+DROP FUNCTION system_securityevent_tombstones();
+DROP FUNCTION system_job_tombstones();
+DROP FUNCTION system_pc_moved();
+DROP FUNCTION system_pc_tombstones();
+DROP FUNCTION system_configurationentry_touch_pc();
+DROP FUNCTION system_set_updated_at();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0099_pc_is_preregistered"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="configurationentry",
+            name="updated_at",
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(),
+                db_index=True,
+                editable=False,
+                verbose_name="updated",
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="updated_at",
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(),
+                db_index=True,
+                editable=False,
+                verbose_name="updated",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pc",
+            name="updated_at",
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(),
+                db_index=True,
+                editable=False,
+                verbose_name="updated",
+            ),
+        ),
+        migrations.AddField(
+            model_name="securityevent",
+            name="updated_at",
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(),
+                db_index=True,
+                editable=False,
+                verbose_name="updated",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("pc", "PC"),
+                            ("job", "Job"),
+                            ("securityevent", "SecurityEvent"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.IntegerField()),
+                (
+                    "deleted_at",
+                    models.DateTimeField(
+                        db_default=django.db.models.functions.datetime.Now()
+                    ),
+                ),
+                (
+                    "site",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="system.site",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["site", "model", "deleted_at", "id"],
+                        name="tombstone_feed_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(
+            UPDATED_AT_TRIGGER + CONFIGURATION_TRIGGER + TOMBSTONE_TRIGGERS,
+            DROP_TRIGGERS,
+        ),
+    ]
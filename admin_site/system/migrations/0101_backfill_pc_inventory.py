@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:10
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Left
+
+# The configuration keys copied into the inventory fields of PC, as in
+# PC.INVENTORY_KEYS when the fields were added in 0090
+INVENTORY_KEYS = {
+    "os2_product": "os2_product",
+    "_os_release": "os_release",
+    "_os2borgerpc.client_version": "client_version",
+    "_ip_addresses": "ip_addresses",
+}
+
+
+def backfill_pc_inventory(apps, schema_editor):
+    """Copy the inventory configuration entries of each PC into the fields
+    added in 0090, with an UPDATE per field. Later changes to the entries
+    are copied by PC.update_inventory."""
+    PC = apps.get_model("system", "PC")
+    ConfigurationEntry = apps.get_model("system", "ConfigurationEntry")
+
+    for key, field in INVENTORY_KEYS.items():
+        value = ConfigurationEntry.objects.filter(
+            owner_configuration=models.OuterRef("configuration"), key=key
+        ).values("value")[:1]
+        max_length = PC._meta.get_field(field).max_length
+        PC.objects.update(
+            **{
+                field: Coalesce(
+                    Left(models.Subquery(value), max_length), models.Value("")
+                )
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0100_updated_at_tombstone"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pc_inventory, migrations.RunPython.noop),
+    ]
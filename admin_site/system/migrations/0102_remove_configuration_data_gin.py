@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("system", "0101_backfill_pc_inventory"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="configuration",
+            name="configuration_data_gin",
+        ),
+    ]
@@ -1,10 +1,16 @@
+import codecs
 import datetime
+import logging
 import random
 import re
 import string
 
-from django.db import models, transaction
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.postgres.aggregates.mixins import OrderableAggMixin
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import connection, models, transaction
+from django.db.models import Aggregate, F, Func, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Now, Upper
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.contrib.auth.models import User
@@ -12,7 +18,9 @@ from django.urls import reverse
 from django.core.validators import MinValueValidator, RegexValidator
 
 from system.mixins import AuditModelMixin
-from system.managers import SecurityEventQuerySet
+from system.managers import JobQuerySet, PCQuerySet, SecurityEventQuerySet
+
+logger = logging.getLogger(__name__)
 
 """The following variables define states of objects like jobs or PCs. It is
 used for labeling in the GUI."""
@@ -57,6 +65,33 @@ class EventLevels:
     }
 
 
+class JSONBObjectAgg(OrderableAggMixin, Aggregate):
+    function = "JSONB_OBJECT_AGG"
+    template = "%(function)s(%(distinct)s%(expressions)s %(ordering)s)"
+    output_field = models.JSONField()
+
+
+class JSONBBuildObject(Func):
+    function = "JSONB_BUILD_OBJECT"
+    output_field = models.JSONField()
+
+
+class JSONBConcat(Func):
+    """The first JSONB object with the keys of the second set."""
+
+    arg_joiner = " || "
+    template = "(%(expressions)s)"
+    output_field = models.JSONField()
+
+
+class JSONBRemoveKey(Func):
+    """The JSONB object without the key."""
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = models.JSONField()
+
+
 class Configuration(models.Model):
     """This class contains/represents the configuration of a Site,
     a PC Group or a PC."""
@@ -64,14 +99,76 @@ class Configuration(models.Model):
     # Doesn't need any actual fields, it seems. Should not exist independently
     # of the classes to which it may be aggregated.
     name = models.CharField(max_length=255, unique=True)
+    # All the entries of the configuration as a single document, kept up to
+    # date from the ConfigurationEntry rows by refresh_data, or one key at a
+    # time as single entries are saved. Reading this is what makes looking up
+    # keys cheap. It isn't indexed: PCs are looked up by their inventory
+    # fields, see PC.INVENTORY_KEYS, and an index would slow down every
+    # configuration pushed by a PC.
+    data = models.JSONField(verbose_name=_("data"), default=dict, blank=True)
+
+    @staticmethod
+    def data_from_entries():
+        """Expression building the data document of a configuration from its
+        entries, for use in Configuration queries."""
+        return Coalesce(
+            Subquery(
+                ConfigurationEntry.objects.filter(owner_configuration=OuterRef("pk"))
+                .values("owner_configuration")
+                .annotate(data=JSONBObjectAgg("key", "value", ordering="id"))
+                .values("data")
+            ),
+            Value({}, output_field=models.JSONField()),
+        )
 
-    def update_from_request(self, req_params, submit_name):
-        seen_set = set()
+    def refresh_data(self):
+        """Rebuild the data document from the entries of this configuration.
+
+        The configuration is locked first. The rebuilding UPDATE then reads
+        the entries as committed by any concurrent writer it waited for,
+        where on its own it would read them as they were when it started."""
+        with transaction.atomic(savepoint=False):
+            locked = list(
+                Configuration.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values_list("pk", flat=True)
+            )
+            if locked:
+                Configuration.objects.filter(pk=self.pk).update(
+                    data=Configuration.data_from_entries()
+                )
+                self.refresh_from_db(fields=["data"])
+
+    def set_data_entry(self, key, value, old_key=None):
+        """Set key to value in the data document, and remove old_key if the
+        entry was renamed, without rebuilding the rest of the document."""
+        value = str(value)
+        data = F("data")
+        if old_key is not None and old_key != key:
+            data = JSONBRemoveKey(data, Cast(Value(old_key), models.TextField()))
+            self.data.pop(old_key, None)
+        Configuration.objects.filter(pk=self.pk).update(
+            data=JSONBConcat(
+                data,
+                JSONBBuildObject(
+                    Cast(Value(key), models.TextField()),
+                    Cast(Value(value), models.TextField()),
+                ),
+            )
+        )
+        self.data[key] = value
 
-        existing_set = set(cnf.pk for cnf in self.entries.all())
+    def remove_data_entry(self, key):
+        """Remove key from the data document."""
+        Configuration.objects.filter(pk=self.pk).update(
+            data=JSONBRemoveKey(F("data"), Cast(Value(key), models.TextField()))
+        )
+        self.data.pop(key, None)
 
-        unique_names = set(req_params.getlist(submit_name, []))
-        for pk in unique_names:
+    def update_from_request(self, req_params, submit_name):
+        """Replace the entries with those submitted as submit_name."""
+        values = {}
+        for pk in dict.fromkeys(req_params.getlist(submit_name, [])):
             key_param = "%s_%s_key" % (submit_name, pk)
             value_param = "%s_%s_value" % (submit_name, pk)
 
@@ -79,22 +176,85 @@ class Configuration(models.Model):
             value = req_params.getlist(value_param, "")
 
             if pk.startswith("new_"):
-                # Create one or more new entries
-                for k, v in zip(key, value):
-                    cnf = ConfigurationEntry(key=k, value=v, owner_configuration=self)
-                    cnf.save()
+                # One or more new entries
+                values.update(zip(key, value))
             else:
-                # Update submitted entry
-                cnf = ConfigurationEntry.objects.get(pk=pk)
-                cnf.key = key[0]
-                cnf.value = value[0]
-                seen_set.add(cnf.pk)
-                cnf.save()
-
-        # Delete entries that were not in the submitted data
-        for pk in existing_set - seen_set:
-            cnf = ConfigurationEntry.objects.get(pk=pk)
-            cnf.delete()
+                values[key[0]] = value[0]
+
+        # Entries that were not in the submitted data are deleted
+        self.write_entries(values, replace=True)
+        self.update_pc_inventory()
+
+    def update_pc_inventory(self):
+        """Update the inventory fields of the PCs of this configuration, which
+        are copies of some of its entries."""
+        for pc in self.pc_set.all():
+            pc.configuration = self
+            pc.update_inventory()
+
+    def write_entries(self, values, remove=(), replace=False):
+        """Set the entries with the keys and values of the dict values, and
+        delete the entries with the keys in remove, or all other entries if
+        replace is set.
+
+        The entries are compared with the current ones, and the changes
+        written with at most a delete, an update and an insert. If there are
+        any, the configuration is locked and the entries compared again, so
+        concurrent writers don't work from the same stale entries."""
+        value_field = ConfigurationEntry._meta.get_field("value")
+        values = {key: value_field.to_python(value) for key, value in values.items()}
+        if not any(self._entry_changes(values, remove, replace)):
+            return
+
+        with transaction.atomic():
+            list(
+                Configuration.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values_list("pk", flat=True)
+            )
+            removed, changed, added = self._entry_changes(values, remove, replace)
+            if removed:
+                # Deleted with SQL: delete() would load the entries and send
+                # post_delete, updating data once for each; it is rebuilt
+                # once below
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "DELETE FROM {} WHERE id = ANY(%s)".format(
+                            connection.ops.quote_name(ConfigurationEntry._meta.db_table)
+                        ),
+                        [removed],
+                    )
+            ConfigurationEntry.objects.bulk_update(changed, ["value"])
+            # An entry saved on its own doesn't lock the configuration, so the
+            # key may have been added meanwhile
+            ConfigurationEntry.objects.bulk_create(
+                added,
+                update_conflicts=True,
+                unique_fields=["owner_configuration", "key"],
+                update_fields=["value"],
+            )
+            # Bulk operations don't send the signals which keep data updated
+            self.refresh_data()
+
+    def _entry_changes(self, values, remove, replace):
+        """Compare values with the current entries, returning the ids of the
+        entries to delete, the entries to update and the entries to add."""
+        current = {entry.key: entry for entry in self.entries.only("key", "value")}
+        if replace:
+            remove = current.keys() - values.keys()
+        removed = [current[key].pk for key in remove if key in current]
+        changed = []
+        for key, value in values.items():
+            entry = current.get(key)
+            if entry is not None and entry.value != value:
+                entry.value = value
+                changed.append(entry)
+        added = [
+            ConfigurationEntry(owner_configuration=self, key=key, value=value)
+            for key, value in values.items()
+            if key not in current
+        ]
+        return removed, changed, added
 
     def remove_entry(self, key):
         return self.entries.filter(key=key).delete()
@@ -110,19 +270,40 @@ class Configuration(models.Model):
 
     def get(self, key, default=None):
         """Return value of the entry corresponding to key if it exists, None
-        otherwise."""
-        result = None
-        try:
-            e = self.entries.get(key=key)
-            result = e.value
-        except ConfigurationEntry.DoesNotExist:
+        otherwise.
+
+        The value is read from data as it was loaded with the configuration,
+        so changes saved elsewhere since then aren't seen; refresh_from_db
+        reloads it."""
+        result = self.data.get(key)
+
+        if settings.CONFIGURATION_VERIFY_READS:
+            self.verify_read(key, result)
+
+        if result is None:
             if default is not None:
                 result = default
             else:
-                raise
+                raise ConfigurationEntry.DoesNotExist(
+                    f"Configuration {self.name} has no entry {key}"
+                )
 
         return result
 
+    def verify_read(self, key, value):
+        """Log if the value read from the data document differs from the one
+        stored in the entries."""
+        entry_value = self.entries.filter(key=key).values_list("value", flat=True)
+        entry_value = entry_value.first()
+        if entry_value != value:
+            logger.warning(
+                "Configuration %s: %s is %r in data but %r in entries",
+                self.name,
+                key,
+                value,
+                entry_value,
+            )
+
     def __str__(self):
         return self.name
 
@@ -139,9 +320,28 @@ class ConfigurationEntry(models.Model):
         verbose_name=_("owner configuration"),
         on_delete=models.CASCADE,
     )
+    # Set by a database trigger whenever the row changes, see migration 0100,
+    # which also marks the PC of the configuration as changed
+    updated_at = models.DateTimeField(
+        verbose_name=_("updated"), db_default=Now(), db_index=True, editable=False
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        entry = super().from_db(db, field_names, values)
+        # The key as stored, so that renaming the entry can remove it from
+        # the data document of the configuration
+        entry._loaded_key = entry.__dict__.get("key")
+        return entry
 
     class Meta:
         ordering = ["key"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner_configuration", "key"],
+                name="unique_configuration_key",
+            ),
+        ]
 
 
 class Country(models.Model):
@@ -336,8 +536,154 @@ class LoginLog(models.Model):
     def __str__(self):
         return f"{self.identifier}: {self.date}"
 
+    @property
+    def minutes(self):
+        """The length of the session in whole minutes. A logout time before the
+        login time means the session lasted past midnight."""
+        login = datetime.datetime.combine(self.date, self.login_time)
+        logout = datetime.datetime.combine(self.date, self.logout_time)
+        if logout < login:
+            logout += datetime.timedelta(days=1)
+        return int((logout - login).total_seconds() // 60)
+
     class Meta:
         ordering = ["date", "identifier", "login_time"]
+        indexes = [
+            models.Index(
+                fields=["site", "date", "identifier"],
+                name="loginlog_site_date_identifier",
+            )
+        ]
+
+
+class LoginLogRollup(models.Model):
+    """Aggregated statistics of the LoginLogs of a site for an hour or a day.
+
+    The rollups are kept up to date as citizens log in and out, see
+    record_login and record_logout, and can be recomputed with rebuild."""
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = ((HOUR, _("Hour")), (DAY, _("Day")))
+
+    site = models.ForeignKey(
+        Site, related_name="login_log_rollups", on_delete=models.CASCADE
+    )
+    period = models.CharField(
+        verbose_name=_("period"), max_length=4, choices=PERIOD_CHOICES
+    )
+    start = models.DateTimeField(verbose_name=_("start"))
+    sessions = models.PositiveIntegerField(verbose_name=_("sessions"), default=0)
+    unique_identifiers = models.PositiveIntegerField(
+        verbose_name=_("unique identifiers"), default=0
+    )
+    minutes = models.PositiveIntegerField(verbose_name=_("minutes"), default=0)
+
+    def __str__(self):
+        return f"{self.site}: {self.period} {self.start}"
+
+    @staticmethod
+    def periods_of(login_log):
+        """Return the (period, start, LoginLog filter) of the hour and the day
+        the given LoginLog belongs to."""
+        day_start = datetime.datetime.combine(login_log.date, datetime.time())
+        hour = login_log.login_time.hour
+        return [
+            (
+                LoginLogRollup.HOUR,
+                day_start + datetime.timedelta(hours=hour),
+                Q(date=login_log.date, login_time__hour=hour),
+            ),
+            (LoginLogRollup.DAY, day_start, Q(date=login_log.date)),
+        ]
+
+    @classmethod
+    def record_login(cls, login_log):
+        """Count a new LoginLog in the rollups of its hour and day.
+
+        Each rollup is inserted if it is missing and locked before looking
+        for earlier LoginLogs of the identifier, so concurrent logins are
+        counted one at a time and an identifier logging in twice at once is
+        only counted once."""
+        with transaction.atomic():
+            for period, start, log_filter in cls.periods_of(login_log):
+                rollup = cls(site_id=login_log.site_id, period=period, start=start)
+                cls.objects.bulk_create([rollup], ignore_conflicts=True)
+                rollup = (
+                    cls.objects.select_for_update()
+                    .only("pk")
+                    .get(site_id=login_log.site_id, period=period, start=start)
+                )
+                seen_before = (
+                    LoginLog.objects.filter(
+                        log_filter,
+                        site_id=login_log.site_id,
+                        identifier=login_log.identifier,
+                    )
+                    .exclude(pk=login_log.pk)
+                    .exists()
+                )
+                cls.objects.filter(pk=rollup.pk).update(
+                    sessions=F("sessions") + 1,
+                    unique_identifiers=F("unique_identifiers")
+                    + (0 if seen_before else 1),
+                    minutes=F("minutes") + login_log.minutes,
+                )
+
+    @classmethod
+    def record_logout(cls, login_log, previous_minutes):
+        """Update the rollups when the logout time of a LoginLog has changed,
+        given the length of the session before the change."""
+        difference = login_log.minutes - previous_minutes
+        if not difference:
+            return
+        for period, start, log_filter in cls.periods_of(login_log):
+            cls.objects.filter(
+                site_id=login_log.site_id, period=period, start=start
+            ).update(minutes=F("minutes") + difference)
+
+    @classmethod
+    def rebuild(cls, from_date, to_date):
+        """Recompute the rollups of all sites from the LoginLogs between
+        from_date and to_date, both included, one day at a time."""
+        day = from_date
+        while day <= to_date:
+            with transaction.atomic():
+                start = datetime.datetime.combine(day, datetime.time())
+                cls.objects.filter(
+                    start__gte=start, start__lt=start + datetime.timedelta(days=1)
+                ).delete()
+
+                rollups = {}
+                identifiers = {}
+                for login_log in LoginLog.objects.filter(date=day).only(
+                    "site_id", "identifier", "date", "login_time", "logout_time"
+                ):
+                    for period, period_start, _filter in cls.periods_of(login_log):
+                        key = (login_log.site_id, period, period_start)
+                        if key not in rollups:
+                            rollups[key] = cls(
+                                site_id=login_log.site_id,
+                                period=period,
+                                start=period_start,
+                            )
+                            identifiers[key] = set()
+                        rollups[key].sessions += 1
+                        rollups[key].minutes += login_log.minutes
+                        identifiers[key].add(login_log.identifier)
+
+                for key, rollup in rollups.items():
+                    rollup.unique_identifiers = len(identifiers[key])
+                cls.objects.bulk_create(rollups.values())
+            day += datetime.timedelta(days=1)
+
+    class Meta:
+        ordering = ["site", "period", "start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["site", "period", "start"], name="unique_site_period_start"
+            )
+        ]
 
 
 class FeaturePermission(models.Model):
@@ -617,79 +963,110 @@ class PCGroup(models.Model):
             asc.position = count
             asc.save()
 
+    @transaction.atomic
     def update_policy_from_request(self, request, submit_name):
+        """Update the policy scripts of the group and their parameters from
+        the scripts and parameters submitted with request.
+
+        The changes are worked out before anything is written, so that a
+        missing mandatory parameter leaves the policy as it was, and then
+        written with a statement for each kind of change. Return the set of
+        policy scripts whose parameters were changed."""
         req_params = request.POST
         req_files = request.FILES
 
-        existing_set = set(asc.pk for asc in self.policy.all())
-        old_params = set()
-        updated_policy_scripts = set()
-
-        for pk in existing_set:
-            asc = AssociatedScript.objects.get(pk=pk)
-            old_params.update(asc.parameters.all())
-            asc.delete()
-
-        for i, pk in enumerate(req_params.getlist(submit_name, [])):
-            script_param = "%s_%s" % (submit_name, pk)
-
-            script_pk = int(req_params.get(script_param, None))
-            script = Script.objects.get(pk=script_pk)
-            asc = AssociatedScript(group=self, script=script, position=i)
-            if not pk.startswith("new_"):
-                asc.pk = pk
-            asc.save()
+        existing = {asc.pk: asc for asc in self.policy.all()}
+        submitted = [
+            (pk, int(req_params.get("%s_%s" % (submit_name, pk), None)))
+            for pk in req_params.getlist(submit_name, [])
+        ]
+        scripts = Script.objects.in_bulk([script_pk for _pk, script_pk in submitted])
+        inputs = {}
+        for inp in Input.objects.filter(script__in=list(scripts)).order_by("position"):
+            inputs.setdefault(inp.script_id, []).append(inp)
+        existing_params = {
+            (par.associated_script_id, par.input_id): par
+            for par in AssociatedScriptParameter.objects.filter(
+                associated_script__in=existing.keys()
+            )
+        }
 
-            for old_param in old_params:
-                if old_param.associated_script_id == asc.pk:
-                    old_param.associated_script = asc
-                    old_param.save()
+        new_ascs = []
+        changed_ascs = []
+        new_params = []
+        changed_params = []
+        changed_file_params = []
+        updated_policy_scripts = set()
 
-            for inp in script.ordered_inputs:
-                try:
-                    par = AssociatedScriptParameter.objects.get(
-                        associated_script=asc, input=inp
-                    )
-                except AssociatedScriptParameter.DoesNotExist:
+        for i, (pk, script_pk) in enumerate(submitted):
+            if script_pk not in scripts:
+                raise Script.DoesNotExist()
+            script = scripts[script_pk]
+            asc = None if pk.startswith("new_") else existing.pop(int(pk), None)
+            if asc is None:
+                asc = AssociatedScript(group=self, script=script, position=i)
+                new_ascs.append(asc)
+            elif asc.script_id != script.pk or asc.position != i:
+                asc.script = script
+                asc.position = i
+                changed_ascs.append(asc)
+
+            for inp in inputs.get(script.pk, []):
+                par = existing_params.get((asc.pk, inp.pk))
+                is_new = par is None
+                if is_new:
                     par = AssociatedScriptParameter(associated_script=asc, input=inp)
-                param_name = "{0}_param_{1}".format(script_param, inp.position)
+                param_name = "{0}_{1}_param_{2}".format(submit_name, pk, inp.position)
                 if inp.value_type == Input.FILE:
                     if param_name not in req_files or not req_files[param_name]:
-                        if par.pk is not None:
+                        if not is_new:
                             # Don't blank existing values
                             continue
                         elif inp.mandatory:
                             raise MandatoryParameterMissingError(inp)
-                        else:
-                            pass
                     else:
-                        if (
-                            par.pk is not None
-                            and par.file_value != req_files[param_name]
-                        ):
-                            updated_policy_scripts.add(par.associated_script)
+                        if not is_new:
+                            if par.file_value != req_files[param_name]:
+                                updated_policy_scripts.add(asc)
+                            changed_file_params.append(par)
                         par.file_value = req_files[param_name]
                 else:
                     if param_name not in req_params or (
                         not req_params[param_name] and inp.value_type == Input.PASSWORD
                     ):
-                        if par.pk is not None:
+                        if not is_new:
                             # Don't blank existing values
                             continue
                         elif inp.mandatory:
                             raise MandatoryParameterMissingError(inp)
-                        else:
-                            pass
                     elif not req_params[param_name] and inp.mandatory:
                         raise MandatoryParameterMissingError(inp)
+                    elif not is_new:
+                        if par.string_value != req_params[param_name]:
+                            updated_policy_scripts.add(asc)
+                            par.string_value = req_params[param_name]
+                            changed_params.append(par)
                     else:
-                        if (
-                            par.pk is not None
-                            and par.string_value != req_params[param_name]
-                        ):
-                            updated_policy_scripts.add(par.associated_script)
                         par.string_value = req_params[param_name]
-                par.save()
+                if is_new:
+                    new_params.append(par)
+
+        # The scripts which weren't submitted have been removed, and their
+        # parameters go with them
+        AssociatedScript.objects.filter(pk__in=existing.keys()).delete()
+        # The new positions may swap or shift those of the other scripts, and
+        # unique_group_position is checked for each row as it is updated, so
+        # move the changed scripts to free (negative) positions first
+        AssociatedScript.objects.filter(pk__in=[asc.pk for asc in changed_ascs]).update(
+            position=-1 - F("position")
+        )
+        AssociatedScript.objects.bulk_update(changed_ascs, ["script", "position"])
+        AssociatedScript.objects.bulk_create(new_ascs)
+        AssociatedScriptParameter.objects.bulk_create(new_params)
+        AssociatedScriptParameter.objects.bulk_update(changed_params, ["string_value"])
+        # Uploaded files are stored by save(), not by bulk_update()
+        for par in changed_file_params:
+            par.save(update_fields=["file_value"])
         return updated_policy_scripts
 
     @property
@@ -718,13 +1095,67 @@ class PC(models.Model):
     pc_groups = models.ManyToManyField(PCGroup, related_name="pcs", blank=True)
     site = models.ForeignKey(Site, related_name="pcs", on_delete=models.CASCADE)
     is_activated = models.BooleanField(verbose_name=_("activated"), default=False)
+    # Created from a list of computers uploaded before the computer itself
+    # registered. See system/registration.py.
+    is_preregistered = models.BooleanField(
+        verbose_name=_("pre-registered"), default=False
+    )
     created = models.DateTimeField(
         verbose_name=_("created"), auto_now_add=True, null=True
     )
     last_seen = models.DateTimeField(verbose_name=_("last seen"), null=True, blank=True)
+    # Set by a database trigger whenever the row changes, see migration 0100,
+    # for the change feed of the REST API
+    updated_at = models.DateTimeField(
+        verbose_name=_("updated"), db_default=Now(), db_index=True, editable=False
+    )
     location = models.CharField(
         verbose_name=_("location"), max_length=1024, blank=True, default=""
     )
+    # Inventory information reported by the client. These are copies of
+    # configuration entries, so they can be filtered and counted without
+    # joining the configuration entries. See update_inventory.
+    os2_product = models.CharField(
+        verbose_name=_("product"), max_length=255, blank=True, default="", db_index=True
+    )
+    os_release = models.CharField(
+        verbose_name=_("OS release"),
+        max_length=255,
+        blank=True,
+        default="",
+        db_index=True,
+    )
+    client_version = models.CharField(
+        verbose_name=_("client version"), max_length=255, blank=True, default=""
+    )
+    ip_addresses = models.CharField(
+        verbose_name=_("IP addresses"), max_length=4096, blank=True, default=""
+    )
+
+    objects = PCQuerySet.as_manager()
+
+    # The configuration keys copied into the inventory fields
+    INVENTORY_KEYS = {
+        "os2_product": "os2_product",
+        "_os_release": "os_release",
+        "_os2borgerpc.client_version": "client_version",
+        "_ip_addresses": "ip_addresses",
+    }
+
+    # A PC is online if it has been seen within this interval
+    ONLINE_INTERVAL = datetime.timedelta(minutes=5)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        pc = super().from_db(db, field_names, values)
+        # As stored, so that registering, activating or moving the PC can
+        # clear the cached statistics of its site, see system/signals.py
+        pc._loaded_activation = (
+            pc.__dict__.get("site_id"),
+            pc.__dict__.get("is_activated"),
+            pc.__dict__.get("is_preregistered"),
+        )
+        return pc
 
     @property
     def online(self):
@@ -732,7 +1163,12 @@ class PC(models.Model):
         if not self.last_seen:
             return False
         now = timezone.now()
-        return self.last_seen >= now - datetime.timedelta(minutes=5)
+        return self.last_seen >= now - PC.ONLINE_INTERVAL
+
+    @staticmethod
+    def online_filter():
+        """Filter matching the PCs that are online, as defined by online."""
+        return Q(last_seen__gte=timezone.now() - PC.ONLINE_INTERVAL)
 
     class Status:
         """This class represents the status of af PC. We may want to do
@@ -747,10 +1183,12 @@ class PC(models.Model):
         if not self.is_activated:
             return self.Status(NEW, INFO)
         else:
-            # Get a list of all jobs associated with this PC and see if any of
-            # them failed.
-            failed_jobs = self.jobs.filter(status=Job.FAILED)
-            if len(failed_jobs) > 0:
+            # See if any of the jobs of this PC failed, using the annotation
+            # from PC.objects.with_status() if the PC has it.
+            has_failed_jobs = getattr(self, "has_failed_jobs", None)
+            if has_failed_jobs is None:
+                has_failed_jobs = self.jobs.filter(status=Job.FAILED).exists()
+            if has_failed_jobs:
                 # Only UNHANDLED failed jobs, please.
                 return self.Status(FAIL, IMPORTANT)
             else:
@@ -767,8 +1205,7 @@ class PC(models.Model):
         configs = self.get_list_of_configurations()
         for conf in configs:
             try:
-                entry = conf.entries.get(key=key)
-                value = entry.value
+                value = conf.get(key)
             except ConfigurationEntry.DoesNotExist:
                 pass
         return value
@@ -777,8 +1214,7 @@ class PC(models.Model):
         result = {}
         configs = self.get_list_of_configurations()
         for conf in configs:
-            for entry in conf.entries.all():
-                result[entry.key] = entry.value
+            result.update(conf.data)
         if "mac" not in result.keys():
             result["mac"] = self.mac
         result["uid"] = self.uid
@@ -793,8 +1229,7 @@ class PC(models.Model):
 
         for conf in configs:
             try:
-                entry = conf.entries.get(key=key)
-                for v in entry.value.split(","):
+                for v in conf.get(key).split(","):
                     v = v.strip()
                     if v != "" and v not in result:
                         result.append(v)
@@ -810,11 +1245,83 @@ class PC(models.Model):
         """Return which Product the PC is an installation of."""
         return self.get_config_value("os2_product")
 
+    def update_inventory(self, config=None, save=True):
+        """Update the inventory fields from the PC's own configuration.
+
+        If config is given, only the inventory keys present in that dict
+        are updated, without looking up the configuration entries."""
+        if config is None:
+            data = self.configuration.data
+            config = {key: data.get(key, "") for key in PC.INVENTORY_KEYS}
+
+        updated_fields = []
+        for key, field in PC.INVENTORY_KEYS.items():
+            if key in config:
+                max_length = PC._meta.get_field(field).max_length
+                setattr(self, field, str(config[key] or "")[:max_length])
+                updated_fields.append(field)
+
+        if save and updated_fields:
+            self.save(update_fields=updated_fields)
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ["name"]
+        # Trigram indexes for the computer search, which matches with
+        # icontains, i.e. on the upper case values
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="pc_name_trgm"),
+            GinIndex(
+                OpClass(Upper("location"), name="gin_trgm_ops"),
+                name="pc_location_trgm",
+            ),
+            GinIndex(OpClass(Upper("uid"), name="gin_trgm_ops"), name="pc_uid_trgm"),
+        ]
+
+
+class PCDailyLogins(models.Model):
+    """The number of logins on a PC on a given day, as reported by the client
+    in the login_counts configuration entry."""
+
+    pc = models.ForeignKey(PC, related_name="daily_logins", on_delete=models.CASCADE)
+    date = models.DateField(verbose_name=_("date"))
+    count = models.PositiveIntegerField(verbose_name=_("logins"), default=0)
+
+    def __str__(self):
+        return f"{self.pc}: {self.date}: {self.count}"
+
+    @staticmethod
+    def parse_login_counts(login_counts):
+        """Parse a login_counts string like "2023-10-10: 4, 2023-10-11: 3"
+        into a dict mapping dates to counts, skipping malformed items."""
+        result = {}
+        for item in login_counts.split(","):
+            try:
+                day, count = item.replace(" ", "").split(":")
+                result[datetime.date.fromisoformat(day)] = int(count)
+            except ValueError:
+                continue
+        return result
+
+    @classmethod
+    def ingest(cls, pc, login_counts):
+        """Store the login counts reported by a PC, updating the counts of days
+        already stored."""
+        counts = cls.parse_login_counts(login_counts)
+        cls.objects.bulk_create(
+            [cls(pc=pc, date=day, count=count) for day, count in counts.items()],
+            update_conflicts=True,
+            unique_fields=["pc", "date"],
+            update_fields=["count"],
+        )
+
+    class Meta:
+        ordering = ["pc", "date"]
+        constraints = [
+            models.UniqueConstraint(fields=["pc", "date"], name="unique_pc_date")
+        ]
 
 
 class ScriptTag(models.Model):
@@ -896,31 +1403,18 @@ class Script(AuditModelMixin):
         batch = Batch(site=site, script=self, name="")
         batch.save()
 
-        parameter_values = "["
-
         # Add parameters
         for i, inp in enumerate(self.ordered_inputs):
             if i < len(args):
                 value = args[i]
-                if inp.value_type == Input.PASSWORD:
-                    parameter_values += "*****, "
-                else:
-                    parameter_values += str(value) + ", "
                 if inp.value_type == Input.FILE:
                     p = BatchParameter(input=inp, batch=batch, file_value=value)
                 else:
                     p = BatchParameter(input=inp, batch=batch, string_value=value)
                 p.save()
 
-        if len(parameter_values) > 1:
-            parameter_values = parameter_values[:-2]
-        parameter_values += "]"
-
-        log_output = f"New job with arguments {parameter_values}"
-
-        for pc in pc_list:
-            job = Job(batch=batch, pc=pc, user=user, log_output=log_output)
-            job.save()
+        # The log of each job is only created once the PC reports output.
+        Job.objects.bulk_create([Job(batch=batch, pc=pc, user=user) for pc in pc_list])
 
         return batch
 
@@ -958,6 +1452,19 @@ class Batch(models.Model):
     def __str__(self):
         return f"{self.name} - {self.script} - {self.site}"
 
+    @property
+    def arguments(self):
+        """The arguments of the batch for display, with passwords masked."""
+        values = []
+        for p in self.parameters.select_related("input").order_by("input__position"):
+            if p.input.value_type == Input.PASSWORD:
+                values.append("*****")
+            elif p.input.value_type == Input.FILE:
+                values.append(str(p.file_value))
+            else:
+                values.append(str(p.string_value))
+        return "[" + ", ".join(values) + "]"
+
 
 class AssociatedScript(models.Model):
     """A script associated with a group. Adding a script to a group causes it
@@ -999,26 +1506,10 @@ Runs this script on several PCs, returning a batch representing this task."""
         batch.save()
         params = self.make_parameters(batch)
 
-        parameter_values = "["
-
         for p in params:
             p.save()
-            if p.file_value:
-                parameter_values += str(p.file_value) + ", "
-            elif p.input.value_type == Input.PASSWORD:
-                parameter_values += "*****, "
-            else:
-                parameter_values += str(p.string_value) + ", "
-
-        if len(parameter_values) > 1:
-            parameter_values = parameter_values[:-2]
-        parameter_values += "]"
-
-        log_output = f"New job with arguments {parameter_values}"
 
-        for pc in pcs:
-            job = Job(batch=batch, pc=pc, user=user, log_output=log_output)
-            job.save()
+        Job.objects.bulk_create([Job(batch=batch, pc=pc, user=user) for pc in pcs])
 
         return batch
 
@@ -1073,17 +1564,25 @@ class Job(models.Model):
         RESOLVED: "bg-primary",
     }
 
+    objects = JobQuerySet.as_manager()
+
     # Fields
     # Use built-in ID field for ID.
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=NEW)
-    log_output = models.TextField(
-        verbose_name=_("log output"), max_length=128000, blank=True
-    )
+    # The log itself lives in JobLog - these are kept here so job lists
+    # never have to read the log text.
+    has_log = models.BooleanField(verbose_name=_("has log"), default=False)
+    log_length = models.PositiveIntegerField(verbose_name=_("log length"), default=0)
     created = models.DateTimeField(
         verbose_name=_("created"), auto_now_add=True, null=True
     )
     started = models.DateTimeField(verbose_name=_("started"), null=True)
     finished = models.DateTimeField(verbose_name=_("finished"), null=True)
+    # Set by a database trigger whenever the row changes, see migration 0100,
+    # for the change feed of the REST API
+    updated_at = models.DateTimeField(
+        verbose_name=_("updated"), db_default=Now(), db_index=True, editable=False
+    )
     user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
     batch = models.ForeignKey(Batch, related_name="jobs", on_delete=models.CASCADE)
     pc = models.ForeignKey(PC, related_name="jobs", on_delete=models.CASCADE)
@@ -1093,7 +1592,62 @@ class Job(models.Model):
 
     @property
     def has_info(self):
-        return self.status == Job.FAILED or len(self.log_output) > 1
+        # The log of a job which hasn't finished can still be followed
+        return self.status == Job.FAILED or self.log_length > 1 or not self.finished
+
+    @property
+    def log_output(self):
+        if not self.has_log:
+            return ""
+        try:
+            return self.log.output
+        except JobLog.DoesNotExist:
+            return ""
+
+    def set_log_output(self, log_output, save=True):
+        """Replace the log of this job, storing it in JobLog."""
+        log_output = log_output or ""
+        self.log, _created = JobLog.objects.update_or_create(
+            job=self, defaults={"output": log_output}
+        )
+        self.has_log = bool(log_output)
+        # The log length is counted in bytes, matching the offsets used
+        # by append_log.
+        self.log_length = len(log_output.encode("utf-8"))
+        if save:
+            self.save(update_fields=["has_log", "log_length"])
+
+    def append_log(self, chunk, offset):
+        """Append a chunk of log output which starts at the byte offset given.
+
+        Any part of the chunk that has already been received is skipped, so
+        a client can safely resend a chunk; if the overlap ends inside a
+        character, the chunk continues from the next one. If the offset is
+        beyond the end of the stored log, nothing is written. Returns the
+        resulting log length, which is the offset the client should continue
+        from."""
+        data = (chunk or "").encode("utf-8")
+        with transaction.atomic():
+            job = Job.objects.select_for_update().only("has_log", "log_length")
+            job = job.get(pk=self.pk)
+            start = job.log_length - offset
+            while 0 < start < len(data) and data[start] & 0xC0 == 0x80:
+                start += 1
+            if 0 <= offset <= job.log_length and start < len(data):
+                new_data = data[start:]
+                log, _created = JobLog.objects.get_or_create(job_id=job.pk)
+                JobLog.objects.filter(pk=log.pk).update(
+                    output=Concat(F("output"), Value(new_data.decode("utf-8")))
+                )
+                job.has_log = True
+                job.log_length += len(new_data)
+                job.save(update_fields=["has_log", "log_length"])
+
+        # Any cached log is now stale.
+        self._state.fields_cache.pop("log", None)
+        self.has_log = job.has_log
+        self.log_length = job.log_length
+        return self.log_length
 
     @property
     def status_label(self):
@@ -1148,14 +1702,7 @@ class Job(models.Model):
         script = self.batch.script
         new_batch = Batch(site=self.batch.site, script=script, name="")
         new_batch.save()
-        parameter_values = "["
         for p in self.batch.parameters.all():
-            if p.input.value_type == Input.PASSWORD:
-                parameter_values += "*****, "
-            elif p.input.value_type == Input.FILE:
-                parameter_values += str(p.file_value) + ", "
-            else:
-                parameter_values += str(p.string_value) + ", "
             new_p = BatchParameter(
                 input=p.input,
                 batch=new_batch,
@@ -1164,18 +1711,69 @@ class Job(models.Model):
             )
             new_p.save()
 
-        if len(parameter_values) > 1:
-            parameter_values = parameter_values[:-2]
-        parameter_values += "]"
-
-        log_output = f"New job with arguments {parameter_values}"
-
-        new_job = Job(batch=new_batch, pc=self.pc, user=user, log_output=log_output)
+        new_job = Job(batch=new_batch, pc=self.pc, user=user)
         new_job.save()
         self.resolve()
 
         return new_job
 
+    class Meta:
+        indexes = [
+            # For finding the PCs with failed jobs, see PCQuerySet.with_status
+            models.Index(
+                fields=["pc"], condition=Q(status="FAILED"), name="job_failed_pc_idx"
+            ),
+        ]
+
+
+class JobLog(models.Model):
+    """The log output of a Job.
+
+    Kept in its own table so the (potentially large) log is only read when
+    actually shown."""
+
+    job = models.OneToOneField(
+        Job, primary_key=True, related_name="log", on_delete=models.CASCADE
+    )
+    output = models.TextField(
+        verbose_name=_("log output"), max_length=128000, blank=True
+    )
+
+    def __str__(self):
+        return str(self.job)
+
+    @classmethod
+    def read_chunk(cls, job, offset, size):
+        """Read up to size bytes of the log of job, starting at offset.
+
+        Only the requested part of the log is fetched from the database.
+        Returns the text read and the offset of the following chunk; the
+        chunk is shortened rather than cutting a character in two, and an
+        offset inside a character starts at the next one."""
+        if not job.has_log or offset >= job.log_length:
+            return "", job.log_length
+        data = (
+            cls.objects.filter(pk=job.pk)
+            .annotate(
+                chunk=Func(
+                    Func(F("output"), Value("UTF8"), function="convert_to"),
+                    Value(offset + 1),
+                    Value(size),
+                    function="substring",
+                    output_field=models.BinaryField(),
+                )
+            )
+            .values_list("chunk", flat=True)
+            .first()
+        )
+        data = bytes(data or b"")
+        # Skip the continuation bytes of a character started before offset
+        start = 0
+        while start < len(data) and data[start] & 0xC0 == 0x80:
+            start += 1
+        text = codecs.getincrementaldecoder("utf-8")().decode(data[start:])
+        return text, offset + start + len(text.encode("utf-8"))
+
 
 class Input(models.Model):
     """Input for a script"""
@@ -1404,6 +2002,11 @@ class SecurityEvent(models.Model):
         on_delete=models.SET_NULL,
     )
     note = models.TextField(blank=True)
+    # Set by a database trigger whenever the row changes, see migration 0100,
+    # for the change feed of the REST API
+    updated_at = models.DateTimeField(
+        verbose_name=_("updated"), db_default=Now(), db_index=True, editable=False
+    )
 
     @property
     def namestr(self):
@@ -1425,6 +2028,116 @@ class SecurityEvent(models.Model):
         ]
 
 
+class SecurityEventCounter(models.Model):
+    """The number of unresolved security events of a site with a level above
+    NORMAL, shown in the navigation of every site page.
+
+    The counters are kept up to date by database triggers on the security
+    events and their rules, see migration 0095, so that bulk updates and
+    deletes are counted too. Dropped partitions and the like are corrected
+    by reconcile(), which runs periodically."""
+
+    # Without a foreign key constraint, as the triggers may count the events
+    # of a site which is being deleted after its counter
+    site = models.OneToOneField(
+        Site,
+        primary_key=True,
+        related_name="security_event_counter",
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    outstanding = models.IntegerField(verbose_name=_("outstanding"), default=0)
+
+    def __str__(self):
+        return f"{self.site}: {self.outstanding}"
+
+    @classmethod
+    def outstanding_for_site(cls, site):
+        """Return the number of outstanding priority events of site."""
+        outstanding = (
+            cls.objects.filter(site=site).values_list("outstanding", flat=True).first()
+        )
+        return outstanding or 0
+
+    @classmethod
+    def reconcile(cls):
+        """Recount the outstanding priority events of every site and correct
+        the counters which are off. Return the sites which were corrected as a
+        dict of site id to (counted, correct)."""
+        with transaction.atomic():
+            # Wait for the transactions which have changed counters to
+            # finish and keep new ones from changing them until the counts
+            # have been stored
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {cls._meta.db_table} IN EXCLUSIVE MODE")
+            correct = dict(
+                SecurityEvent.objects.outstanding()
+                .values("rule_site")
+                .annotate(count=models.Count("pk"))
+                .values_list("rule_site", "count")
+            )
+            counted = dict(cls.objects.values_list("site_id", "outstanding"))
+            corrections = {
+                site_id: (counted.get(site_id, 0), correct.get(site_id, 0))
+                for site_id in Site.objects.values_list("pk", flat=True)
+                if counted.get(site_id, 0) != correct.get(site_id, 0)
+            }
+            cls.objects.exclude(site__in=Site.objects.all()).delete()
+            cls.objects.bulk_create(
+                [
+                    cls(site_id=site_id, outstanding=outstanding)
+                    for site_id, (_counted, outstanding) in corrections.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["site"],
+                update_fields=["outstanding"],
+            )
+        return corrections
+
+
+class Tombstone(models.Model):
+    """A PC, job or security event which was deleted, or a PC which was
+    moved to another site, so that the change feed of the REST API can tell
+    its clients to delete it.
+
+    Tombstones are written by database triggers, see migration 0100, and
+    removed after RETENTION by the clean_up_database command. Events removed
+    by dropping a partition leave tombstones as well, see
+    system/partitioning.py."""
+
+    RETENTION = datetime.timedelta(days=90)
+
+    PC = "pc"
+    JOB = "job"
+    SECURITY_EVENT = "securityevent"
+
+    MODEL_CHOICES = (
+        (PC, "PC"),
+        (JOB, "Job"),
+        (SECURITY_EVENT, "SecurityEvent"),
+    )
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.IntegerField()
+    # Without a foreign key constraint, as the triggers write the tombstones
+    # of the computers of a site while the site is being deleted
+    site = models.ForeignKey(
+        Site, related_name="+", on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    deleted_at = models.DateTimeField(db_default=Now())
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["site", "model", "deleted_at", "id"],
+                name="tombstone_feed_idx",
+            ),
+        ]
+
+
 class ImageVersion(models.Model):
     product = models.ForeignKey(
         Product,
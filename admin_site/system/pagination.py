@@ -0,0 +1,242 @@
+"""Keyset ("seek") pagination of querysets.
+
+Paging with OFFSET makes the database produce and throw away every row before
+the requested page, so deep pages of large tables like Job and SecurityEvent
+get slower the further back you go. The KeysetPaginator instead hands out an
+opaque cursor with the ordering values of the first or last row of a page and
+fetches the neighbouring page with a WHERE clause on those values, which the
+indexes on the ordering columns can answer directly.
+
+The paginator mimics the parts of django.core.paginator.Paginator and Page
+used by the list views, except that next_page_number() and
+previous_page_number() return cursors rather than numbers. Plain page numbers
+are still accepted and served with OFFSET, which is fine for the first few
+pages the page links point to.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import math
+
+from django.db.models import F, Q
+
+# Counting more rows than this isn't worth it just to show a total
+COUNT_LIMIT = 10000
+
+NEXT = "next"
+PREVIOUS = "prev"
+
+
+def _json_default(value):
+    # Keep the full precision, unlike DjangoJSONEncoder, so the cursor values
+    # compare equal to the ones in the database
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_cursor(ordering, direction, keys, number):
+    data = {"o": ordering, "d": direction, "k": keys, "n": number}
+    raw = json.dumps(data, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the data of a cursor or None if it isn't a valid cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(data, dict) or data.get("d") not in (NEXT, PREVIOUS):
+        return None
+    return data
+
+
+def _parse_ordering(queryset):
+    """Return the ordering of queryset as a list of (field, descending) ending
+    with the primary key, which makes the ordering total."""
+    ordering = []
+    for field in queryset.query.order_by:
+        if not isinstance(field, str):
+            raise ValueError("Keyset pagination only supports ordering by fields")
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        if name == "id":
+            name = "pk"
+        ordering.append((name, descending))
+        if name == "pk":
+            break
+    else:
+        ordering.append(("pk", False))
+    return ordering
+
+
+def _after(field, descending, value):
+    """Q for the rows coming strictly after value in the ordering of field.
+
+    PostgreSQL sorts NULL as larger than any value, i.e. NULLS LAST when
+    ascending and NULLS FIRST when descending."""
+    if descending:
+        if value is None:
+            return Q(**{f"{field}__isnull": False})
+        return Q(**{f"{field}__lt": value})
+    if value is None:
+        return Q(pk__in=[])
+    if field == "pk":
+        return Q(pk__gt=value)
+    return Q(**{f"{field}__gt": value}) | Q(**{f"{field}__isnull": True})
+
+
+def _equal(field, value):
+    if value is None:
+        return Q(**{f"{field}__isnull": True})
+    return Q(**{field: value})
+
+
+def keyset_filter(ordering, keys):
+    """Q for the rows after the row with the given keys in ordering."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for (field, descending), value in zip(ordering, keys):
+        condition |= equal & _after(field, descending, value)
+        equal &= _equal(field, value)
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, number, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<Page {self.number}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        """Return the cursor of the next page."""
+        return self.paginator.cursor(NEXT, self.object_list[-1], self.number + 1)
+
+    def previous_page_number(self):
+        """Return the cursor of the previous page."""
+        return self.paginator.cursor(PREVIOUS, self.object_list[0], self.number - 1)
+
+
+class KeysetPaginator:
+    """Paginate an ordered queryset by the values of its ordering fields."""
+
+    def __init__(self, queryset, per_page, count_limit=COUNT_LIMIT):
+        self.ordering = _parse_ordering(queryset)
+        self.key_names = [f"_keyset_{i}" for i in range(len(self.ordering))]
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.count_limit = count_limit
+        self._count = None
+
+    @property
+    def count(self):
+        """The number of rows, capped at count_limit."""
+        if self._count is None:
+            self._count = self.queryset.order_by()[: self.count_limit + 1].count()
+        return min(self._count, self.count_limit)
+
+    @property
+    def count_is_estimate(self):
+        """Whether there are more rows than count."""
+        return self.count < self._count
+
+    @property
+    def num_pages(self):
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    def _key_ordering(self, reverse=False):
+        return [
+            (name, descending != reverse)
+            for name, (_field, descending) in zip(self.key_names, self.ordering)
+        ]
+
+    def _ordering_strings(self, reverse=False):
+        return [
+            ("-" if descending else "") + name
+            for name, descending in self._key_ordering(reverse)
+        ]
+
+    def _keyed_queryset(self):
+        return self.queryset.annotate(
+            **{
+                name: F(field)
+                for name, (field, _descending) in zip(self.key_names, self.ordering)
+            }
+        )
+
+    def _ordering_key(self):
+        # Cursors are only valid for the ordering they were made for
+        return [("-" if descending else "") + f for f, descending in self.ordering]
+
+    def cursor(self, direction, obj, number):
+        if isinstance(obj, dict):
+            keys = [obj[name] for name in self.key_names]
+        else:
+            keys = [getattr(obj, name) for name in self.key_names]
+        return encode_cursor(self._ordering_key(), direction, keys, number)
+
+    def page(self, value):
+        """Return the page for a page number or a cursor. Anything else
+        gives the first page."""
+        data = decode_cursor(str(value)) if value else None
+        if data is not None and data.get("o") == self._ordering_key():
+            keys = data.get("k")
+            if isinstance(keys, list) and len(keys) == len(self.ordering):
+                return self._seek(data["d"], keys, data.get("n"))
+        try:
+            number = max(int(value), 1)
+        except (TypeError, ValueError):
+            number = 1
+        return self._offset_page(number)
+
+    def _offset_page(self, number):
+        start = (number - 1) * self.per_page
+        queryset = self._keyed_queryset().order_by(*self._ordering_strings())
+        rows = list(queryset[start : start + self.per_page + 1])
+        if not rows and number > 1:
+            return self._offset_page(1)
+        has_next = len(rows) > self.per_page
+        return KeysetPage(self, rows[: self.per_page], number, has_next, number > 1)
+
+    def _seek(self, direction, keys, number):
+        number = number if isinstance(number, int) and number > 0 else 1
+        reverse = direction == PREVIOUS
+        queryset = (
+            self._keyed_queryset()
+            .filter(keyset_filter(self._key_ordering(reverse), keys))
+            .order_by(*self._ordering_strings(reverse))
+        )
+        rows = list(queryset[: self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if not rows:
+            # The rows around the cursor are gone, start over
+            return self._offset_page(1)
+        if not reverse:
+            return KeysetPage(self, rows, number, more, number > 1)
+        rows.reverse()
+        return KeysetPage(self, rows, number if more else 1, True, more)
@@ -0,0 +1,146 @@
+"""Maintenance of the monthly range partitions of the SecurityEvent and
+LoginLog tables."""
+
+import datetime
+import re
+
+from django.db import connection, transaction
+
+from system.models import LoginLog, SecurityEvent
+
+# The partitioned models and the column each of them is partitioned by
+PARTITIONED_MODELS = {
+    SecurityEvent: "occurred_time",
+    LoginLog: "date",
+}
+
+# Dropping a partition doesn't fire the triggers writing tombstones, see
+# migration 0100, so the tombstones of its rows are written beforehand
+TOMBSTONE_SQL = {
+    SecurityEvent: """
+        INSERT INTO system_tombstone (model, object_id, site_id, deleted_at)
+        SELECT %s, id, site_id, clock_timestamp()
+        FROM (
+            SELECT e.id, COALESCE(p.site_id, s.site_id) AS site_id
+            FROM "{partition}" e
+            LEFT JOIN system_securityproblem p ON p.id = e.problem_id
+            LEFT JOIN system_eventruleserver s ON s.id = e.event_rule_server_id
+        ) dropped_events
+        WHERE site_id IS NOT NULL
+    """,
+}
+
+PARTITION_BOUND_RE = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+def month_start(day, months=0):
+    """Return the first day of the month of day, moved the given number of
+    months forward."""
+    month = day.month - 1 + months
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _parse_bound(bound):
+    if bound == "MINVALUE":
+        return None
+    # Bounds look like '2024-01-01' or '2024-01-01 00:00:00'
+    return datetime.date.fromisoformat(bound.strip("'")[:10])
+
+
+def get_partitions(model):
+    """Return the range partitions of the table of model as a list of
+    (name, lower bound, upper bound) sorted by their bounds, with None as the
+    lower bound of a partition without one. The default partition is not
+    included."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [model._meta.db_table],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND_RE.match(bound)
+        if match:
+            partitions.append(
+                (name, _parse_bound(match.group(1)), _parse_bound(match.group(2)))
+            )
+    return sorted(partitions, key=lambda partition: partition[2])
+
+
+def create_partition(model, start, end):
+    """Create the partition of the table of model for the range from start to
+    end, moving any rows in that range out of the default partition."""
+    table = model._meta.db_table
+    column = PARTITIONED_MODELS[model]
+    name = f"{table}_p{start:%Y%m}"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE "{name}" '
+            f'(LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{table}_default" '
+            f'WHERE "{column}" >= %s AND "{column}" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    return name
+
+
+def create_partitions(model, months_ahead):
+    """Create the monthly partitions of the table of model for the current
+    month and the given number of months ahead, unless they already exist.
+    Returns the names of the partitions created."""
+    partitions = get_partitions(model)
+    today = datetime.date.today()
+    created = []
+    for months in range(months_ahead + 1):
+        start = month_start(today, months)
+        end = month_start(today, months + 1)
+        if any(
+            (lower is None or lower < end) and start < upper
+            for _name, lower, upper in partitions
+        ):
+            continue
+        created.append(create_partition(model, start, end))
+    return created
+
+
+def drop_partitions_before(model, cutoff, retention_column=None):
+    """Drop the partitions of the table of model that only contain rows from
+    before cutoff. If retention_column is given, a partition is kept while
+    any of its rows has a value of that column from cutoff on, e.g. events
+    which occurred before cutoff but were reported later. The rows of a
+    dropped partition leave tombstones, as if they had been deleted. Returns
+    the names of the partitions dropped."""
+    dropped = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, _lower, upper in get_partitions(model):
+            if upper > cutoff:
+                continue
+            if retention_column:
+                cursor.execute(
+                    f'SELECT EXISTS (SELECT 1 FROM "{name}" '
+                    f'WHERE "{retention_column}" >= %s)',
+                    [cutoff],
+                )
+                if cursor.fetchone()[0]:
+                    continue
+            if model in TOMBSTONE_SQL:
+                cursor.execute(
+                    TOMBSTONE_SQL[model].format(partition=name),
+                    [model._meta.model_name],
+                )
+            cursor.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+    return dropped
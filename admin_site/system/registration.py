@@ -0,0 +1,124 @@
+"""Pre-registration of computers before they are installed.
+
+During a rollout an operator may upload the MAC addresses and names of the
+computers of a site, so that they are created in one go. When a computer
+then registers, its pre-registered PC is completed instead of a new one
+being created. See register_new_computer_v2 in rpc.py.
+"""
+
+import csv
+import hashlib
+import io
+import re
+
+from django.db import transaction
+
+from system.models import PC, Configuration
+
+MAC_SEPARATORS = re.compile(r"[:\-.]")
+MAC_DIGITS = re.compile(r"[0-9a-f]{12}")
+
+
+def computer_uid(mac):
+    """Return the UID of the computer with the MAC address mac."""
+    return hashlib.md5(mac.encode("utf-8")).hexdigest()
+
+
+def configuration_name(site_uid, name, uid):
+    return "_".join([site_uid, name, uid])
+
+
+def normalize_mac(mac):
+    """Return mac as the clients report it, in lower case separated by colons,
+    or None if it isn't a MAC address."""
+    digits = MAC_SEPARATORS.sub("", mac.strip().lower())
+    if not MAC_DIGITS.fullmatch(digits):
+        return None
+    return ":".join(digits[i : i + 2] for i in range(0, 12, 2))
+
+
+def read_preregistration_csv(file, site):
+    """Read the computers to pre-register on site from a CSV file with the
+    columns mac, name and, optionally, site.
+
+    Return a list of (MAC address, name) and a list of the errors found. A
+    site given in the file must be the UID of site."""
+    try:
+        text = file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return [], ["The file must be encoded as UTF-8"]
+    reader = csv.DictReader(io.StringIO(text, newline=""))
+    fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    if "mac" not in fieldnames or "name" not in fieldnames:
+        return [], ["The file must have a header with the columns mac and name"]
+    reader.fieldnames = fieldnames
+
+    computers = []
+    errors = []
+    seen = set()
+    for row in reader:
+        line = reader.line_num
+        mac = normalize_mac(row["mac"] or "")
+        name = (row["name"] or "").strip()
+        row_site = (row.get("site") or "").strip()
+        if mac is None:
+            errors.append(f"Line {line}: {row['mac']!r} is not a MAC address")
+        elif mac in seen:
+            errors.append(f"Line {line}: {mac} is in the file more than once")
+        elif not name:
+            errors.append(f"Line {line}: The name is missing")
+        elif len(name) > PC._meta.get_field("name").max_length:
+            errors.append(f"Line {line}: The name is too long")
+        elif row_site and row_site != site.uid:
+            errors.append(f"Line {line}: The site must be {site.uid}")
+        else:
+            seen.add(mac)
+            computers.append((mac, name))
+    return computers, errors
+
+
+@transaction.atomic
+def preregister_computers(site, computers):
+    """Create a pre-registered PC on site for each (MAC address, name) in
+    computers, along with its configuration, unless a computer with the MAC
+    address exists already.
+
+    Return the list of created PCs and the list of the MAC addresses of the
+    computers which already existed."""
+    computers = {computer_uid(mac): (mac, name) for mac, name in computers}
+    existing = set(
+        PC.objects.filter(uid__in=computers.keys()).values_list("uid", flat=True)
+    )
+    existing_macs = [mac for uid, (mac, _name) in computers.items() if uid in existing]
+    computers = {
+        uid: computer for uid, computer in computers.items() if uid not in existing
+    }
+
+    names = {
+        uid: configuration_name(site.uid, name, uid)
+        for uid, (_mac, name) in computers.items()
+    }
+    # Configurations left behind by deleted computers are reused, as when
+    # registering
+    configurations = Configuration.objects.in_bulk(
+        list(names.values()), field_name="name"
+    )
+    for configuration in Configuration.objects.bulk_create(
+        Configuration(name=name)
+        for name in names.values()
+        if name not in configurations
+    ):
+        configurations[configuration.name] = configuration
+
+    pcs = PC.objects.bulk_create(
+        PC(
+            uid=uid,
+            mac=mac,
+            name=name,
+            site=site,
+            configuration=configurations[names[uid]],
+            is_preregistered=True,
+        )
+        for uid, (mac, name) in computers.items()
+    )
+    return pcs, existing_macs
@@ -7,11 +7,13 @@ import logging
 from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 
-from system.models import PC, Site, Configuration, ConfigurationEntry
+from system.models import PC, Site, Configuration
 from system.models import Job, SecurityProblem, SecurityEvent
-from system.models import Citizen, LoginLog
+from system.models import Citizen, LoginLog, LoginLogRollup, PCDailyLogins
+from system.registration import computer_uid, configuration_name
 
 from system.utils import (
     get_citizen_login_api_validator,
@@ -23,73 +25,93 @@ from system.utils import (
 logger = logging.getLogger(__name__)
 
 
+class ComputerExistsError(Exception):
+    def __init__(self, name):
+        super().__init__(
+            "A computer with the same MAC address as this computer is already "
+            f"registered with the chosen admin portal under the name {name}. "
+            "Start by deleting the computer on the computer list on your site "
+            "and then restart the registration."
+        )
+
+
 def register_new_computer_v2(mac, name, site, configuration):
     """Register a new computer with the admin system - after registration, the
     computer will be submitted for approval."""
 
     # Hash our uid
-    uid = hashlib.md5(mac.encode("utf-8")).hexdigest()
+    uid = computer_uid(mac)
 
-    if PC.objects.filter(uid=uid).count():
-        name = PC.objects.get(uid=uid).name
-        raise Exception(
-            "A computer with the same MAC address as this computer is already "
-            f"registered with the chosen admin portal under the name {name}. "
-            "Start by deleting the computer on the computer list on your site "
-            "and then restart the registration."
-        )
-    # If we are here then no matching PC object exists
-    new_pc = PC(name=name, uid=uid)
     try:
-        new_pc.site = Site.objects.get(uid=site)
-    except Site.DoesNotExist:
-        raise Exception(
-            "The chosen site UID does not match any sites on the "
-            "chosen admin portal."
-        )
+        with transaction.atomic():
+            new_pc = (
+                PC.objects.select_for_update()
+                .select_related("configuration")
+                .filter(uid=uid)
+                .first()
+            )
+            if new_pc is not None and not new_pc.is_preregistered:
+                raise ComputerExistsError(new_pc.name)
+            try:
+                site_obj = Site.objects.get(uid=site)
+            except Site.DoesNotExist:
+                raise Exception(
+                    "The chosen site UID does not match any sites on the "
+                    "chosen admin portal."
+                )
 
-    new_pc.is_activated = False
-    new_pc.mac = mac
-    # Create new configuration, populate with data from computer's config.
-    # If a configuration with the same ID is hanging, reuse.
-    config_name = "_".join([site, name, uid])
-    try:
-        my_config = Configuration.objects.get(name=config_name)
-    except Configuration.DoesNotExist:
-        my_config = Configuration()
-        my_config.name = config_name
-    finally:
-        # Delete pre-existing entries
-        entries = ConfigurationEntry.objects.filter(owner_configuration=my_config)
-        for e in entries:
-            e.delete()
-    my_config.save()
-    # And load configuration
-
-    # Update configuration with os2 product
-    # New image versions set it themselves, old don't so for those
-    # we detect and set it this way
-    if "os2_product" not in configuration:
-        if "os2borgerpc_version" in configuration:
-            product = "os2borgerpc"
-        else:
-            product = "os2borgerpc kiosk"
-        configuration.update({"os2_product": product})
+            if new_pc is None:
+                new_pc = PC(name=name, uid=uid, site=site_obj)
+                new_pc.is_activated = False
+                # Create new configuration, populate with data from computer's
+                # config. If a configuration with the same ID is hanging, reuse.
+                new_pc.configuration, _created = Configuration.objects.get_or_create(
+                    name=configuration_name(site, name, uid)
+                )
+                # Replace any pre-existing entries
+                replace_entries = True
+            elif new_pc.site_id != site_obj.id:
+                raise Exception(
+                    "This computer has been pre-registered on another site "
+                    "than the chosen one."
+                )
+            else:
+                # The computer was pre-registered, and keeps its name and any
+                # configuration given to it since
+                new_pc.is_preregistered = False
+                replace_entries = False
+            new_pc.mac = mac
+
+            # Update configuration with os2 product
+            # New image versions set it themselves, old don't so for those
+            # we detect and set it this way
+            if "os2_product" not in configuration:
+                if "os2borgerpc_version" in configuration:
+                    product = "os2borgerpc"
+                else:
+                    product = "os2borgerpc kiosk"
+                configuration.update({"os2_product": product})
 
-    # remove mac and uid from the configuration
-    # We don't need them saved as both attributes and configuration entries
-    try:
-        del configuration["mac"]
-        del configuration["uid"]
-    except KeyError:
-        pass
-
-    for k, v in list(configuration.items()):
-        entry = ConfigurationEntry(key=k, value=v, owner_configuration=my_config)
-        entry.save()
-    # Set and save PmC
-    new_pc.configuration = my_config
-    new_pc.save()
+            # remove mac and uid from the configuration
+            # We don't need them saved as both attributes and configuration entries
+            try:
+                del configuration["mac"]
+                del configuration["uid"]
+            except KeyError:
+                pass
+
+            # And load configuration
+            new_pc.configuration.write_entries(configuration, replace=replace_entries)
+            # Set and save PmC
+            new_pc.update_inventory(configuration, save=False)
+            new_pc.save()
+    except IntegrityError:
+        # The same computer may have registered in parallel
+        existing_name = PC.objects.filter(uid=uid).values_list("name", flat=True)
+        existing_name = existing_name.first()
+        if existing_name is None:
+            raise
+        raise ComputerExistsError(existing_name)
     return uid
 
 
@@ -103,16 +125,34 @@ def send_status_info_v2(pc_uid, job_data):
     If no updates, these will be None. In that
     case, this function really works as an "I'm alive" signal."""
 
+    send_status_info_v3(pc_uid, job_data)
+
+    return 0
+
+
+def send_status_info_v3(pc_uid, job_data):
+    """Update the status of outstanding jobs.
+
+    As send_status_info_v2, except that instead of the full "log_output" the
+    job data may contain a "log_chunk" along with the byte offset in the log
+    it starts at as "log_offset". The chunk is appended to the log, ignoring
+    any part of it which has already been received.
+
+    Returns a dict mapping the ID of each updated job to the length of its
+    log, i.e. the offset the next chunk should start at."""
+
     # 1. Lookup PC, update "last_seen" field
     pc = PC.objects.get(uid=pc_uid)
 
     if not pc.is_activated:
         # Fail silently
-        return 0
+        return {}
 
     pc.last_seen = datetime.now()
     pc.save()
 
+    log_offsets = {}
+
     # 2. Update jobs with job data
     if job_data is not None:
         for jd in job_data:
@@ -125,12 +165,14 @@ def send_status_info_v2(pc_uid, job_data):
                 job.started = jd["started"]
             if jd["finished"]:
                 job.finished = jd["finished"]
-            job.log_output = jd["log_output"]
-            job.save()
+            job.save(update_fields=["status", "started", "finished"])
+            if "log_offset" in jd:
+                job.append_log(jd.get("log_chunk", ""), int(jd["log_offset"]))
+            elif "log_output" in jd:
+                job.set_log_output(jd["log_output"])
+            log_offsets[str(job.pk)] = job.log_length
 
-    pc.save()
-
-    return 0
+    return log_offsets
 
 
 # TODO: Backwards compatible function. Delete once there are no longer active clients calling it.
@@ -212,23 +254,29 @@ def push_config_keys(pc_uid, config_dict):
 
     pc_config_list = config_lists.pop()
 
-    pc_config = {}
-    for entry in pc_config_list.entries.all():
-        pc_config[entry.key] = entry.value
+    pc_config = pc_config_list.data
 
     others_config = {}
     for conf in config_lists:
-        for entry in conf.entries.all():
-            others_config[entry.key] = entry.value
+        others_config.update(conf.data)
 
+    values = {}
+    remove = []
     for key, value in list(config_dict.items()):
         # Special case: If the value we want is in others_config, we just have
         # to remove any pc-specific config:
         if key in others_config and others_config[key] == value:
             if key in pc_config:
-                pc.configuration.remove_entry(key)
+                remove.append(key)
         else:
-            pc.configuration.update_entry(key, value)
+            values[key] = value
+    pc.configuration.write_entries(values, remove=remove)
+
+    # The inventory is copied from the configuration as stored, like when
+    # the configuration is edited
+    pc.update_inventory()
+    if config_dict.get("login_counts"):
+        PCDailyLogins.ingest(pc, config_dict["login_counts"])
 
     return True
 
@@ -508,6 +556,7 @@ def general_citizen_login(pc_uid, integration, value_dict):
             logout_time=datetime.time(now),
         )
         login_log.save()
+        LoginLogRollup.record_login(login_log)
         log_id = login_log.id
 
     return int(time_allowed), citizen_hash, log_id
@@ -522,9 +571,11 @@ def general_citizen_logout(citizen_hash, log_id):
         try:
             # Update logout_time
             login_log = LoginLog.objects.get(id=log_id)
+            previous_minutes = login_log.minutes
             now = datetime.now()
             login_log.logout_time = datetime.time(now)
             login_log.save()
+            LoginLogRollup.record_logout(login_log, previous_minutes)
         except LoginLog.DoesNotExist:
             pass
     if citizen_hash:
@@ -799,6 +850,7 @@ def sms_login_finalize(
             logout_time=datetime.time(now),
         )
         login_log.save()
+        LoginLogRollup.record_login(login_log)
         log_id = login_log.id
 
     return log_id
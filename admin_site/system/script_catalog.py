@@ -0,0 +1,95 @@
+"""The scripts shown in the script navigation of a site, grouped by tag.
+
+The catalog of a site depends on the scripts, their tags and the feature
+permissions of the customer. It is read with one query for the scripts and
+one for their tags, and cached for each site, customer and kind of script.
+Changes to scripts, their inputs and tags and to feature permissions bump a
+generation number, which is part of the cache keys, so that all catalogs
+are rebuilt.
+"""
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from system.models import FeaturePermission, Script
+
+GENERATION_KEY = "script_catalog_generation"
+
+# Changes bump the generation, so old catalogs are just left to expire
+SCRIPT_CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def invalidate_script_catalogs():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # The generation is unknown, so no catalog using it is cached
+        pass
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = 0
+        cache.add(GENERATION_KEY, generation, None)
+    return generation
+
+
+def _group_by_tag(scripts, tags):
+    """Return a dict of tag to its scripts for the tags that have any, in the
+    order of tags, followed by the scripts without tags as "untagged"."""
+    scripts_by_tag_id = {}
+    untagged = []
+    for script in scripts:
+        script_tags = script.tags.all()
+        if not script_tags:
+            untagged.append(script)
+        for tag in script_tags:
+            scripts_by_tag_id.setdefault(tag.id, []).append(script)
+    scripts_by_tag = {
+        tag: scripts_by_tag_id[tag.id] for tag in tags if tag.id in scripts_by_tag_id
+    }
+    if untagged:
+        scripts_by_tag["untagged"] = untagged
+    return scripts_by_tag
+
+
+def get_script_catalog(site, is_security):
+    """Return the scripts of site and the global scripts which the site may
+    see, as a dict with the lists local_scripts and global_scripts and the
+    dicts local_scripts_by_tag and global_scripts_by_tag."""
+    key = "script_catalog_{}_{}_{}_{}".format(
+        _generation(), site.id, site.customer_id, int(is_security)
+    )
+    catalog = cache.get(key)
+    if catalog is not None:
+        return catalog
+
+    feature_permissions = FeaturePermission.objects.filter(
+        customers=site.customer_id
+    ).values("id")
+    scripts = list(
+        Script.objects.filter(
+            Q(site=site) | Q(site=None),
+            Q(is_hidden=False) | Q(feature_permission__in=feature_permissions),
+            is_security_script=is_security,
+        )
+        .only("id", "name", "site", "is_security_script")
+        .prefetch_related("tags")
+        .order_by("name", "pk")
+    )
+    # Only the tags which are used are needed, and these are prefetched
+    tags = sorted(
+        {tag for script in scripts for tag in script.tags.all()},
+        key=lambda tag: (tag.name, tag.id),
+    )
+    local_scripts = [script for script in scripts if script.site_id is not None]
+    global_scripts = [script for script in scripts if script.site_id is None]
+    catalog = {
+        "local_scripts": local_scripts,
+        "global_scripts": global_scripts,
+        "local_scripts_by_tag": _group_by_tag(local_scripts, tags),
+        "global_scripts_by_tag": _group_by_tag(global_scripts, tags),
+    }
+    cache.set(key, catalog, SCRIPT_CATALOG_CACHE_TIMEOUT)
+    return catalog
@@ -0,0 +1,114 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from account.models import SiteMembership, UserProfile
+from system.access import invalidate_api_key, invalidate_site_memberships
+from system.models import (
+    APIKey,
+    Configuration,
+    ConfigurationEntry,
+    FeaturePermission,
+    Input,
+    PC,
+    Script,
+    ScriptTag,
+)
+from system.script_catalog import invalidate_script_catalogs
+from system.views import invalidate_site_pcs_stats
+
+
+def _owner_configuration(entry):
+    """The configuration of entry, or a stand-in for updating it if it isn't
+    loaded."""
+    if ConfigurationEntry.owner_configuration.is_cached(entry):
+        return entry.owner_configuration
+    return Configuration(pk=entry.owner_configuration_id)
+
+
+@receiver(post_save, sender=ConfigurationEntry)
+def set_configuration_data_entry(sender, instance, created, **kwargs):
+    """Set the key of a saved entry in the data document of its
+    configuration, rather than rebuilding the document for each entry."""
+    configuration = _owner_configuration(instance)
+    old_key = getattr(instance, "_loaded_key", None)
+    if created or old_key is not None:
+        configuration.set_data_entry(instance.key, instance.value, old_key)
+        instance._loaded_key = instance.key
+    else:
+        # The key the entry had is unknown
+        configuration.refresh_data()
+
+
+@receiver(post_delete, sender=ConfigurationEntry)
+def remove_configuration_data_entry(sender, instance, **kwargs):
+    """Remove the key of a deleted entry from the data document of its
+    configuration."""
+    _owner_configuration(instance).remove_data_entry(instance.key)
+
+
+@receiver(post_save, sender=SiteMembership)
+@receiver(post_delete, sender=SiteMembership)
+def clear_site_memberships(sender, instance, **kwargs):
+    """Clear the cached memberships of the user of a changed membership."""
+    user_id = (
+        UserProfile.objects.filter(pk=instance.user_profile_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+    if user_id is not None:
+        invalidate_site_memberships(user_id)
+
+
+@receiver(post_save, sender=Script)
+@receiver(post_delete, sender=Script)
+@receiver(post_save, sender=Input)
+@receiver(post_delete, sender=Input)
+@receiver(post_save, sender=ScriptTag)
+@receiver(post_delete, sender=ScriptTag)
+@receiver(post_save, sender=FeaturePermission)
+@receiver(post_delete, sender=FeaturePermission)
+@receiver(m2m_changed, sender=Script.tags.through)
+@receiver(m2m_changed, sender=FeaturePermission.customers.through)
+def clear_script_catalogs(sender, **kwargs):
+    """Rebuild the cached script catalogs after scripts, their inputs and
+    tags or the feature permissions have changed."""
+    if kwargs.get("action", "post_").startswith("post_"):
+        invalidate_script_catalogs()
+
+
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+def clear_api_key(sender, instance, **kwargs):
+    """Clear the cached site of a new, changed or deleted API key."""
+    invalidate_api_key(instance.key)
+
+
+@receiver(pre_save, sender=APIKey)
+def clear_replaced_api_key(sender, instance, **kwargs):
+    """Clear the cached site of the key an API key had if it is changed."""
+    if instance.pk:
+        old_key = APIKey.objects.filter(pk=instance.pk).values_list("key", flat=True)
+        old_key = old_key.first()
+        if old_key and old_key != instance.key:
+            invalidate_api_key(old_key)
+
+
+@receiver(post_save, sender=PC)
+def clear_site_pcs_stats(sender, instance, created, **kwargs):
+    """Clear the cached PC statistics of the site of a new PC, or of a PC
+    which has been registered, activated, deactivated or moved to another
+    site. Other changes, such as a PC checking in, keep them."""
+    activation = (instance.site_id, instance.is_activated, instance.is_preregistered)
+    loaded_activation = getattr(instance, "_loaded_activation", None)
+    if created or activation != loaded_activation:
+        site_ids = {instance.site_id}
+        if loaded_activation and loaded_activation[0] is not None:
+            site_ids.add(loaded_activation[0])
+        invalidate_site_pcs_stats(*site_ids)
+    instance._loaded_activation = activation
+
+
+@receiver(post_delete, sender=PC)
+def clear_deleted_pc_site_pcs_stats(sender, instance, **kwargs):
+    """Clear the cached PC statistics of the site of a deleted PC."""
+    invalidate_site_pcs_stats(instance.site_id)
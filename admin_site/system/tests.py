@@ -5,19 +5,114 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import json
 import os
+import random
+import secrets
+from types import SimpleNamespace
+from datetime import date, datetime, time, timedelta
 
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.mail import EmailMessage
-from django.contrib.auth.models import User
-from account.models import UserProfile
+from django.contrib.auth.models import AnonymousUser, User
+from account.models import SiteMembership, UserProfile
+from system.models import (
+    APIKey,
+    AssociatedScript,
+    Batch,
+    Configuration,
+    ConfigurationEntry,
+    Customer,
+    EventLevels,
+    FAIL,
+    FeaturePermission,
+    Input,
+    Job,
+    JobLog,
+    LoginLog,
+    LoginLogRollup,
+    MandatoryParameterMissingError,
+    OK,
+    PC,
+    PCDailyLogins,
+    PCGroup,
+    Script,
+    ScriptTag,
+    SecurityEvent,
+    SecurityEventCounter,
+    SecurityProblem,
+    Site,
+    Tombstone,
+    WakeChangeEvent,
+    WakeWeekPlan,
+)
+from system import api_pagination
+from system.access import get_api_key_site, get_site_memberships
+from system.exports import JOB_COLUMNS
+from system.pagination import KeysetPaginator
+from system.registration import (
+    computer_uid,
+    preregister_computers,
+    read_preregistration_csv,
+)
+from system.rpc import (
+    ComputerExistsError,
+    push_config_keys,
+    register_new_computer_v2,
+)
+from system.partitioning import create_partitions, drop_partitions_before, month_start
+from system.script_catalog import get_script_catalog
+from system.views import (
+    JobExport,
+    JobSearch,
+    LoginLogExport,
+    PCSearch,
+    site_pcs_stats,
+)
+from system.wake_plans import (
+    find_overlapping_event,
+    non_overlapping_events,
+    pcs_in_other_plans,
+    plan_pc_ids,
+    verify_pc_groups,
+    verify_plan_events,
+    verify_plan_groups,
+)
 
 print("FILE", os.path.dirname(__file__))
 
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+# The settings only cache with a shared Redis server
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_site(**kwargs):
+    return Site.objects.create(
+        name="Test",
+        uid="test",
+        configuration=Configuration.objects.create(name="site"),
+        **kwargs,
+    )
+
+
+def create_pc(site, name, **kwargs):
+    kwargs.setdefault("uid", name)
+    return PC.objects.create(
+        name=name,
+        site=site,
+        configuration=Configuration.objects.create(name=name),
+        **kwargs,
+    )
+
 
 # setup account_userprofile, auth_user, securityproblem
 class SimpleTest(TestCase):
@@ -53,3 +148,1332 @@ class SimpleTest(TestCase):
 
         self.assertEqual(len(email_list), 2)
         self.assertEqual(message.send(), 1)
+
+
+class JobLogTest(TestCase):
+    def setUp(self):
+        site = create_site()
+        pc = create_pc(site, "pc")
+        script = Script.objects.create(name="script", site=site)
+        batch = Batch.objects.create(name="", script=script, site=site)
+        self.job = Job.objects.create(batch=batch, pc=pc)
+
+    def test_new_jobs_have_no_log(self):
+        pc = self.job.pc
+        # The batch, the inputs of the script and the job, but no log
+        with self.assertNumQueries(3):
+            batch = self.job.batch.script.run_on(pc.site, [pc], user=None)
+        job = batch.jobs.get()
+        self.assertFalse(job.has_log)
+        self.assertFalse(JobLog.objects.filter(job=job).exists())
+        self.assertEqual(job.append_log("ok", 0), 2)
+        self.assertEqual(JobLog.objects.get(job=job).output, "ok")
+
+    def test_append_log_is_idempotent(self):
+        self.assertEqual(self.job.append_log("abc", 0), 3)
+        # A resent chunk is ignored, an overlapping one only adds the new part
+        self.assertEqual(self.job.append_log("abc", 0), 3)
+        self.assertEqual(self.job.append_log("cdæ", 2), 6)
+        # A chunk starting after the end of the log is rejected
+        self.assertEqual(self.job.append_log("xyz", 10), 6)
+
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual(job.log_output, "abcdæ")
+        self.assertEqual(job.log_length, 6)
+        self.assertTrue(job.has_log)
+
+    def test_append_log_overlapping_inside_a_character(self):
+        self.assertEqual(self.job.append_log("aæ", 0), 3)
+        # The overlap ends inside "æ", so only "b" is new
+        self.assertEqual(self.job.append_log("æb", 2), 4)
+        self.assertEqual(Job.objects.get(pk=self.job.pk).log_output, "aæb")
+
+    def test_read_chunk_does_not_split_characters(self):
+        self.job.set_log_output("aæb")
+        self.assertEqual(JobLog.read_chunk(self.job, 0, 2), ("a", 1))
+        self.assertEqual(JobLog.read_chunk(self.job, 1, 10), ("æb", 4))
+        # An offset inside a character starts at the next one
+        self.assertEqual(JobLog.read_chunk(self.job, 2, 10), ("b", 4))
+        self.assertEqual(JobLog.read_chunk(self.job, 4, 10), ("", 4))
+
+
+class ConfigurationDataTest(TestCase):
+    def test_data_follows_entries(self):
+        configuration = Configuration.objects.create(name="test")
+        configuration.update_entry("a", "1")
+        configuration.update_entry("b", "2")
+        configuration.update_entry("a", "3")
+        configuration.remove_entry("b")
+
+        self.assertEqual(configuration.data, {"a": "3"})
+        self.assertEqual(
+            Configuration.objects.get(pk=configuration.pk).data, {"a": "3"}
+        )
+        self.assertEqual(configuration.get("a"), "3")
+        self.assertEqual(configuration.get("b", "default"), "default")
+        with self.assertRaises(ConfigurationEntry.DoesNotExist):
+            configuration.get("b")
+
+    def test_saving_an_entry_only_changes_its_key(self):
+        configuration = Configuration.objects.create(name="test")
+        configuration.write_entries({"a": "1", "b": "2"})
+        # The entry is inserted and its key set in data, which isn't rebuilt
+        with self.assertNumQueries(2):
+            ConfigurationEntry.objects.create(
+                owner_configuration=configuration, key="c", value="3"
+            )
+        # A renamed entry leaves its old key
+        entry = configuration.entries.get(key="a")
+        entry.key = "d"
+        entry.save()
+        self.assertEqual(
+            Configuration.objects.get(pk=configuration.pk).data,
+            {"b": "2", "c": "3", "d": "1"},
+        )
+        entry.delete()
+        self.assertEqual(configuration.data, {"b": "2", "c": "3"})
+        self.assertEqual(
+            Configuration.objects.get(pk=configuration.pk).data, {"b": "2", "c": "3"}
+        )
+
+    def test_write_entries(self):
+        configuration = Configuration.objects.create(name="test")
+        configuration.write_entries({"a": "1", "b": "2", "c": "3"})
+        a = configuration.entries.get(key="a")
+
+        configuration.write_entries({"a": "4", "d": 5}, remove=["b", "x"])
+        self.assertEqual(configuration.data, {"a": "4", "c": "3", "d": "5"})
+        # Entries are updated, not replaced
+        self.assertEqual(configuration.entries.get(key="a").pk, a.pk)
+
+        # Nothing to change, nothing written
+        with self.assertNumQueries(1):
+            configuration.write_entries({"a": "4"})
+
+        request = RequestFactory().post(
+            "/",
+            {
+                "config": [str(a.pk), "new_1"],
+                f"config_{a.pk}_key": "a",
+                f"config_{a.pk}_value": "6",
+                "config_new_1_key": ["e", "f"],
+                "config_new_1_value": ["7", "8"],
+            },
+        )
+        configuration.update_from_request(request.POST, "config")
+        self.assertEqual(
+            Configuration.objects.get(pk=configuration.pk).data,
+            {"a": "6", "e": "7", "f": "8"},
+        )
+
+        # The entries left out are deleted in one statement, without loading
+        # them or rebuilding data for each: reading the entries, a savepoint,
+        # locking the configuration and reading the entries again, the
+        # delete, update and insert, locking the configuration, rebuilding and
+        # reading back data and releasing the savepoint
+        configuration.write_entries({"x": "9", "y": "10"})
+        with self.assertNumQueries(11):
+            configuration.write_entries({"a": "11", "g": "12"}, replace=True)
+        self.assertEqual(configuration.data, {"a": "11", "g": "12"})
+
+    def test_update_from_request_updates_pc_inventory(self):
+        configuration = Configuration.objects.create(name="pc")
+        site = create_site()
+        pc = PC.objects.create(
+            name="pc", uid="pc", site=site, configuration=configuration
+        )
+        request = RequestFactory().post(
+            "/",
+            {
+                "config": ["new_1"],
+                "config_new_1_key": ["_os_release", "_ip_addresses"],
+                "config_new_1_value": ["22.04", "10.0.0.1"],
+            },
+        )
+        configuration.update_from_request(request.POST, "config")
+        pc.refresh_from_db()
+        self.assertEqual((pc.os_release, pc.ip_addresses), ("22.04", "10.0.0.1"))
+
+
+class PushConfigKeysTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.pc = create_pc(self.site, "pc", is_activated=True)
+
+    def test_inventory_follows_the_configuration(self):
+        push_config_keys("pc", {"_os_release": "22.04", "_ip_addresses": "10.0.0.1"})
+        pc = PC.objects.get(pk=self.pc.pk)
+        self.assertEqual((pc.os_release, pc.ip_addresses), ("22.04", "10.0.0.1"))
+        self.assertEqual(pc.configuration.data["_os_release"], "22.04")
+
+
+class PCDailyLoginsTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.pcs = [create_pc(self.site, f"pc{i}", is_activated=True) for i in range(2)]
+
+    def counts(self, pc):
+        return dict(pc.daily_logins.values_list("date", "count"))
+
+    def test_ingest_updates_stored_days(self):
+        PCDailyLogins.ingest(self.pcs[0], "2024-01-01: 3, 2024-01-02: 4, wrong")
+        PCDailyLogins.ingest(self.pcs[0], "2024-01-02: 5,2024-01-03:1")
+        self.assertEqual(
+            self.counts(self.pcs[0]),
+            {date(2024, 1, 1): 3, date(2024, 1, 2): 5, date(2024, 1, 3): 1},
+        )
+
+    def test_pushed_login_counts_are_ingested(self):
+        push_config_keys("pc0", {"login_counts": "2024-01-01: 3"})
+        push_config_keys("pc0", {"login_counts": "2024-01-01: 4, 2024-01-02: 1"})
+        self.assertEqual(
+            self.counts(self.pcs[0]), {date(2024, 1, 1): 4, date(2024, 1, 2): 1}
+        )
+
+    def test_summary(self):
+        PCDailyLogins.ingest(self.pcs[0], "2024-01-01: 3, 2024-01-02: 4")
+        PCDailyLogins.ingest(self.pcs[1], "2024-01-01: 1")
+        # Logins on PCs which aren't activated are left out
+        inactive_pc = create_pc(self.site, "inactive")
+        PCDailyLogins.ingest(inactive_pc, "2024-01-01: 10")
+        api_key = APIKey.objects.create(key=secrets.token_urlsafe(), site=self.site)
+        response = self.client.get(
+            "/api/system/computers/logins-per-day/summary",
+            headers={"Authorization": f"Bearer {api_key.key}"},
+        )
+        self.assertEqual(
+            response.json(),
+            [
+                {"date": "2024-01-01", "total_logins": 4, "average_logins": 2.0},
+                {"date": "2024-01-02", "total_logins": 4, "average_logins": 4.0},
+            ],
+        )
+
+    def test_old_counts_are_removed(self):
+        today = date.today()
+        PCDailyLogins.ingest(
+            self.pcs[0], f"{today - timedelta(days=400)}: 3, {today}: 4"
+        )
+        call_command("clean_up_database")
+        self.assertEqual(self.counts(self.pcs[0]), {today: 4})
+
+
+class LoginLogRollupTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+
+    def log_session(self, identifier, login_time, logout_time):
+        login_log = LoginLog.objects.create(
+            identifier=identifier,
+            site=self.site,
+            date=date(2024, 1, 1),
+            login_time=login_time,
+            logout_time=login_time,
+        )
+        LoginLogRollup.record_login(login_log)
+        previous_minutes = login_log.minutes
+        login_log.logout_time = logout_time
+        login_log.save()
+        LoginLogRollup.record_logout(login_log, previous_minutes)
+
+    def rollup_values(self):
+        return list(
+            LoginLogRollup.objects.order_by("period", "start").values_list(
+                "period", "start", "sessions", "unique_identifiers", "minutes"
+            )
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        self.log_session("a", time(10, 0), time(10, 30))
+        self.log_session("a", time(10, 40), time(11, 10))
+        self.log_session("b", time(11, 0), time(11, 5))
+
+        incremental = self.rollup_values()
+        self.assertIn((LoginLogRollup.DAY, datetime(2024, 1, 1), 3, 2, 65), incremental)
+        self.assertIn(
+            (LoginLogRollup.HOUR, datetime(2024, 1, 1, 10), 2, 1, 60), incremental
+        )
+
+        LoginLogRollup.rebuild(date(2024, 1, 1), date(2024, 1, 1))
+        self.assertEqual(self.rollup_values(), incremental)
+
+
+class PartitioningTest(TestCase):
+    def setUp(self):
+        create_partitions(SecurityEvent, 2)
+        create_partitions(LoginLog, 2)
+        self.start = month_start(date.today(), 2)
+        self.end = month_start(date.today(), 3)
+
+    def test_security_event_queries_only_scan_matching_partitions(self):
+        plan = SecurityEvent.objects.filter(
+            occurred_time__gte=self.start, occurred_time__lt=self.end
+        ).explain()
+        self.assertIn(f"system_securityevent_p{self.start:%Y%m}", plan)
+        self.assertNotIn("system_securityevent_legacy", plan)
+        self.assertNotIn("system_securityevent_default", plan)
+
+    def test_login_log_queries_only_scan_matching_partitions(self):
+        plan = LoginLog.objects.filter(date=self.start).explain()
+        self.assertIn(f"system_loginlog_p{self.start:%Y%m}", plan)
+        self.assertNotIn("system_loginlog_legacy", plan)
+        self.assertNotIn("system_loginlog_default", plan)
+
+    def test_drop_partitions_before(self):
+        dropped = drop_partitions_before(SecurityEvent, self.end)
+        self.assertIn(f"system_securityevent_p{self.start:%Y%m}", dropped)
+        self.assertIn("system_securityevent_legacy", dropped)
+
+    def test_partitions_with_rows_to_keep_are_not_dropped(self):
+        site = create_site()
+        script = Script.objects.create(name="script", site=site)
+        problem = SecurityProblem.objects.create(
+            name="problem", level=EventLevels.HIGH, site=site, security_script=script
+        )
+        # Reported after the cutoff
+        SecurityEvent.objects.create(
+            problem=problem,
+            pc=create_pc(site, "pc"),
+            occurred_time=self.start,
+            reported_time=self.end,
+            summary="summary",
+        )
+        dropped = drop_partitions_before(SecurityEvent, self.end, "reported_time")
+        self.assertNotIn(f"system_securityevent_p{self.start:%Y%m}", dropped)
+        self.assertIn("system_securityevent_legacy", dropped)
+        self.assertEqual(SecurityEvent.objects.count(), 1)
+
+    def test_dropped_events_leave_tombstones(self):
+        site = create_site()
+        script = Script.objects.create(name="script", site=site)
+        problem = SecurityProblem.objects.create(
+            name="problem", level=EventLevels.HIGH, site=site, security_script=script
+        )
+        event = SecurityEvent.objects.create(
+            problem=problem,
+            pc=create_pc(site, "pc"),
+            occurred_time=self.start,
+            reported_time=self.start,
+            summary="summary",
+        )
+        drop_partitions_before(SecurityEvent, self.end, "reported_time")
+        self.assertFalse(SecurityEvent.objects.exists())
+        self.assertQuerySetEqual(
+            Tombstone.objects.values_list("model", "object_id", "site"),
+            [(Tombstone.SECURITY_EVENT, event.id, site.id)],
+        )
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        site = create_site()
+        pc = create_pc(site, "pc")
+        script = Script.objects.create(name="script", site=site)
+        batch = Batch.objects.create(name="", script=script, site=site)
+        # Ties and NULLs in the ordering field must not lose or repeat rows
+        Job.objects.bulk_create(
+            Job(
+                batch=batch,
+                pc=pc,
+                started=None if i % 7 == 0 else datetime(2024, 1, 1 + i % 5),
+            )
+            for i in range(45)
+        )
+        self.queryset = Job.objects.order_by("-started", "pk")
+
+    def test_pages_follow_the_ordering(self):
+        expected = list(self.queryset.values_list("pk", flat=True))
+        paginator = KeysetPaginator(self.queryset, 10)
+        self.assertEqual(paginator.count, 45)
+
+        page = paginator.page(None)
+        pages = [[job.pk for job in page]]
+        while page.has_next():
+            page = paginator.page(page.next_page_number())
+            pages.append([job.pk for job in page])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(page.number, 5)
+
+        while page.has_previous():
+            page = paginator.page(page.previous_page_number())
+            self.assertEqual([job.pk for job in page], pages[page.number - 1])
+        self.assertEqual(page.number, 1)
+
+    def test_page_numbers_and_capped_count(self):
+        paginator = KeysetPaginator(self.queryset, 10, count_limit=30)
+        self.assertEqual(paginator.count, 30)
+        self.assertTrue(paginator.count_is_estimate)
+        page = paginator.page("3")
+        self.assertEqual(
+            [job.pk for job in page],
+            list(self.queryset.values_list("pk", flat=True)[20:30]),
+        )
+        self.assertEqual(paginator.page("not a cursor").number, 1)
+
+
+class JobSearchTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        other_user = User.objects.create_user("user", "user@example.com", "x")
+        script = Script.objects.create(name="script", site=self.site)
+        batch = Batch.objects.create(name="", script=script, site=self.site)
+        for i in range(3):
+            pc = create_pc(self.site, f"pc{i}")
+            Job.objects.bulk_create(
+                Job(batch=batch, pc=pc, user=[None, self.user, other_user][i])
+                for _j in range(15)
+            )
+
+    def get_page(self, page_size):
+        request = RequestFactory().get(reverse("jobsearch", args=[self.site.uid]))
+        request.user = self.user
+        view = JobSearch.as_view(paginate_by=page_size)
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, slug=self.site.uid)
+            data = json.loads(b"".join(response.streaming_content))
+        return data, len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        small_page, small_queries = self.get_page(5)
+        large_page, large_queries = self.get_page(40)
+        self.assertEqual(len(small_page["results"]), 5)
+        self.assertEqual(len(large_page["results"]), 40)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_results(self):
+        page, _queries = self.get_page(45)
+        job = Job.objects.select_related("pc", "batch__script").get(
+            pk=page["results"][0]["pk"]
+        )
+        result = page["results"][0]
+        self.assertEqual(
+            result["pc_url"], reverse("computer", args=["test", job.pc.uid])
+        )
+        self.assertEqual(
+            result["script_url"],
+            reverse("script", args=["test", job.batch.script.id]),
+        )
+        self.assertEqual(
+            result["restart_url"], reverse("restart_job", args=["test", job.pk])
+        )
+        self.assertEqual(
+            {(result["user"], result["user_url"]) for result in page["results"]},
+            {
+                ("", ""),
+                ("Admin", reverse("doc", kwargs={"name": "jobs"})),
+                ("user", reverse("user", args=["test", "user"])),
+            },
+        )
+
+    def export(self, view, name, user, **params):
+        request = RequestFactory().get(reverse(name, args=[self.site.uid]), params)
+        request.user = user
+        return view.as_view()(request, slug=self.site.uid)
+
+    def test_export_is_only_for_users_of_the_site(self):
+        other_site = Site.objects.create(
+            name="Other",
+            uid="other",
+            configuration=Configuration.objects.create(name="other"),
+        )
+        other_user = User.objects.create_user("other", "other@example.com", "x")
+        SiteMembership.objects.create(
+            site=other_site,
+            user_profile=UserProfile.objects.create(user=other_user),
+            site_user_type=SiteMembership.SITE_ADMIN,
+        )
+        for user in [AnonymousUser(), other_user]:
+            with self.subTest(user):
+                response = self.export(JobExport, "job_export", user)
+                self.assertEqual(response.status_code, 302)
+                self.assertFalse(response.streaming)
+
+    def test_login_log_export_rejects_impossible_dates(self):
+        response = self.export(
+            LoginLogExport, "login_log_export", self.user, from_date="2024-02-30"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_has_the_filtered_jobs(self):
+        done = list(Job.objects.order_by("pk")[:10])
+        Job.objects.filter(pk__in=[job.pk for job in done]).update(status=Job.DONE)
+        request = RequestFactory().get(
+            reverse("job_export", args=[self.site.uid]),
+            {"status": Job.DONE, "orderby": "pk", "format": "csv"},
+        )
+        request.user = self.user
+        response = JobExport.as_view()(request, slug=self.site.uid)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(name for name, _field in JOB_COLUMNS))
+        self.assertEqual(
+            [int(line.split(",")[0]) for line in lines[1:]], [job.pk for job in done]
+        )
+
+
+class SecurityEventCounterTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.pc = create_pc(self.site, "pc")
+        script = Script.objects.create(name="script", site=self.site)
+        self.problem = SecurityProblem.objects.create(
+            name="problem",
+            level=EventLevels.HIGH,
+            site=self.site,
+            security_script=script,
+        )
+
+    def create_events(self, count, status=SecurityEvent.NEW):
+        now = datetime.now()
+        SecurityEvent.objects.bulk_create(
+            SecurityEvent(
+                problem=self.problem,
+                pc=self.pc,
+                occurred_time=now,
+                reported_time=now,
+                summary="summary",
+                status=status,
+            )
+            for _i in range(count)
+        )
+
+    def assertCounted(self, expected):
+        counted = SecurityEventCounter.outstanding_for_site(self.site)
+        self.assertEqual(counted, expected)
+        self.assertEqual(
+            counted,
+            SecurityEvent.objects.priority_events_for_site(self.site).count(),
+        )
+
+    def test_counter_follows_events(self):
+        self.create_events(3)
+        self.create_events(2, status=SecurityEvent.RESOLVED)
+        self.assertCounted(3)
+
+        events = SecurityEvent.objects.filter(problem=self.problem)
+        events.filter(status=SecurityEvent.NEW).first().delete()
+        self.assertCounted(2)
+        events.update(status=SecurityEvent.ASSIGNED)
+        self.assertCounted(4)
+
+        self.problem.level = EventLevels.NORMAL
+        self.problem.save()
+        self.assertCounted(0)
+        self.problem.level = EventLevels.CRITICAL
+        self.problem.save()
+        self.assertCounted(4)
+
+        self.pc.delete()
+        self.assertCounted(0)
+
+    def test_reconcile(self):
+        self.create_events(3)
+        SecurityEventCounter.objects.filter(site=self.site).update(outstanding=7)
+        self.assertEqual(SecurityEventCounter.reconcile(), {self.site.id: (7, 3)})
+        self.assertCounted(3)
+        self.assertEqual(SecurityEventCounter.reconcile(), {})
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SiteAccessTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.user = User.objects.create_user("user", "user@example.com", "x")
+        user_profile = UserProfile.objects.create(user=self.user)
+        SiteMembership.objects.create(
+            site=self.site,
+            user_profile=user_profile,
+            site_user_type=SiteMembership.SITE_ADMIN,
+        )
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=[self.site.uid]))
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries]
+
+    def test_site_is_looked_up_once(self):
+        for name in ["site", "computers", "jobs", "security_events"]:
+            with self.subTest(name):
+                queries = self.get(name)
+                self.assertEqual(
+                    len([q for q in queries if '"system_site"."uid" =' in q]), 1
+                )
+
+    def test_memberships_are_read_once_per_request(self):
+        get_site_memberships(self.user)
+        with self.assertNumQueries(0):
+            memberships = get_site_memberships(self.user)
+        self.assertEqual(
+            [site_user_type for _id, _profile, site_user_type in memberships.values()],
+            [SiteMembership.SITE_ADMIN],
+        )
+
+    def test_memberships_are_cached(self):
+        self.get("site")
+        with self.assertNumQueries(0):
+            get_site_memberships(User.objects.get(pk=self.user.pk))
+        SiteMembership.objects.create(
+            site=create_site(uid="other"),
+            user_profile=self.user.user_profile,
+            site_user_type=SiteMembership.SITE_USER,
+        )
+        memberships = get_site_memberships(User.objects.get(pk=self.user.pk))
+        self.assertEqual(len(memberships), 2)
+
+    def test_membership_changes_are_seen(self):
+        self.get("site")
+        SiteMembership.objects.filter(user_profile__user=self.user).delete()
+        response = self.client.get(reverse("site", args=[self.site.uid]))
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ScriptCatalogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.site = create_site(customer=Customer.objects.create(name="Customer"))
+        self.tag = ScriptTag.objects.create(name="tag")
+        self.local_script = Script.objects.create(name="local", site=self.site)
+        self.local_script.tags.add(self.tag)
+        self.global_script = Script.objects.create(name="global")
+        self.hidden_script = Script.objects.create(name="hidden", is_hidden=True)
+
+    def test_catalog(self):
+        catalog = get_script_catalog(self.site, False)
+        self.assertEqual(
+            catalog["local_scripts_by_tag"], {self.tag: [self.local_script]}
+        )
+        self.assertEqual(
+            catalog["global_scripts_by_tag"], {"untagged": [self.global_script]}
+        )
+        with self.assertNumQueries(0):
+            get_script_catalog(self.site, False)
+        # The scripts and their tags
+        with self.assertNumQueries(2):
+            get_script_catalog(self.site, True)
+
+    def test_feature_permissions_and_changes_are_seen(self):
+        get_script_catalog(self.site, False)
+        feature_permission = FeaturePermission.objects.create(name="fp", uid="fp")
+        feature_permission.customers.add(self.site.customer)
+        self.hidden_script.feature_permission = feature_permission
+        self.hidden_script.save()
+        catalog = get_script_catalog(self.site, False)
+        self.assertEqual(
+            catalog["global_scripts"], [self.global_script, self.hidden_script]
+        )
+        feature_permission.customers.remove(self.site.customer)
+        catalog = get_script_catalog(self.site, False)
+        self.assertEqual(catalog["global_scripts"], [self.global_script])
+
+
+class PCSearchTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        for name, location, is_activated in [
+            ("library-1", "Main library", True),
+            ("library-2", "Main library", False),
+            ("office", "Library office", True),
+            ("kiosk", "Town hall", True),
+        ]:
+            create_pc(
+                self.site,
+                name,
+                uid=f"uid-{name}",
+                location=location,
+                is_activated=is_activated,
+            )
+
+    def search(self, user=None, **params):
+        request = RequestFactory().get(
+            reverse("pc_search", args=[self.site.uid]), params
+        )
+        request.user = user or self.user
+        view = PCSearch.as_view(paginate_by=2)
+        return view(request, slug=self.site.uid)
+
+    def search_results(self, **params):
+        return json.loads(self.search(**params).content)
+
+    def test_anonymous_users_get_no_results(self):
+        response = self.search(user=AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(b"uid-", response.content)
+
+    def test_users_of_other_sites_get_no_results(self):
+        other_site = Site.objects.create(
+            name="Other",
+            uid="other",
+            configuration=Configuration.objects.create(name="other"),
+        )
+        user = User.objects.create_user("other", "other@example.com", "x")
+        SiteMembership.objects.create(
+            site=other_site,
+            user_profile=UserProfile.objects.create(user=user),
+            site_user_type=SiteMembership.SITE_ADMIN,
+        )
+        response = self.search(user=user)
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(b"uid-", response.content)
+
+    def test_prefix_matches_come_first(self):
+        page = self.search_results(q="LIBRARY")
+        self.assertEqual(
+            [pc["name"] for pc in page["results"]], ["library-1", "library-2"]
+        )
+        self.assertTrue(page["has_next"])
+        page = self.search_results(q="LIBRARY", page=page["next_page_number"])
+        self.assertEqual([pc["name"] for pc in page["results"]], ["office"])
+        self.assertEqual(
+            page["results"][0]["url"], reverse("computer", args=["test", "uid-office"])
+        )
+
+    def test_activated(self):
+        page = self.search_results(q="library", activated=1)
+        self.assertEqual(
+            [pc["name"] for pc in page["results"]], ["library-1", "office"]
+        )
+
+
+class PCStatusTest(TestCase):
+    def setUp(self):
+        site = create_site()
+        batch = Batch.objects.create(
+            name="", script=Script.objects.create(name="script", site=site), site=site
+        )
+        for name, status in [("failed", Job.FAILED), ("done", Job.DONE)]:
+            pc = create_pc(site, name, is_activated=True)
+            Job.objects.create(batch=batch, pc=pc, status=status)
+
+    def test_status_uses_annotation(self):
+        pcs = list(PC.objects.with_status().order_by("name"))
+        with self.assertNumQueries(0):
+            states = [pc.status.state for pc in pcs]
+        self.assertEqual(states, [OK, FAIL])
+
+    def test_status_without_annotation(self):
+        self.assertEqual(PC.objects.get(uid="failed").status.state, FAIL)
+        self.assertEqual(PC.objects.get(uid="done").status.state, OK)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SitePCsStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.site = create_site()
+        self.pc = create_pc(self.site, "pc")
+
+    def counts(self):
+        context = site_pcs_stats({}, [self.site])
+        return context["total_pcs_count"], context["activated_pcs_count"]
+
+    def test_stats_are_cached(self):
+        self.assertEqual(self.counts(), (1, 0))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), (1, 0))
+        # A PC checking in keeps the statistics
+        pc = PC.objects.get(pk=self.pc.pk)
+        pc.last_seen = datetime.now()
+        pc.save()
+        with self.assertNumQueries(0):
+            self.counts()
+
+    def test_activation_and_deletion_clear_stats(self):
+        self.counts()
+        pc = PC.objects.get(pk=self.pc.pk)
+        pc.is_activated = True
+        pc.save()
+        self.assertEqual(self.counts(), (1, 1))
+        create_pc(self.site, "other")
+        self.assertEqual(self.counts(), (2, 1))
+        pc.delete()
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_preregistered_pcs_are_left_out(self):
+        pc = create_pc(self.site, "preregistered", is_preregistered=True)
+        self.assertEqual(self.counts(), (1, 0))
+        # Registering the PC clears the statistics
+        pc = PC.objects.get(pk=pc.pk)
+        pc.is_preregistered = False
+        pc.save()
+        self.assertEqual(self.counts(), (2, 0))
+
+
+class WakePlanMembershipTest(TestCase):
+    """Compare the wake plan membership functions with the logic the views
+    used before, which looked at the groups of each PC in turn."""
+
+    def setUp(self):
+        rng = random.Random(42)
+        site = create_site()
+        self.plans = [
+            WakeWeekPlan.objects.create(name=f"plan{i}", site=site) for i in range(3)
+        ]
+        self.groups = [
+            PCGroup.objects.create(
+                name=f"group{i}",
+                site=site,
+                wake_week_plan=rng.choice(self.plans + [None]),
+            )
+            for i in range(8)
+        ]
+        self.pcs = []
+        for i in range(30):
+            pc = create_pc(site, f"pc{i}")
+            pc.pc_groups.set(rng.sample(self.groups, rng.randint(0, 3)))
+            self.pcs.append(pc)
+        self.rng = rng
+
+    def old_verify_plan_groups(self, plan, groups_pk):
+        groups = PCGroup.objects.filter(pk__in=groups_pk)
+        pcs_in_groups = PC.objects.filter(
+            pk__in=set(groups.values_list("pcs", flat=True))
+        )
+        blocked = set()
+        for pc in pcs_in_groups:
+            for group in pc.pc_groups.exclude(pk__in=groups_pk):
+                if group.wake_week_plan and group.wake_week_plan != plan:
+                    blocked.add(pc.pk)
+                    break
+        blocked_pcs = PC.objects.filter(pk__in=blocked)
+        verified = {
+            group.pk
+            for group in groups
+            if not blocked_pcs.intersection(group.pcs.all())
+        }
+        return verified, blocked
+
+    def old_plan_pcs(self, plan, exclude_group_pk=None):
+        pcs = PC.objects.none()
+        for group in plan.groups.exclude(pk=exclude_group_pk):
+            pcs = pcs.union(group.pcs.all())
+        return {pc.pk for pc in pcs}
+
+    def old_verify_pc_groups(self, pc, selected_groups):
+        groups_pre = pc.pc_groups.all()
+        verified_groups = selected_groups.intersection(groups_pre)
+        unverified_groups = selected_groups.difference(groups_pre).order_by("name")
+        previous_wake_plan = next(
+            (g.wake_week_plan for g in groups_pre if g.wake_week_plan), None
+        )
+        wake_plan = next(
+            (g.wake_week_plan for g in verified_groups if g.wake_week_plan), None
+        )
+        run_wake_plan = False
+        invalid = set()
+        verified = {g.pk for g in verified_groups}
+        for group in unverified_groups:
+            if wake_plan and group.wake_week_plan and wake_plan != group.wake_week_plan:
+                invalid.add(group.pk)
+                continue
+            elif wake_plan is None and group.wake_week_plan:
+                wake_plan = group.wake_week_plan
+                run_wake_plan = wake_plan != previous_wake_plan
+            verified.add(group.pk)
+        return verified, invalid, wake_plan, run_wake_plan
+
+    def test_verify_plan_groups(self):
+        for _i in range(20):
+            plan = self.rng.choice(self.plans)
+            selected = [g.pk for g in self.rng.sample(self.groups, 3)]
+            verified, blocked = self.old_verify_plan_groups(plan, selected)
+            result = verify_plan_groups(plan, selected)
+            self.assertEqual({g.pk for g in result.verified}, verified)
+            self.assertEqual(set(result.blocked), blocked)
+            self.assertEqual(
+                result.verified_pc_ids,
+                set(
+                    PC.objects.filter(pc_groups__in=verified).values_list(
+                        "pk", flat=True
+                    )
+                ),
+            )
+
+    def test_pcs_in_other_plans(self):
+        for group in self.groups:
+            if not group.wake_week_plan:
+                continue
+            pcs = self.rng.sample(self.pcs, 10)
+            expected = {
+                pc.pk
+                for pc in pcs
+                if any(
+                    g.wake_week_plan and g.wake_week_plan != group.wake_week_plan
+                    for g in pc.pc_groups.exclude(pk=group.pk)
+                )
+            }
+            blocked = pcs_in_other_plans(
+                [pc.pk for pc in pcs],
+                group.wake_week_plan,
+                exclude_group_ids=[group.pk],
+            )
+            self.assertEqual(set(blocked), expected)
+
+    def test_plan_pc_ids(self):
+        for plan in self.plans:
+            self.assertEqual(plan_pc_ids(plan), self.old_plan_pcs(plan))
+            group = plan.groups.first()
+            if group:
+                self.assertEqual(
+                    plan_pc_ids(plan, exclude_group_ids=[group.pk]),
+                    self.old_plan_pcs(plan, group.pk),
+                )
+
+    def test_verify_pc_groups(self):
+        for pc in self.pcs:
+            selected = PCGroup.objects.filter(
+                pk__in=[g.pk for g in self.rng.sample(self.groups, 3)]
+            )
+            verified, invalid, wake_plan, run_wake_plan = self.old_verify_pc_groups(
+                pc, selected
+            )
+            result = verify_pc_groups(pc, selected)
+            self.assertEqual({g.pk for g in result.verified}, verified)
+            self.assertEqual({g.pk for g in result.invalid}, invalid)
+            self.assertEqual(result.wake_plan, wake_plan)
+            self.assertEqual(result.joins_wake_plan, run_wake_plan)
+
+    def test_query_count(self):
+        plan = self.plans[0]
+        with self.assertNumQueries(3):
+            verify_plan_groups(plan, [g.pk for g in self.groups])
+        with self.assertNumQueries(2):
+            verify_pc_groups(self.pcs[0], PCGroup.objects.all())
+
+
+def old_events_overlap(a, b):
+    """The overlap check the wake plan views used to do."""
+    return (
+        a.date_start <= b.date_start <= a.date_end
+        or a.date_start <= b.date_end <= a.date_end
+        or b.date_start <= a.date_start <= b.date_end
+    )
+
+
+def random_event(rng, name):
+    date_start = date(2024, 1, 1) + timedelta(days=rng.randint(0, 365))
+    date_end = date_start + timedelta(days=rng.choice([0, 0, 1, 2, 7, 30]))
+    return SimpleNamespace(name=name, date_start=date_start, date_end=date_end)
+
+
+class NonOverlappingEventsTest(SimpleTestCase):
+    """Compare the sweep with the nested loop checking each new exception
+    against the exceptions verified so far."""
+
+    def old_non_overlapping_events(self, verified, candidates):
+        verified = list(verified)
+        accepted = []
+        rejected = []
+        for event in candidates:
+            if any(old_events_overlap(other, event) for other in verified):
+                rejected.append(event)
+            else:
+                verified.append(event)
+                accepted.append(event)
+        return accepted, rejected
+
+    def test_matches_nested_loop(self):
+        rng = random.Random(1)
+        for _i in range(500):
+            verified = [random_event(rng, f"v{j}") for j in range(rng.randint(0, 8))]
+            candidates = [random_event(rng, f"c{j}") for j in range(rng.randint(0, 30))]
+            self.assertEqual(
+                non_overlapping_events(verified, candidates),
+                self.old_non_overlapping_events(verified, candidates),
+            )
+
+    def test_dates_are_included(self):
+        verified = [random_event(random.Random(2), "v")]
+        (event,) = verified
+        touching = SimpleNamespace(
+            name="c", date_start=event.date_end, date_end=event.date_end
+        )
+        after = SimpleNamespace(
+            name="d",
+            date_start=event.date_end + timedelta(days=1),
+            date_end=event.date_end + timedelta(days=1),
+        )
+        self.assertEqual(
+            non_overlapping_events(verified, [touching, after]), ([after], [touching])
+        )
+
+
+class WakePlanEventsTest(TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.site = create_site()
+        self.events = []
+        for i in range(40):
+            event = random_event(rng, f"event{i}")
+            self.events.append(
+                WakeChangeEvent.objects.create(
+                    name=event.name,
+                    date_start=event.date_start,
+                    date_end=event.date_end,
+                    site=self.site,
+                )
+            )
+        self.plans = []
+        for i in range(3):
+            plan = WakeWeekPlan.objects.create(name=f"plan{i}", site=self.site)
+            plan.wake_change_events.set(
+                non_overlapping_events([], rng.sample(self.events, 10))[0]
+            )
+            self.plans.append(plan)
+        self.rng = rng
+
+    def test_verify_plan_events(self):
+        for plan in self.plans:
+            selected = self.rng.sample(self.events, 20)
+            selected_pks = [event.pk for event in selected]
+            pre = set(plan.wake_change_events.all())
+            verified = [event for event in selected if event in pre]
+            invalid = []
+            for event in sorted(
+                (event for event in selected if event not in pre),
+                key=lambda event: (-event.date_start.toordinal(), event.name),
+            ):
+                if any(old_events_overlap(other, event) for other in verified):
+                    invalid.append(event)
+                else:
+                    verified.append(event)
+
+            with self.assertNumQueries(1):
+                result = verify_plan_events(plan, selected_pks)
+            self.assertEqual(set(result[0]), set(verified))
+            self.assertEqual(result[1], invalid)
+
+    def test_find_overlapping_event(self):
+        for event in self.events:
+            expected = None
+            for plan in event.wake_week_plans.order_by("pk"):
+                for other in plan.wake_change_events.exclude(pk=event.pk).order_by(
+                    "date_start", "pk"
+                ):
+                    if old_events_overlap(other, event):
+                        expected = (other.name, plan.name)
+                        break
+                if expected:
+                    break
+            self.assertEqual(find_overlapping_event(event), expected)
+
+
+class PolicyUpdateTest(TestCase):
+    def setUp(self):
+        site = create_site()
+        self.group = PCGroup.objects.create(name="group", site=site)
+        self.script_a = Script.objects.create(name="a", site=site)
+        Input.objects.create(
+            name="text", value_type=Input.STRING, position=0, script=self.script_a
+        )
+        Input.objects.create(
+            name="password",
+            value_type=Input.PASSWORD,
+            position=1,
+            script=self.script_a,
+        )
+        self.script_b = Script.objects.create(name="b", site=site)
+        Input.objects.create(
+            name="optional",
+            value_type=Input.STRING,
+            position=0,
+            mandatory=False,
+            script=self.script_b,
+        )
+
+    def update(self, scripts, **params):
+        data = {"group_policies": [pk for pk, _script in scripts]}
+        for pk, script in scripts:
+            data[f"group_policies_{pk}"] = script.pk
+        data.update(params)
+        request = RequestFactory().post("/", data)
+        return self.group.update_policy_from_request(request, "group_policies")
+
+    def values(self):
+        return {
+            (asc.script.name, par.input.name): par.string_value
+            for asc in self.group.policy.all()
+            for par in asc.parameters.all()
+        }
+
+    def test_update_policy(self):
+        updated = self.update(
+            [("new_1", self.script_a), ("new_2", self.script_b)],
+            group_policies_new_1_param_0="x",
+            group_policies_new_1_param_1="secret",
+        )
+        self.assertEqual(updated, set())
+        asc_a = self.group.policy.get(script=self.script_a)
+        asc_b = self.group.policy.get(script=self.script_b)
+        self.assertEqual((asc_a.position, asc_b.position), (0, 1))
+        self.assertEqual(
+            self.values(),
+            {("a", "text"): "x", ("a", "password"): "secret", ("b", "optional"): ""},
+        )
+
+        # Reorder and change a value; an empty password keeps the old one
+        updated = self.update(
+            [(asc_b.pk, self.script_b), (asc_a.pk, self.script_a)],
+            **{
+                f"group_policies_{asc_a.pk}_param_0": "y",
+                f"group_policies_{asc_a.pk}_param_1": "",
+            },
+        )
+        self.assertEqual(updated, {asc_a})
+        self.assertEqual(
+            list(self.group.ordered_policy.values_list("pk", flat=True)),
+            [asc_b.pk, asc_a.pk],
+        )
+        self.assertEqual(
+            self.values(),
+            {("a", "text"): "y", ("a", "password"): "secret", ("b", "optional"): ""},
+        )
+
+        # A missing mandatory value changes nothing
+        with self.assertRaises(MandatoryParameterMissingError):
+            self.update(
+                [(asc_a.pk, self.script_a), ("new_3", self.script_a)],
+                **{"group_policies_new_3_param_0": ""},
+            )
+        self.assertEqual(
+            set(self.group.policy.values_list("pk", flat=True)), {asc_a.pk, asc_b.pk}
+        )
+
+        # Removing a script removes its parameters
+        self.update([(asc_a.pk, self.script_a)])
+        self.assertEqual(list(self.group.policy.all()), [asc_a])
+        self.assertFalse(
+            AssociatedScript.objects.filter(pk=asc_b.pk).exists()
+            or asc_b.parameters.exists()
+        )
+
+
+class RegistrationTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+
+    def test_register(self):
+        mac = "aa:bb:cc:dd:ee:ff"
+        uid = register_new_computer_v2(
+            mac, "pc", "test", {"mac": mac, "uid": "x", "os2borgerpc_version": "1"}
+        )
+        pc = PC.objects.get(uid=uid)
+        self.assertEqual(uid, computer_uid(mac))
+        self.assertEqual((pc.name, pc.mac, pc.is_activated), ("pc", mac, False))
+        self.assertEqual(
+            pc.configuration.data,
+            {"os2borgerpc_version": "1", "os2_product": "os2borgerpc"},
+        )
+        with self.assertRaises(ComputerExistsError):
+            register_new_computer_v2(mac, "other", "test", {})
+        self.assertEqual(PC.objects.count(), 1)
+
+    def test_preregister(self):
+        file = SimpleUploadedFile(
+            "pcs.csv",
+            b"mac,name,site\nAA-BB-CC-DD-EE-FF,Library 1,test\n"
+            b"aabbccddee00,Library 2,\n",
+        )
+        computers, errors = read_preregistration_csv(file, self.site)
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            computers,
+            [("aa:bb:cc:dd:ee:ff", "Library 1"), ("aa:bb:cc:dd:ee:00", "Library 2")],
+        )
+        with self.assertNumQueries(6):
+            created, existing = preregister_computers(self.site, computers)
+        self.assertEqual((len(created), existing), (2, []))
+        created, existing = preregister_computers(self.site, computers[:1])
+        self.assertEqual((created, existing), ([], ["aa:bb:cc:dd:ee:ff"]))
+
+        # Registering completes the pre-registered PC, which keeps its name
+        mac = "aa:bb:cc:dd:ee:ff"
+        register_new_computer_v2(mac, "pc", "test", {"os2_product": "os2borgerpc"})
+        pc = PC.objects.get(uid=computer_uid(mac))
+        self.assertEqual(pc.name, "Library 1")
+        self.assertFalse(pc.is_preregistered)
+        self.assertEqual(pc.configuration.data, {"os2_product": "os2borgerpc"})
+        self.assertEqual(PC.objects.count(), 2)
+
+    def test_preregistration_errors(self):
+        file = SimpleUploadedFile(
+            "pcs.csv",
+            b"mac,name,site\nxx,pc,test\naabbccddeeff,,test\n"
+            b"aabbccddee00,pc,other\n",
+        )
+        computers, errors = read_preregistration_csv(file, self.site)
+        self.assertEqual(computers, [])
+        self.assertEqual(len(errors), 3)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class APIKeyAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.site = create_site()
+        self.api_key = APIKey.objects.create(
+            key=secrets.token_urlsafe(), site=self.site
+        )
+
+    def test_site_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_api_key_site(self.api_key.key), self.site)
+        self.assertIsNone(get_api_key_site(self.api_key.key + "x"))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_api_key_site(self.api_key.key), self.site)
+            self.assertIsNone(get_api_key_site(self.api_key.key + "x"))
+
+    def test_changed_and_deleted_keys(self):
+        old_key = self.api_key.key
+        get_api_key_site(old_key)
+        self.api_key.key = secrets.token_urlsafe()
+        self.api_key.save()
+        self.assertIsNone(get_api_key_site(old_key))
+        self.assertEqual(get_api_key_site(self.api_key.key), self.site)
+        self.api_key.delete()
+        self.assertIsNone(get_api_key_site(self.api_key.key))
+
+    def test_request_uses_site_of_key(self):
+        create_pc(self.site, "pc")
+        headers = {"Authorization": f"Bearer {self.api_key.key}"}
+        self.client.get("/api/system/computers", headers=headers)
+        # Only the computers are queried once the key is cached
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/system/computers", headers=headers)
+        self.assertEqual([pc["name"] for pc in response.json()], ["pc"])
+        response = self.client.get(
+            "/api/system/computers", headers={"Authorization": "Bearer wrong"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class APIPaginationTest(TestCase):
+    def setUp(self):
+        self.site = create_site()
+        self.api_key = APIKey.objects.create(
+            key=secrets.token_urlsafe(), site=self.site
+        )
+        self.pcs = [create_pc(self.site, f"pc{i}") for i in range(5)]
+        script = Script.objects.create(name="script", site=self.site)
+        batch = Batch.objects.create(name="", script=script, site=self.site)
+        self.jobs = [Job.objects.create(batch=batch, pc=pc) for pc in self.pcs]
+
+    def get(self, path, **params):
+        return self.client.get(
+            f"/api/system/{path}",
+            params,
+            headers={"Authorization": f"Bearer {self.api_key.key}"},
+        ).json()
+
+    def test_harvest_computers(self):
+        page = self.get("computers", limit=2)
+        ids = [pc["id"] for pc in page["items"]]
+        while page["items"]:
+            cursor = page["next_cursor"]
+            page = self.get("computers", limit=2, cursor=cursor)
+            ids += [pc["id"] for pc in page["items"]]
+        self.assertEqual(ids, [pc.id for pc in self.pcs])
+
+        # The cursor of the last page gives the computers added since
+        self.assertEqual(page["next_cursor"], cursor)
+        pc = create_pc(self.site, "new")
+        page = self.get("computers", limit=2, cursor=cursor)
+        self.assertEqual([pc["id"] for pc in page["items"]], [pc.id])
+
+    def test_jobs_newest_first(self):
+        page = self.get("jobs", limit=3)
+        with self.assertNumQueries(1):
+            next_page = self.get("jobs", limit=3, cursor=page["next_cursor"])
+        self.assertEqual(
+            [job["id"] for job in page["items"] + next_page["items"]],
+            [job.id for job in reversed(self.jobs)],
+        )
+        self.assertEqual(next_page["items"][0]["pc_name"], "pc1")
+        self.assertIsNone(next_page["next_cursor"])
+
+    def test_invalid_cursor(self):
+        page = self.get("jobs", limit=3)
+        response = self.client.get(
+            "/api/system/jobs",
+            {"cursor": page["next_cursor"], "oldest_first": True},
+            headers={"Authorization": f"Bearer {self.api_key.key}"},
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_export_jobs(self):
+        response = self.client.get(
+            "/api/system/jobs/export",
+            {"pc": self.pcs[1].id},
+            headers={"Authorization": f"Bearer {self.api_key.key}"},
+        )
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["id"] for row in rows], [self.jobs[1].id])
+        self.assertEqual(rows[0]["computer"], "pc1")
+
+    def follow_changes(self, path, since):
+        """Follow the change feed of path from since until a page has no
+        changes, and return the changed ids, the deleted ids and the token to
+        follow it from later on."""
+        changed, deleted = [], []
+        while True:
+            page = self.get(path, limit=2, since=since)
+            since = page["next_since"]
+            if not page["items"] and not page["deleted"]:
+                return changed, deleted, since
+            changed += [row["id"] for row in page["items"]]
+            deleted += page["deleted"]
+
+    def pass_changes_at_once(self):
+        # The changes are made after the transaction of the test started,
+        # which is as late as the horizon goes while it is open
+        horizon = api_pagination.change_horizon
+        api_pagination.change_horizon = lambda: datetime.now() + timedelta(days=1)
+        self.addCleanup(setattr, api_pagination, "change_horizon", horizon)
+
+    def test_job_changes(self):
+        self.pass_changes_at_once()
+        changed, deleted, since = self.follow_changes("jobs", "2000-01-01")
+        self.assertEqual(changed, [job.id for job in self.jobs])
+        self.assertEqual(deleted, [])
+
+        self.jobs[2].status = Job.DONE
+        self.jobs[2].save()
+        # Saving a job without changing it is no change
+        self.jobs[1].save()
+        self.jobs[3].delete()
+        changed, deleted, since = self.follow_changes("jobs", since)
+        self.assertEqual(changed, [self.jobs[2].id])
+        self.assertEqual(deleted, [self.jobs[3].id])
+        self.assertEqual(self.follow_changes("jobs", since)[:2], ([], []))
+
+    def test_computer_changes(self):
+        self.pass_changes_at_once()
+        since = self.follow_changes("computers", "2000-01-01")[2]
+
+        # Changing the configuration of a computer changes the computer
+        self.pcs[1].configuration.write_entries({"hostname": "pc1"})
+        other_site = Site.objects.create(
+            name="Other",
+            uid="other",
+            configuration=Configuration.objects.create(name="other"),
+        )
+        PC.objects.filter(pk=self.pcs[2].pk).update(site=other_site)
+        changed, deleted, since = self.follow_changes("computers", since)
+        self.assertEqual(changed, [self.pcs[1].id])
+        self.assertEqual(deleted, [self.pcs[2].id])
+
+    def test_invalid_since(self):
+        response = self.client.get(
+            "/api/system/computers",
+            {"since": "yesterday"},
+            headers={"Authorization": f"Bearer {self.api_key.key}"},
+        )
+        self.assertEqual(response.status_code, 422)
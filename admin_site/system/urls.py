@@ -13,15 +13,19 @@ from system.views import (
     DocView,
     ImageVersionRedirect,
     ImageVersionView,
+    JobExport,
     JobInfo,
+    JobLogChunk,
     JobRestarter,
     JobSearch,
     JobsView,
+    LoginLogExport,
     PCDelete,
     PCGroupCreate,
     PCGroupDelete,
     PCGroupRedirect,
     PCGroupUpdate,
+    PCSearch,
     PCUpdate,
     WakePlanCreate,
     WakePlanDuplicate,
@@ -39,6 +43,7 @@ from system.views import (
     ScriptRun,
     ScriptUpdate,
     GlobalScriptRedirect,
+    SecurityEventExport,
     SecurityEventSearch,
     SecurityEventsUpdate,
     SecurityEventsView,
@@ -67,7 +72,6 @@ from system.views import (
     UserUpdate,
 )
 
-
 urlpatterns = [
     # TODO: Switch to using the django javascript translation system
     # For translations of strings in javascript files that are printed to the user
@@ -83,6 +87,11 @@ urlpatterns = [
         SecurityEventSearch.as_view(),
         name="security_event_search",
     ),
+    re_path(
+        r"^site/(?P<slug>[^/]+)/security_events/export/$",
+        SecurityEventExport.as_view(),
+        name="security_event_export",
+    ),
     re_path(
         r"^site/(?P<slug>[^/]+)/security_events/$",
         SecurityEventsView.as_view(),
@@ -202,6 +211,11 @@ urlpatterns = [
     ),
     # Computers
     re_path(r"^site/(?P<slug>[^/]+)/computers/$", PCsView.as_view(), name="computers"),
+    re_path(
+        r"^site/(?P<slug>[^/]+)/computers/search/$",
+        PCSearch.as_view(),
+        name="pc_search",
+    ),
     re_path(
         r"^site/(?P<slug>[^/]+)/computers/(?P<pc_uid>[^/]+)/$",
         PCUpdate.as_view(),
@@ -289,6 +303,9 @@ urlpatterns = [
     re_path(
         r"^site/(?P<slug>[^/]+)/jobs/search/", JobSearch.as_view(), name="jobsearch"
     ),
+    re_path(
+        r"^site/(?P<slug>[^/]+)/jobs/export/$", JobExport.as_view(), name="job_export"
+    ),
     re_path(
         r"^site/(?P<slug>[^/]+)/jobs/(?P<pk>\d+)/restart/",
         JobRestarter.as_view(),
@@ -299,6 +316,11 @@ urlpatterns = [
         JobInfo.as_view(),
         name="job_info",
     ),
+    re_path(
+        r"^site/(?P<slug>[^/]+)/jobs/(?P<pk>\d+)/log/",
+        JobLogChunk.as_view(),
+        name="job_log_chunk",
+    ),
     re_path(r"^site/(?P<slug>[^/]+)/jobs/", JobsView.as_view(), name="jobs"),
     # Scripts
     re_path(
@@ -411,6 +433,11 @@ urlpatterns = [
         APIKeyUpdate.as_view(),
         name="api_keys",
     ),
+    re_path(
+        r"^site/(?P<slug>[^/]+)/login-log/export/$",
+        LoginLogExport.as_view(),
+        name="login_log_export",
+    ),
 ]
 
 # Define HTMX URL Patterns here, and add them to the urlpatterns list
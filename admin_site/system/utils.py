@@ -17,6 +17,22 @@ from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
 
+def buffered(chunks, size=8192):
+    """Join the many small strings from e.g. JSONEncoder.iterencode into
+    chunks of about size characters, for streaming responses."""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer)
+
+
 def notify_users(security_event, security_problem, pc):
     """Notify users about security event."""
 
@@ -410,9 +426,3 @@ def notification_changes_saved(response, user_profile_language):
     translation.deactivate()
 
     return response
-
-
-def online_pcs_count_filter(pcs):
-    """Online PCs are PCs that have checked in recently, as defined by the model function
-    This function takes a list of PCs and returns the number of those that are online"""
-    return len([pc for pc in pcs if pc.online])
@@ -2,13 +2,24 @@
 import os
 import json
 import secrets
-
-from django.http import HttpResponseRedirect, Http404, JsonResponse, HttpResponse
+from collections import Counter
+from urllib.parse import quote
+
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    Http404,
+    JsonResponse,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
+from django.utils.dateparse import parse_date
 from django.utils.html import escape
+from django.utils.http import RFC3986_SUBDELIMS
 from django.contrib.auth.models import User, Permission
 from django.urls import resolve, reverse
 
@@ -23,8 +34,11 @@ from django.views.generic import View, ListView, DetailView, RedirectView, Templ
 from django.views.generic.list import BaseListView
 
 from django.db import transaction
-from django.db.models import Q, F
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 
 from django.core.exceptions import PermissionDenied
 
@@ -38,10 +52,31 @@ from django_otp import devices_for_user, user_has_device
 from django_otp.plugins.otp_static.models import StaticToken
 from django.forms import Form
 
+from system.access import get_site_access
+from system.exports import (
+    CONTENT_TYPES,
+    CSV,
+    JOB_COLUMNS,
+    LOGIN_LOG_COLUMNS,
+    SECURITY_EVENT_COLUMNS,
+    export_filename,
+    export_response,
+)
+from system.pagination import KeysetPaginator
+from system.script_catalog import get_script_catalog
+from system.wake_plans import (
+    find_overlapping_event,
+    group_members,
+    pcs_in_other_plans,
+    plan_pc_ids,
+    verify_pc_groups,
+    verify_plan_events,
+    verify_plan_groups,
+)
 from system.utils import (
+    buffered,
     get_notification_string,
     notification_changes_saved,
-    online_pcs_count_filter,
     set_notification_cookie,
 )
 
@@ -58,6 +93,8 @@ from system.models import (
     ImageVersion,
     Input,
     Job,
+    JobLog,
+    LoginLog,
     MandatoryParameterMissingError,
     Product,
     PC,
@@ -67,6 +104,7 @@ from system.models import (
     Script,
     ScriptTag,
     SecurityEvent,
+    SecurityEventCounter,
     SecurityProblem,
     EventRuleServer,
     EventLevels,
@@ -123,38 +161,108 @@ def otp_check(
     return decorator if (view is None) else decorator(view)
 
 
-def site_pcs_stats(context, site_list):
-    context["borgerpc_count"] = PC.objects.filter(
-        site__in=site_list,
-        configuration__entries__key="os2_product",
-        configuration__entries__value="os2borgerpc",
-    ).count()
-    context["borgerpc_kiosk_count"] = PC.objects.filter(
-        site__in=site_list,
-        configuration__entries__key="os2_product",
-        configuration__entries__value="os2borgerpc kiosk",
-    ).count()
-    # Add counts for each _os_release
-    context["releases"] = []
-    for release in (
-        ConfigurationEntry.objects.filter(key="_os_release")
-        .order_by("value")
-        .distinct("value")
-        .values("value")
+# How long (in seconds) the PC statistics of a site are cached
+SITE_PCS_STATS_CACHE_TIMEOUT = 60
+
+
+def _site_pcs_stats_key(site_id):
+    return f"site_pcs_stats_{site_id}"
+
+
+def invalidate_site_pcs_stats(*site_ids):
+    """Clear the cached PC statistics of the given sites, when a PC is
+    created, registered, activated, deactivated, moved or deleted."""
+    cache.delete_many([_site_pcs_stats_key(site_id) for site_id in site_ids])
+
+
+def _compute_site_pcs_stats(site_ids):
+    """Compute the PC statistics for each of the given sites in a single
+    aggregate query, grouped by site and OS release."""
+    stats = {
+        site_id: {
+            "total": 0,
+            "activated": 0,
+            "online": 0,
+            "borgerpc": 0,
+            "borgerpc_kiosk": 0,
+            "releases": {},
+        }
+        for site_id in site_ids
+    }
+    for row in (
+        # Pre-registered PCs aren't installed yet
+        PC.objects.filter(site_id__in=site_ids, is_preregistered=False)
+        .values("site_id", "os_release")
+        .annotate(
+            total=Count("id"),
+            activated=Count("id", filter=Q(is_activated=True)),
+            online=Count("id", filter=PC.online_filter()),
+            borgerpc=Count("id", filter=Q(os2_product="os2borgerpc")),
+            borgerpc_kiosk=Count("id", filter=Q(os2_product="os2borgerpc kiosk")),
+        )
+        .order_by()
     ):
-        context["releases"].append(
-            (
-                release["value"],
-                PC.objects.filter(
-                    site__in=site_list,
-                    configuration__entries__key="_os_release",
-                    configuration__entries__value=release["value"],
-                ).count(),
-            )
+        site_stats = stats[row["site_id"]]
+        for key in ["total", "activated", "online", "borgerpc", "borgerpc_kiosk"]:
+            site_stats[key] += row[key]
+        if row["os_release"]:
+            site_stats["releases"][row["os_release"]] = row["total"]
+    return stats
+
+
+def site_pcs_stats(context, site_list):
+    """Add the PC statistics for the given sites to the context.
+
+    The statistics of each site are cached for a short while, so pages
+    showing them only need a constant number of queries. The cached
+    statistics of a site are cleared when its PCs are created, registered,
+    activated, deactivated, moved or deleted; the online count may lag by up
+    to the timeout."""
+    site_ids = [site.id for site in site_list]
+    cache_keys = {_site_pcs_stats_key(site_id): site_id for site_id in site_ids}
+    cached = cache.get_many(cache_keys.keys())
+    stats = {cache_keys[key]: value for key, value in cached.items()}
+
+    missing = [site_id for site_id in site_ids if site_id not in stats]
+    if missing:
+        computed = _compute_site_pcs_stats(missing)
+        cache.set_many(
+            {
+                _site_pcs_stats_key(site_id): value
+                for site_id, value in computed.items()
+            },
+            SITE_PCS_STATS_CACHE_TIMEOUT,
         )
+        stats.update(computed)
+
+    def total(key):
+        return sum(site_stats[key] for site_stats in stats.values())
+
+    context["total_pcs_count"] = total("total")
+    context["activated_pcs_count"] = total("activated")
+    context["online_pcs_count"] = total("online")
+    context["borgerpc_count"] = total("borgerpc")
+    context["borgerpc_kiosk_count"] = total("borgerpc_kiosk")
+    releases = Counter()
+    for site_stats in stats.values():
+        releases.update(site_stats["releases"])
+    context["releases"] = sorted(releases.items())
     return context
 
 
+# The characters reverse() leaves unquoted in URLs
+URL_SAFE_CHARACTERS = RFC3986_SUBDELIMS + "/~:@"
+
+
+def url_formatter(viewname, *args):
+    """Return a function giving the URL of viewname for args and one more
+    argument, which only reverses the URL once for building many of them."""
+    placeholder = "0000"
+    url = reverse(viewname, args=[*args, placeholder])
+    prefix, _placeholder, suffix = url.rpartition(placeholder)
+    return lambda value: prefix + quote(str(value), safe=URL_SAFE_CHARACTERS) + suffix
+
+
 def site_uid_available_check(request):
     uid = request.GET["uid"]
     uid = Site.objects.filter(uid=uid)
@@ -193,16 +301,12 @@ class SuperAdminOrThisSiteMixin(LoginRequiredMixin):
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         """Limit access to super users or users belonging to THIS site."""
-        site = None
-        slug_field = None
+        access = None
         # Check if a site slug is included in the url
         if "slug" in kwargs:
-            slug_field = "slug"
-        # If none given, give up
-        if slug_field:
-            site = get_object_or_404(Site, uid=kwargs[slug_field])
+            access = get_site_access(self.request, kwargs["slug"])
         check_function = user_passes_test(
-            lambda u: (u.is_superuser) or (site and site in u.user_profile.sites.all()),
+            lambda u: (u.is_superuser) or (access and access.is_allowed),
             login_url="/",
         )
         wrapped_super = check_function(super(SuperAdminOrThisSiteMixin, self).dispatch)
@@ -218,7 +322,7 @@ class SelectionMixin(View):
     # The Python class of the Django model corresponding to the objects you
     # want to be able to select. MUST be specified in subclass.
     selection_class = None
-    # A callable which will return a list of objects which SHOULD belong to the
+    # A callable which will return a queryset of objects which SHOULD belong to the
     # class specified by selection_class. MUST be specified in subclass.
     get_list = None
     # The field which is used to look up the selected object.
@@ -235,7 +339,8 @@ class SelectionMixin(View):
             lookup_params = {self.lookup_field: lookup_val}
             selected = get_object_or_404(self.selection_class, **lookup_params)
         else:
-            selected = self.get_list()[0] if self.get_list() else None
+            # Only fetch the first object rather than the whole list
+            selected = self.get_list().first()
 
         display_name = (
             self.class_display_name
@@ -259,6 +364,16 @@ class JSONResponseMixin:
         """
         return JsonResponse(self.get_data(context), **response_kwargs)
 
+    def render_to_streaming_json_response(self, context, **response_kwargs):
+        """
+        Returns a JSON response which is encoded while it's being sent,
+        rather than building the whole payload in memory first.
+        """
+        chunks = DjangoJSONEncoder().iterencode(self.get_data(context))
+        return StreamingHttpResponse(
+            buffered(chunks), content_type="application/json", **response_kwargs
+        )
+
     def get_data(self, context):
         """
         Returns an object that will be serialized as JSON by json.dumps().
@@ -270,6 +385,58 @@ class JSONResponseMixin:
         return context
 
 
+class KeysetPaginationMixin:
+    """
+    A mixin for list views serving JSON pages, which pages through querysets
+    by keyset rather than by OFFSET, so that the pages far back in large
+    tables are as fast as the first one. The cursors of the neighbouring
+    pages are handed out as next_page_number and previous_page_number and
+    are passed back as the page parameter like page numbers are.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(
+            self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg)
+        )
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_page_data(self, context):
+        """
+        Returns the pagination part of the JSON page.
+        """
+        page_obj = context["page_obj"]
+        paginator = context["paginator"]
+        count_is_estimate = getattr(paginator, "count_is_estimate", False)
+        num_pages = paginator.num_pages
+        if count_is_estimate:
+            num_pages = max(num_pages, page_obj.number + page_obj.has_next())
+        adjacent_pages = 2
+        page_numbers = [
+            n
+            for n in range(
+                page_obj.number - adjacent_pages, page_obj.number + adjacent_pages + 1
+            )
+            if n > 0 and n <= num_pages
+        ]
+
+        return {
+            "count": paginator.count,
+            "count_is_estimate": count_is_estimate,
+            "num_pages": num_pages,
+            "page": page_obj.number,
+            "page_numbers": page_numbers,
+            "has_next": page_obj.has_next(),
+            "next_page_number": (
+                page_obj.next_page_number() if page_obj.has_next() else None
+            ),
+            "has_previous": page_obj.has_previous(),
+            "previous_page_number": (
+                page_obj.previous_page_number() if page_obj.has_previous() else None
+            ),
+        }
+
+
 # Mixin class for CRUD views that use site_uid in URL
 # The "site_uid" slug is configurable, but please avoid clashes
 class SiteMixin(View):
@@ -277,10 +444,10 @@ class SiteMixin(View):
 
     def get_context_data(self, **kwargs):
         context = super(SiteMixin, self).get_context_data(**kwargs)
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context["site"] = site
         # Add information about outstanding security events.
-        no_of_sec_events = SecurityEvent.objects.priority_events_for_site(site).count()
+        no_of_sec_events = SecurityEventCounter.outstanding_for_site(site)
         context["sec_events"] = no_of_sec_events
 
         return context
@@ -334,12 +501,6 @@ class SiteList(ListView, LoginRequiredMixin):
     def get_context_data(self, **kwargs):
         context = super(SiteList, self).get_context_data(**kwargs)
         context = site_pcs_stats(context, self.get_queryset())
-        total_pcs = PC.objects.filter(site__in=self.get_queryset())
-        context["total_pcs_count"] = len(total_pcs)
-        context["total_activated_pcs_count"] = total_pcs.filter(
-            is_activated=True
-        ).count()
-        context["total_online_pcs_count"] = online_pcs_count_filter(total_pcs)
         context["user"] = self.request.user
         context["site_membership"] = (
             self.request.user.user_profile.sitemembership_set.order_by(
@@ -449,7 +610,7 @@ class SiteDelete(DeleteView, SuperAdminOrThisSiteMixin):
         # Call the super-method first so non-customer admins
         # are shown the proper PermissionDenied
         response = super().get(request, *args, **kwargs)
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         # If the site has 5 or more computers, redirect away
         # from this view.
         # Also don't let them delete their last site
@@ -458,15 +619,13 @@ class SiteDelete(DeleteView, SuperAdminOrThisSiteMixin):
         return response
 
     def get_object(self, queryset=None):
-        self.selected_site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        access = get_site_access(self.request, self.kwargs["slug"])
+        self.selected_site = access.site
 
         # Only customer admins are allowed to access this view
         if (
             not self.request.user.is_superuser
-            and self.request.user.user_profile.sitemembership_set.get(
-                site=self.selected_site
-            ).site_user_type
-            != SiteMembership.CUSTOMER_ADMIN
+            and access.site_user_type != SiteMembership.CUSTOMER_ADMIN
         ):
             raise PermissionDenied
 
@@ -513,11 +672,16 @@ class SiteView(DetailView, SuperAdminOrThisSiteMixin):
     model = Site
     slug_field = "uid"
 
+    def get_object(self, queryset=None):
+        if queryset is None:
+            return get_site_access(self.request, self.kwargs["slug"]).site
+        return super().get_object(queryset)
+
     def get_context_data(self, **kwargs):
         context = super(SiteView, self).get_context_data(**kwargs)
         site = self.get_object()
         # Add information about outstanding security events.
-        no_of_sec_events = SecurityEvent.objects.priority_events_for_site(site).count()
+        no_of_sec_events = SecurityEventCounter.outstanding_for_site(site)
         context["sec_events"] = no_of_sec_events
 
         return context
@@ -533,16 +697,18 @@ class SiteDetailView(SiteView):
         context = super(SiteDetailView, self).get_context_data(**kwargs)
         context = site_pcs_stats(context, [kwargs["object"]])
 
-        site_pcs = self.object.pcs.all()
-
-        # Top level list of new PCs etc.
-        context["ls_pcs"] = site_pcs.order_by(
-            "is_activated", F("last_seen").desc(nulls_last=True)
+        # Top level list of new PCs etc., annotated with what the list shows
+        # so that it takes the same number of queries for any number of PCs
+        latest_events = SecurityEvent.objects.filter(pc=OuterRef("pk")).order_by(
+            "-reported_time"
+        )
+        context["ls_pcs"] = (
+            self.object.pcs.with_status()
+            .annotate(
+                latest_event_time=Subquery(latest_events.values("reported_time")[:1])
+            )
+            .order_by("is_activated", F("last_seen").desc(nulls_last=True))
         )
-
-        context["total_pcs_count"] = context["ls_pcs"].count()
-        context["activated_pcs_count"] = site_pcs.filter(is_activated=True).count()
-        context["online_pcs_count"] = online_pcs_count_filter(site_pcs)
 
         return context
 
@@ -618,7 +784,7 @@ class APIKeyCreate(CreateView, SuperAdminOrThisSiteMixin):
         # First, get basic context from superclass
         context = super(APIKeyCreate, self).get_context_data(**kwargs)
 
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context["api_keys"] = APIKey.objects.filter(site=site)
 
         return context
@@ -638,7 +804,7 @@ class APIKeyCreate(CreateView, SuperAdminOrThisSiteMixin):
         while APIKey.objects.filter(key=key).count() > 0:
             key = secrets.token_urlsafe(KEY_LENGTH)
 
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         APIKey.objects.create(key=key, site=site)
 
         return response
@@ -654,7 +820,7 @@ class APIKeyDelete(TemplateView, DeletionMixin, SuperAdminOrThisSiteMixin):
         # First, get basic context from superclass
         context = super().get_context_data(**kwargs)
 
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context["api_keys"] = APIKey.objects.filter(site=site)
 
         return context
@@ -682,7 +848,7 @@ class AdminTwoFactorDisable(otp_views.DisableView, SuperAdminOrThisSiteMixin):
         )
 
     def get_context_data(self, **kwargs):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context = {"site": site, "user": self.request.user, "form": Form}
         return context
 
@@ -715,7 +881,7 @@ class AdminTwoFactorSetup(otp_views.SetupView, SuperAdminOrThisSiteMixin):
     def get_context_data(self, form, **kwargs):
         context = super().get_context_data(form, **kwargs)
         user = self.request.user
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context["site"] = site
         # url to redirect to when the user clicks cancel
         context["cancel_url"] = reverse("users", kwargs={"slug": site.uid})
@@ -775,7 +941,7 @@ class AdminTwoFactorSetupComplete(
             "phone_methods": get_available_phone_methods(),
         }
         user = self.request.user
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         context["site"] = site
         context["user"] = user
         return context
@@ -801,7 +967,7 @@ class AdminTwoFactorBackupTokens(otp_views.BackupTokensView, SuperAdminOrThisSit
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["user"] = self.request.user
-        context["site"] = get_object_or_404(Site, uid=self.kwargs["slug"])
+        context["site"] = get_site_access(self.request, self.kwargs["slug"]).site
         return context
 
     def dispatch(self, request, *args, **kwargs):
@@ -844,7 +1010,6 @@ class JobsView(SiteView):
         context = super(JobsView, self).get_context_data(**kwargs)
         site = context["site"]
         context["batches"] = site.batches.exclude(name="")[:100]
-        context["pcs"] = site.pcs.all()
         context["groups"] = site.groups.all()
         preselected = set(
             [
@@ -873,7 +1038,13 @@ class JobsView(SiteView):
         return context
 
 
-class JobSearch(SiteMixin, JSONResponseMixin, BaseListView, SuperAdminOrThisSiteMixin):
+class JobSearch(
+    SuperAdminOrThisSiteMixin,
+    SiteMixin,
+    JSONResponseMixin,
+    KeysetPaginationMixin,
+    BaseListView,
+):
     paginate_by = 20
     http_method_names = ["get"]
     VALID_ORDER_BY = []
@@ -893,129 +1064,123 @@ class JobSearch(SiteMixin, JSONResponseMixin, BaseListView, SuperAdminOrThisSite
 
     context_object_name = "jobs_list"
 
+    # The fields of the jobs needed for the list, which are fetched in one
+    # query rather than through the related objects of each job
+    JOB_FIELDS = [
+        "pk",
+        "status",
+        "log_length",
+        "created",
+        "started",
+        "finished",
+        "batch__name",
+        "batch__script_id",
+        "batch__script__name",
+        "pc__name",
+        "pc__uid",
+        "user__username",
+        "user__is_superuser",
+    ]
+
     def render_to_response(self, context, **response_kwargs):
-        return self.render_to_json_response(context, **response_kwargs)
+        return self.render_to_streaming_json_response(context, **response_kwargs)
 
-    def get_queryset(self):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        if not self.request.user.is_superuser:
-            queryset = Job.objects.filter(
-                Q(batch__script__is_hidden=False)
-                | Q(
-                    batch__script__feature_permission__in=site.customer.feature_permission.all()
-                )
-            )
-        else:
-            queryset = Job.objects.all()
+    def get_jobs(self):
+        """The jobs matching the filters, in the chosen order."""
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         params = self.request.GET
 
-        query = {"batch__site": site}
-
-        if "status" in params:
-            query["status__in"] = params.getlist("status")
-
-        for k in ["pc", "batch"]:
-            v = params.get(k, "")
-            if v != "":
-                query[k] = v
-
-        group = params.get("group", "")
-        if group != "":
-            query["pc__pc_groups"] = group
+        queryset = Job.objects.search(
+            site,
+            statuses=params.getlist("status"),
+            pc=params.get("pc", ""),
+            batch=params.get("batch", ""),
+            group=params.get("group", ""),
+            user=self.request.user,
+        )
 
         orderby = params.get("orderby", "-pk")
         if orderby not in JobSearch.VALID_ORDER_BY:
             orderby = "-pk"
 
-        queryset = queryset.filter(**query).order_by(orderby, "pk")
-
-        return queryset
+        return queryset.order_by(orderby, "pk")
 
-    # for admin users the user_url is a redirect to our job docs
-    # explaining scripts run as "Magenta"
-    def get_username(self, user):
-        if user:
-            if user and user.is_superuser:
-                return "Admin"
-            else:
-                return user.username
-        else:
-            return ""
+    def get_queryset(self):
+        return self.get_jobs().values(*JobSearch.JOB_FIELDS)
 
-    def get_user_url(self, user, uid):
-        if user:
-            if user.is_superuser:
-                return reverse("doc", kwargs={"name": "jobs"})
-            else:
-                return (reverse("user", args=[uid, user.username]),)
-        else:
-            return ""
+    @staticmethod
+    def format_time(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else "-"
 
     def get_data(self, context):
         site = context["site"]
         page_obj = context["page_obj"]
-        paginator = context["paginator"]
-        adjacent_pages = 2
-        page_numbers = [
-            n
-            for n in range(
-                page_obj.number - adjacent_pages, page_obj.number + adjacent_pages + 1
-            )
-            if n > 0 and n <= paginator.num_pages
-        ]
+        page = self.get_page_data(context)
+
+        script_url = url_formatter("script", site.uid)
+        pc_url = url_formatter("computer", site.uid)
+        restart_url = url_formatter("restart_job", site.uid)
+        user_url = url_formatter("user", site.uid)
+        # for admin users the user_url is a redirect to our job docs
+        # explaining scripts run as "Magenta"
+        admin_url = reverse("doc", kwargs={"name": "jobs"})
+        status_translations = {
+            status: str(translation)
+            for status, translation in Job.STATUS_TRANSLATIONS.items()
+        }
 
-        page = {
-            "count": paginator.count,
-            "num_pages": paginator.num_pages,
-            "page": page_obj.number,
-            "page_numbers": page_numbers,
-            "has_next": page_obj.has_next(),
-            "next_page_number": (
-                page_obj.next_page_number() if page_obj.has_next() else None
-            ),
-            "has_previous": page_obj.has_previous(),
-            "previous_page_number": (
-                page_obj.previous_page_number() if page_obj.has_previous() else None
-            ),
-            "results": [
+        results = []
+        for job in page_obj:
+            if job["user__is_superuser"]:
+                user, user_url_value = "Admin", admin_url
+            elif job["user__username"]:
+                user = job["user__username"]
+                user_url_value = user_url(user)
+            else:
+                user, user_url_value = "", ""
+            results.append(
                 {
-                    "pk": job.pk,
-                    "script_name": job.batch.script.name,
-                    "started": (
-                        job.started.strftime("%Y-%m-%d %H:%M:%S")
-                        if job.started
-                        else "-"
-                    ),
-                    "finished": (
-                        job.finished.strftime("%Y-%m-%d %H:%M:%S")
-                        if job.finished
-                        else "-"
-                    ),
-                    "created": (
-                        job.created.strftime("%Y-%m-%d %H:%M:%S")
-                        if job.created
-                        else "-"
-                    ),
-                    "status": job.status_translated + "",
-                    "label": job.status_label,
-                    "pc_name": job.pc.name,
-                    "batch_name": job.batch.name,
-                    "user": self.get_username(job.user),
-                    "user_url": self.get_user_url(job.user, site.uid),
-                    "has_info": job.has_info,
-                    "script_url": reverse(
-                        "script", args=[site.uid, job.batch.script.id]
-                    ),
-                    "pc_url": reverse("computer", args=[site.uid, job.pc.uid]),
-                    "restart_url": reverse("restart_job", args=[site.uid, job.pk]),
+                    "pk": job["pk"],
+                    "script_name": job["batch__script__name"],
+                    "started": self.format_time(job["started"]),
+                    "finished": self.format_time(job["finished"]),
+                    "created": self.format_time(job["created"]),
+                    "status": status_translations.get(job["status"], ""),
+                    "label": Job.STATUS_TO_LABEL.get(job["status"], ""),
+                    "pc_name": job["pc__name"],
+                    "batch_name": job["batch__name"],
+                    "user": user,
+                    "user_url": user_url_value,
+                    "has_info": job["status"] == Job.FAILED
+                    or job["log_length"] > 1
+                    or not job["finished"],
+                    "script_url": script_url(job["batch__script_id"]),
+                    "pc_url": pc_url(job["pc__uid"]),
+                    "restart_url": restart_url(job["pk"]),
                 }
-                for job in page_obj
-            ],
-        }
+            )
+        page["results"] = results
 
         return page
 
 
+class JobExport(JobSearch):
+    """Download the jobs matching the filters of the job list, as CSV or as
+    NDJSON."""
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format", CSV)
+        if export_format not in CONTENT_TYPES:
+            raise Http404
+        site = get_site_access(request, kwargs["slug"]).site
+        return export_response(
+            self.get_jobs(),
+            JOB_COLUMNS,
+            export_format,
+            export_filename("jobs", site),
+        )
+
+
 class JobRestarter(DetailView, SuperAdminOrThisSiteMixin):
     template_name = "system/jobs/restart.html"
     model = Job
@@ -1029,7 +1194,7 @@ class JobRestarter(DetailView, SuperAdminOrThisSiteMixin):
         return response
 
     def get(self, request, *args, **kwargs):
-        self.site = get_object_or_404(Site, uid=kwargs["slug"])
+        self.site = get_site_access(self.request, kwargs["slug"]).site
         self.object = self.get_object()
 
         # Only restart jobs that have failed or succeeded
@@ -1047,7 +1212,7 @@ class JobRestarter(DetailView, SuperAdminOrThisSiteMixin):
         return context
 
     def post(self, request, *args, **kwargs):
-        self.site = get_object_or_404(Site, uid=kwargs["slug"])
+        self.site = get_site_access(self.request, kwargs["slug"]).site
         self.object = self.get_object()
 
         if not self.object.finished:
@@ -1066,12 +1231,17 @@ class JobRestarter(DetailView, SuperAdminOrThisSiteMixin):
         return reverse("jobs", kwargs={"slug": self.kwargs["slug"]})
 
 
+# The amount of log output (in bytes) sent at a time when showing job logs.
+JOB_LOG_CHUNK_SIZE = 64 * 1024
+
+
 class JobInfo(DetailView, SuperAdminOrThisSiteMixin):
     template_name = "system/jobs/info.html"
     model = Job
+    queryset = Job.objects.select_related("batch")
 
     def get(self, request, *args, **kwargs):
-        self.site = get_object_or_404(Site, uid=kwargs["slug"])
+        self.site = get_site_access(self.request, kwargs["slug"]).site
         return super(JobInfo, self).get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -1080,9 +1250,44 @@ class JobInfo(DetailView, SuperAdminOrThisSiteMixin):
             raise Http404
         context["site"] = self.site
         context["job"] = self.object
+        # Only the first part of the log is included, the rest is fetched
+        # through JobLogChunk.
+        log_chunk, log_next_offset = JobLog.read_chunk(
+            self.object, 0, JOB_LOG_CHUNK_SIZE
+        )
+        context["log_chunk"] = log_chunk
+        context["log_next_offset"] = log_next_offset
         return context
 
 
+class JobLogChunk(SuperAdminOrThisSiteMixin, View):
+    """Return a part of the log of a job as JSON, starting at the byte offset
+    given by the "offset" parameter."""
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(
+            Job.objects.only("id", "finished", "has_log", "log_length"),
+            pk=kwargs["pk"],
+            batch__site__uid=kwargs["slug"],
+        )
+        try:
+            offset = max(int(request.GET.get("offset", 0)), 0)
+        except ValueError:
+            offset = 0
+
+        chunk, next_offset = JobLog.read_chunk(job, offset, JOB_LOG_CHUNK_SIZE)
+
+        return JsonResponse(
+            {
+                "offset": offset,
+                "next_offset": next_offset,
+                "log_length": job.log_length,
+                "chunk": chunk,
+                "finished": job.finished is not None,
+            }
+        )
+
+
 class ScriptMixin(object):
     script = None
     script_inputs = ""
@@ -1090,11 +1295,7 @@ class ScriptMixin(object):
 
     def setup_script_editing(self, **kwargs):
         # Get site
-        self.site = get_object_or_404(Site, uid=kwargs["slug"])
-        # Add the global and local script lists
-        self.scripts = Script.objects.filter(
-            Q(site=self.site) | Q(site=None), is_security_script=self.is_security
-        )
+        self.site = get_site_access(self.request, kwargs["slug"]).site
 
         if "script_pk" in kwargs:
             self.script = get_object_or_404(Script, pk=kwargs["script_pk"])
@@ -1117,45 +1318,11 @@ class ScriptMixin(object):
         context = super(ScriptMixin, self).get_context_data(**kwargs)
         context["site"] = self.site
         context["script_tags"] = ScriptTag.objects.all()
-
-        scripts = self.scripts.filter(is_hidden=False)
-
-        # Append scripts the site has permissions for
-        for fp in context["site"].customer.feature_permission.all():
-            scripts = scripts | fp.scripts.filter(is_security_script=self.is_security)
-
-        local_scripts = scripts.filter(site=self.site)
-        context["local_scripts"] = local_scripts
-        global_scripts = scripts.filter(site=None)
-        context["global_scripts"] = global_scripts
+        context.update(get_script_catalog(self.site, self.is_security))
 
         if self.script:
             context["supported_products"] = self.script.products.all()
 
-        # Create a tag->scripts dict for tags that has local scripts.
-        local_tag_scripts_dict = {
-            tag: local_scripts.filter(tags=tag)
-            for tag in ScriptTag.objects.all()
-            if local_scripts.filter(tags=tag).exists()
-        }
-        # Add scripts with no tags as untagged.
-        if local_scripts.filter(tags=None).exists():
-            local_tag_scripts_dict["untagged"] = local_scripts.filter(tags=None)
-
-        context["local_scripts_by_tag"] = local_tag_scripts_dict
-
-        # Create a tag->scripts dict for tags that has global scripts.
-        global_tag_scripts_dict = {
-            tag: global_scripts.filter(tags=tag)
-            for tag in ScriptTag.objects.all()
-            if global_scripts.filter(tags=tag).exists()
-        }
-        # Add scripts with no tags as untagged.
-        if global_scripts.filter(tags=None).exists():
-            global_tag_scripts_dict["untagged"] = global_scripts.filter(tags=None)
-
-        context["global_scripts_by_tag"] = global_tag_scripts_dict
-
         context["script_inputs"] = self.script_inputs
         context["is_security"] = self.is_security
         if self.is_security:
@@ -1184,9 +1351,7 @@ class ScriptMixin(object):
 
         context["script_inputs_json"] = json.dumps(context["script_inputs"])
         # Add information about outstanding security events.
-        no_of_sec_events = SecurityEvent.objects.priority_events_for_site(
-            self.site
-        ).count()
+        no_of_sec_events = SecurityEventCounter.outstanding_for_site(self.site)
         context["sec_events"] = no_of_sec_events
 
         return context
@@ -1263,7 +1428,7 @@ class ScriptMixin(object):
 
 class ScriptRedirect(RedirectView, SuperAdminOrThisSiteMixin):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
         is_security = (
             True if resolve(self.request.path).url_name == "security_scripts" else False
         )
@@ -1364,10 +1529,9 @@ class ScriptUpdate(ScriptMixin, UpdateView, SuperAdminOrThisSiteMixin):
         if self.script.uid:
             context["uid"] = self.script.uid
         request_user = self.request.user
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        context["site_membership"] = (
-            request_user.user_profile.sitemembership_set.filter(site_id=site.id).first()
-        )
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        context["site_membership"] = access.membership
         return context
 
     def get_object(self, queryset=None):
@@ -1446,6 +1610,10 @@ class ScriptRun(SiteView):
     def fetch_pcs_from_request(self):
         # Transfer chosen groups and PCs as PC pks
         pcs = [int(pk) for pk in self.request.POST.getlist("pcs", [])]
+        if self.request.POST.get("all_pcs"):
+            pcs.extend(
+                self.object.pcs.filter(is_activated=True).values_list("pk", flat=True)
+            )
         for group_pk in self.request.POST.getlist("groups", []):
             group = PCGroup.objects.get(pk=group_pk)
             for pc in group.pcs.all():
@@ -1456,9 +1624,9 @@ class ScriptRun(SiteView):
 
     def step1(self, context):
         self.template_name = "system/scripts/run_step1.html"
-        context["pcs"] = self.object.pcs.all()
-        all_groups = self.object.groups.all()
-        context["groups"] = [group for group in all_groups if group.pcs.count() > 0]
+        context["groups"] = self.object.groups.annotate(num_pcs=Count("pcs")).filter(
+            num_pcs__gt=0
+        )
 
         if len(context["script"].ordered_inputs) > 0:
             context["action"] = ScriptRun.STEP2
@@ -1600,6 +1768,75 @@ class PCsView(SelectionMixin, SiteView):
             return super(PCsView, self).render_to_response(context)
 
 
+class PCSearch(
+    SuperAdminOrThisSiteMixin,
+    SiteMixin,
+    JSONResponseMixin,
+    KeysetPaginationMixin,
+    BaseListView,
+):
+    """Search the computers of a site by name, location and UID.
+
+    Used by the computer lists in the sidebars and picklists, which load the
+    computers a page at a time rather than rendering every computer of the
+    site. Computers whose name or UID starts with the search come first."""
+
+    paginate_by = 50
+    http_method_names = ["get"]
+
+    PC_FIELDS = ["pk", "uid", "name", "location", "is_activated"]
+
+    def render_to_response(self, context, **response_kwargs):
+        return self.render_to_json_response(context, **response_kwargs)
+
+    def get_queryset(self):
+        site = get_site_access(self.request, self.kwargs["slug"]).site
+        params = self.request.GET
+        queryset = PC.objects.filter(site=site)
+
+        if params.get("activated"):
+            queryset = queryset.filter(is_activated=True)
+
+        query = params.get("q", "").strip()
+        if query:
+            # icontains is UPPER(column) LIKE UPPER(%query%), which the
+            # trigram indexes on the upper case columns can answer
+            queryset = (
+                queryset.filter(
+                    Q(name__icontains=query)
+                    | Q(location__icontains=query)
+                    | Q(uid__icontains=query)
+                )
+                .annotate(
+                    is_prefix_match=Case(
+                        When(
+                            Q(name__istartswith=query) | Q(uid__istartswith=query),
+                            then=Value(True),
+                        ),
+                        default=Value(False),
+                    )
+                )
+                .order_by("-is_prefix_match", "name", "pk")
+            )
+        else:
+            queryset = queryset.order_by("name", "pk")
+
+        return queryset.values(*PCSearch.PC_FIELDS)
+
+    def get_data(self, context):
+        site = context["site"]
+        page = self.get_page_data(context)
+        pc_url = url_formatter("computer", site.uid)
+        page["results"] = [
+            {
+                **{field: pc[field] for field in PCSearch.PC_FIELDS},
+                "url": pc_url(pc["uid"]),
+            }
+            for pc in context["page_obj"]
+        ]
+        return page
+
+
 class PCUpdate(SiteMixin, UpdateView, SuperAdminOrThisSiteMixin):
     template_name = "system/pcs/form.html"
     form_class = PCForm
@@ -1619,7 +1856,7 @@ class PCUpdate(SiteMixin, UpdateView, SuperAdminOrThisSiteMixin):
 
     def get_object(self, queryset=None):
         try:
-            site_id = get_object_or_404(Site, uid=self.kwargs["slug"])
+            site_id = get_site_access(self.request, self.kwargs["slug"]).site
             return PC.objects.get(uid=self.kwargs["pc_uid"], site=site_id)
         except PC.DoesNotExist:
             raise Http404(
@@ -1635,8 +1872,6 @@ class PCUpdate(SiteMixin, UpdateView, SuperAdminOrThisSiteMixin):
         pc = self.object
         params = self.request.GET or self.request.POST
 
-        context["pc_list"] = site.pcs.all()
-
         # Group picklist related:
         group_set = site.groups.all()
         selected_group_ids = form["pc_groups"].value()
@@ -1676,43 +1911,20 @@ class PCUpdate(SiteMixin, UpdateView, SuperAdminOrThisSiteMixin):
 
     def form_valid(self, form):
         pc = self.object
-        groups_pre = pc.pc_groups.all()
-
-        selected_groups = form.cleaned_data["pc_groups"]
-        verified_groups = selected_groups.intersection(groups_pre)
-        unverified_groups = selected_groups.difference(groups_pre).order_by("name")
+        groups_pre = list(pc.pc_groups.all())
 
-        previous_wake_plan = None
-        for group in groups_pre:
-            if group.wake_week_plan:
-                previous_wake_plan = group.wake_week_plan
-                break
-
-        wake_plan = None
-        for group in verified_groups:
-            if group.wake_week_plan:
-                wake_plan = group.wake_week_plan
-                break
+        # Only add the groups that do not belong to a different wake plan
+        # than the other groups of the pc
+        pc_groups = verify_pc_groups(pc, form.cleaned_data["pc_groups"])
+        previous_wake_plan = pc_groups.previous_wake_plan
+        wake_plan = pc_groups.wake_plan
+        invalid_groups_names = [group.name for group in pc_groups.invalid]
 
-        run_wake_plan = False
-        invalid_groups_names = []
-        for group in unverified_groups:
-            group_is_valid = True
-            if wake_plan and group.wake_week_plan and wake_plan != group.wake_week_plan:
-                invalid_groups_names.append(group.name)
-                group_is_valid = False
-            elif wake_plan is None and group.wake_week_plan:
-                wake_plan = group.wake_week_plan
-                if wake_plan != previous_wake_plan:
-                    run_wake_plan = True
-            if group_is_valid:
-                verified_groups = verified_groups.union(
-                    PCGroup.objects.filter(pk=group.pk)
-                )
-
-        form.cleaned_data["pc_groups"] = verified_groups
+        form.cleaned_data["pc_groups"] = PCGroup.objects.filter(
+            pk__in=[group.pk for group in pc_groups.verified]
+        )
 
-        if run_wake_plan and wake_plan.enabled:
+        if pc_groups.joins_wake_plan and wake_plan.enabled:
             args_set = wake_plan.get_script_arguments()
             run_wake_plan_script(
                 self.object.site,
@@ -1769,7 +1981,7 @@ class PCDelete(SiteMixin, SuperAdminOrThisSiteMixin, DeleteView):  # {{{
 
     def get_object(self, queryset=None):
         try:
-            site_id = get_object_or_404(Site, uid=self.kwargs["slug"])
+            site_id = get_site_access(self.request, self.kwargs["slug"]).site
             return PC.objects.get(uid=self.kwargs["pc_uid"], site=site_id)
         except PC.DoesNotExist:
             raise Http404(
@@ -1784,7 +1996,7 @@ class PCDelete(SiteMixin, SuperAdminOrThisSiteMixin, DeleteView):  # {{{
 # TODO: Rename all of these to WakeWeekPlan* now they no longer handle WakeChangeEvents.
 class WakePlanRedirect(RedirectView):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
 
         wake_week_plans = WakeWeekPlan.objects.filter(site=site)
 
@@ -1800,7 +2012,7 @@ class WakePlanBaseMixin(SiteMixin, SuperAdminOrThisSiteMixin):
     def get_context_data(self, **kwargs):
         context = super(WakePlanBaseMixin, self).get_context_data(**kwargs)
 
-        context["site"] = get_object_or_404(Site, uid=self.kwargs["slug"])
+        context["site"] = get_site_access(self.request, self.kwargs["slug"]).site
         plan = self.object
         context["selected_plan"] = plan
         context["wake_week_plans_list"] = WakeWeekPlan.objects.filter(
@@ -1822,7 +2034,7 @@ class WakePlanExtendedMixin(WakePlanBaseMixin):
         context = super(WakePlanExtendedMixin, self).get_context_data(**kwargs)
 
         # These are shared between BaseMixin and ExtendedMixin - ideally they could just be inherited here
-        context["site"] = get_object_or_404(Site, uid=self.kwargs["slug"])
+        context["site"] = get_site_access(self.request, self.kwargs["slug"]).site
         plan = self.object
         context["selected_plan"] = plan
         context["wake_week_plans_list"] = WakeWeekPlan.objects.filter(
@@ -1881,93 +2093,33 @@ class WakePlanExtendedMixin(WakePlanBaseMixin):
         # Adding wake change events
         # The string currently set to "wake_change_events" must match the submit name
         # chosen for the pick list used to add wake change events
-        exceptions_pk = form["wake_change_events"].value()
-        exceptions_selected = WakeChangeEvent.objects.filter(pk__in=exceptions_pk)
-        # Get the related wake change events before the update
-        exceptions_pre = self.object.wake_change_events.all()
-        # Verify the pre-existing events that are still selected
-        verified_exceptions = exceptions_pre.intersection(exceptions_selected)
-        # Newly selected events must be verified
-        unverified_exceptions = exceptions_selected.difference(exceptions_pre).order_by(
-            "-date_start", "name"
-        )
-        invalid_exceptions_names = []
-        # Using the same ordering as the list of events,
-        # check if each newly selected event overlaps with any verified event.
-        # If there is no overlap, verify the checked event. Each subsequently checked event
-        # will thus also be checked for overlap with previously verified events.
+        # Newly selected events are checked in the same ordering as the list of
+        # events, and only added if they don't overlap any event of the plan
+        # or any event added before them.
         # Also get the names of the events that could not be verified.
-        for exception in unverified_exceptions:
-            exception_is_valid = True
-            for valid_exception in verified_exceptions:
-                if (
-                    valid_exception.date_start
-                    <= exception.date_start
-                    <= valid_exception.date_end
-                    or valid_exception.date_start
-                    <= exception.date_end
-                    <= valid_exception.date_end
-                    or exception.date_start
-                    <= valid_exception.date_start
-                    <= exception.date_end
-                ):
-                    exception_is_valid = False
-                    invalid_exceptions_names.append(exception.name)
-                    break
-            if exception_is_valid:
-                verified_exceptions = verified_exceptions.union(
-                    WakeChangeEvent.objects.filter(pk=exception.pk)
-                )
+        verified_exceptions, invalid_exceptions = verify_plan_events(
+            self.object, form["wake_change_events"].value() or []
+        )
+        invalid_exceptions_names = [event.name for event in invalid_exceptions]
         # Add the verified events to the plan
         self.object.wake_change_events.set(verified_exceptions)
         # Adding groups
         # The string currently set to "groups" must match the submit name
         # chosen for the pick list used to add groups
-        groups_pk = form["groups"].value()
-        groups = PCGroup.objects.filter(pk__in=groups_pk)
-        # groups_with_other_plans_names = []
-        # groups_without_other_plans_pk = []
-        # for group in groups:
-        #     if group.wake_week_plan and group.wake_week_plan != self.object:
-        #         groups_with_other_plans_names.append(group.name)
-        #     else:
-        #         groups_without_other_plans_pk.append(group.pk)
-        # groups = PCGroup.objects.filter(pk__in=groups_without_other_plans_pk)
-        # Find the pcs in the groups
-        pcs_in_groups_pk = list(set(groups.values_list("pcs", flat=True)))
-        pcs_in_groups = PC.objects.filter(pk__in=pcs_in_groups_pk)
-        # Find the pcs in the groups that belong to different wake plans
-        pcs_with_other_plans = []
-        pcs_with_other_plans_names = []
-        other_plans_names = []
-        for pc in pcs_in_groups:
-            other_group_relations = pc.pc_groups.exclude(pk__in=groups_pk)
-            for group in other_group_relations:
-                if group.wake_week_plan and group.wake_week_plan != self.object:
-                    pcs_with_other_plans.append(pc.pk)
-                    pcs_with_other_plans_names.append(pc.name)
-                    other_plans_names.append(group.wake_week_plan.name)
-                    break
-        pcs_with_other_plans = PC.objects.filter(pk__in=pcs_with_other_plans)
         # Verify the groups that do not include pcs belonging to a different wake plan
         # and get the names of the groups that could not be verified
-        verified_groups_pk = []
-        invalid_groups_names = []
-        for group in groups:
-            if not pcs_with_other_plans.intersection(group.pcs.all()):
-                verified_groups_pk.append(group.pk)
-            else:
-                invalid_groups_names.append(group.name)
-        verified_groups = PCGroup.objects.filter(pk__in=verified_groups_pk)
+        plan_groups = verify_plan_groups(self.object, form["groups"].value() or [])
+        invalid_groups_names = [group.name for group in plan_groups.invalid]
+        pcs_with_other_plans_names = [
+            pc_name for pc_name, _plan_name in plan_groups.blocked.values()
+        ]
+        other_plans_names = [
+            plan_name for _pc_name, plan_name in plan_groups.blocked.values()
+        ]
         # Add the verified groups to the plan
-        for g in verified_groups:
-            g.wake_week_plan = self.object
-            g.save()
-        # Get the pcs in the verified groups
-        pcs_in_verified_groups_pk = list(
-            set(verified_groups.values_list("pcs", flat=True))
-        )
-        pcs_in_verified_groups = PC.objects.filter(pk__in=pcs_in_verified_groups_pk)
+        PCGroup.objects.filter(
+            pk__in=[group.pk for group in plan_groups.verified]
+        ).update(wake_week_plan=self.object)
         # Generate the notification strings
         invalid_groups_string = get_notification_string(invalid_groups_names)
         pcs_with_other_plans_string = get_notification_string(
@@ -1978,12 +2130,12 @@ class WakePlanExtendedMixin(WakePlanBaseMixin):
         )
         invalid_events_string = get_notification_string(invalid_exceptions_names)
         return (
-            pcs_in_verified_groups,
+            plan_groups.verified_pc_ids,
             invalid_groups_string,
             pcs_with_other_plans_string,
             other_plans_string,
             invalid_events_string,
-            set(groups),
+            set(plan_groups.groups),
         )
 
 
@@ -1995,7 +2147,7 @@ class WakePlanCreate(WakePlanExtendedMixin, CreateView):
 
     def form_valid(self, form):
         # The form does not allow setting the site yourself, so we insert that here
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         if not site.customer.feature_permission.filter(uid="wake_plan"):
             raise PermissionDenied
         self.object = form.save(commit=False)
@@ -2019,7 +2171,7 @@ class WakePlanCreate(WakePlanExtendedMixin, CreateView):
             args_set = self.object.get_script_arguments()
             run_wake_plan_script(
                 self.object.site,
-                pcs_in_verified_groups,
+                PC.objects.filter(pk__in=pcs_in_verified_groups),
                 args_set,
                 self.request.user,
                 type="set",
@@ -2083,7 +2235,7 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
 
     def get_object(self, queryset=None):
         try:
-            site_id = get_object_or_404(Site, uid=self.kwargs["slug"])
+            site_id = get_site_access(self.request, self.kwargs["slug"]).site
             return WakeWeekPlan.objects.get(
                 id=self.kwargs["wake_week_plan_id"], site=site_id
             )
@@ -2116,8 +2268,9 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
         ):
             return self.form_invalid(form)
 
-        # Capture a view of the groups and settings before the update
+        # Capture a view of the groups, members and settings before the update
         groups_pre = set(self.object.groups.all())
+        pcs_pre = plan_pc_ids(self.object)
         plan_pre = self.get_object()
         enabled_pre = plan_pre.enabled
         events_pre = set(self.object.wake_change_events.all())
@@ -2134,29 +2287,21 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
                 groups_selected,
             ) = self.verify_and_add_groups_and_exceptions(form)
 
-            # Remove the deselected groups from the wake plan and find the pc objects in those groups
-            pcs_in_removed_groups = PC.objects.none()
-            groups_removed = groups_pre.difference(groups_selected)
-            for g in groups_removed:
-                pcs_in_removed_groups = pcs_in_removed_groups.union(g.pcs.all())
-                g.wake_week_plan = None
-                g.save()
+            # Remove the deselected groups from the wake plan and find the pcs in those groups
+            groups_removed_pk = [g.pk for g in groups_pre.difference(groups_selected)]
+            pcs_in_removed_groups = set().union(
+                *group_members(groups_removed_pk).values()
+            )
+            PCGroup.objects.filter(pk__in=groups_removed_pk).update(wake_week_plan=None)
 
             # Get the status of the wake plan after the update
             enabled_post = self.object.enabled
 
-            # Find all pc objects belonging to the wake plan after the update
-            pcs_all = PC.objects.none()
-            for g in self.object.groups.all():
-                pcs_all = pcs_all.union(g.pcs.all())
+            # Find all pcs belonging to the wake plan after the update
+            pcs_all = plan_pc_ids(self.object)
 
             # If the wake plan was active before and after the update
             if enabled_pre and enabled_post:
-                # Find the pc objects that belonged to the wake plan before the update
-                pcs_pre = PC.objects.none()
-                for g in groups_pre:
-                    pcs_pre = pcs_pre.union(g.pcs.all())
-
                 # Find the pcs that have been added or removed from the wake plan
                 pcs_to_be_set = pcs_in_verified_groups.difference(pcs_pre)
                 pcs_to_be_reset = pcs_in_removed_groups.difference(pcs_all)
@@ -2164,7 +2309,10 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
                 # Remove the wake plan from the pcs that have been removed
                 if pcs_to_be_reset:
                     run_wake_plan_script(
-                        self.object.site, pcs_to_be_reset, [], self.request.user
+                        self.object.site,
+                        PC.objects.filter(pk__in=pcs_to_be_reset),
+                        [],
+                        self.request.user,
                     )
 
                 # If the wake plan settings have changed, update the wake plan on all members
@@ -2177,7 +2325,7 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
                     args_set = self.object.get_script_arguments()
                     run_wake_plan_script(
                         self.object.site,
-                        pcs_to_be_set,
+                        PC.objects.filter(pk__in=pcs_to_be_set),
                         args_set,
                         self.request.user,
                         type="set",
@@ -2188,7 +2336,10 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
             elif enabled_pre and not enabled_post:
                 if pcs_all:
                     run_wake_plan_script(
-                        self.object.site, pcs_all, [], self.request.user
+                        self.object.site,
+                        PC.objects.filter(pk__in=pcs_all),
+                        [],
+                        self.request.user,
                     )
 
             # If the wake plan status was changed from inactive to active,
@@ -2199,7 +2350,7 @@ class WakePlanUpdate(WakePlanExtendedMixin, UpdateView):
                     args_set = self.object.get_script_arguments()
                     run_wake_plan_script(
                         self.object.site,
-                        pcs_all,
+                        PC.objects.filter(pk__in=pcs_all),
                         args_set,
                         self.request.user,
                         type="set",
@@ -2323,7 +2474,7 @@ class WakePlanDelete(WakePlanBaseMixin, DeleteView):
 
     def get_object(self, queryset=None):
         try:
-            site_id = get_object_or_404(Site, uid=self.kwargs["slug"])
+            site_id = get_site_access(self.request, self.kwargs["slug"]).site
             plan = WakeWeekPlan.objects.get(
                 id=self.kwargs["wake_week_plan_id"], site=site_id
             )
@@ -2347,12 +2498,15 @@ class WakePlanDelete(WakePlanBaseMixin, DeleteView):
 
         # Remove the wake plan from all pcs that belonged to it
         plan = self.get_object()
-        groups = plan.groups.all()
-        if plan.enabled and groups:
-            pcs_in_groups = PC.objects.none()
-            for g in groups:
-                pcs_in_groups = pcs_in_groups.union(g.pcs.all())
-            run_wake_plan_script(plan.site, pcs_in_groups, [], self.request.user)
+        if plan.enabled:
+            pcs_in_groups = plan_pc_ids(plan)
+            if pcs_in_groups:
+                run_wake_plan_script(
+                    plan.site,
+                    PC.objects.filter(pk__in=pcs_in_groups),
+                    [],
+                    self.request.user,
+                )
 
         response = super(WakePlanDelete, self).delete(form, *args, **kwargs)
 
@@ -2402,7 +2556,7 @@ class WakeChangeEventBaseMixin(SiteMixin, SuperAdminOrThisSiteMixin):
         context = super(WakeChangeEventBaseMixin, self).get_context_data(**kwargs)
 
         # Basically in common between both Create, Update and Delete, so consider refactoring out to a Mixin
-        context["site"] = get_object_or_404(Site, uid=self.kwargs["slug"])
+        context["site"] = get_site_access(self.request, self.kwargs["slug"]).site
         event = self.object
         context["selected_event"] = event
         # Note: The sorting here needs to be the same in WakeChangeEventRedirect
@@ -2428,31 +2582,17 @@ class WakeChangeEventBaseMixin(SiteMixin, SuperAdminOrThisSiteMixin):
         plan_with_overlap = ""
         if event.date_end < event.date_start:
             valid = False
-        if valid and event.id and event.wake_week_plans.all():
-            for plan in event.wake_week_plans.all():
-                other_events = plan.wake_change_events.exclude(pk=event.pk)
-                for other_event in other_events:
-                    if (
-                        other_event.date_start
-                        <= event.date_start
-                        <= other_event.date_end
-                        or other_event.date_start
-                        <= event.date_end
-                        <= other_event.date_end
-                        or event.date_start <= other_event.date_start <= event.date_end
-                    ):
-                        valid = False
-                        overlapping_event = other_event.name
-                        plan_with_overlap = plan.name
-                        break
-                if not valid:
-                    break
+        if valid and event.id:
+            overlap = find_overlapping_event(event)
+            if overlap:
+                valid = False
+                overlapping_event, plan_with_overlap = overlap
         return valid, overlapping_event, plan_with_overlap
 
 
 class WakeChangeEventRedirect(RedirectView):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
 
         # Note: The sorting here needs to be the same in WakeChangeEventBaseMixin
         wake_change_events = WakeChangeEvent.objects.filter(site=site).order_by(
@@ -2473,7 +2613,7 @@ class WakeChangeEventUpdate(WakeChangeEventBaseMixin, UpdateView):
 
     def get_object(self, queryset=None):
         try:
-            site_id = get_object_or_404(Site, uid=self.kwargs["slug"])
+            site_id = get_site_access(self.request, self.kwargs["slug"]).site
             return WakeChangeEvent.objects.get(
                 id=self.kwargs["wake_change_event_id"], site=site_id
             )
@@ -2569,7 +2709,7 @@ class WakeChangeEventCreate(WakeChangeEventBaseMixin, CreateView):
 
     def form_valid(self, form):
         # The form does not allow setting the site yourself, so we insert that here
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         if not site.customer.feature_permission.filter(uid="wake_plan"):
             raise PermissionDenied
         self.object = form.save(commit=False)
@@ -2614,16 +2754,13 @@ class WakeChangeEventDelete(WakeChangeEventBaseMixin, DeleteView):
         response = super(WakeChangeEventDelete, self).delete(form, *args, **kwargs)
 
         for plan in plans:
-            pcs_in_groups = PC.objects.none()
-            groups = plan.groups.all()
-            if plan.enabled and groups:
-                for g in groups:
-                    pcs_in_groups = pcs_in_groups.union(g.pcs.all())
+            if plan.enabled:
+                pcs_in_groups = plan_pc_ids(plan)
                 if pcs_in_groups:
                     args_set = plan.get_script_arguments()
                     run_wake_plan_script(
                         plan.site,
-                        pcs_in_groups,
+                        PC.objects.filter(pk__in=pcs_in_groups),
                         args_set,
                         self.request.user,
                         type="set",
@@ -2636,7 +2773,7 @@ class UserRedirect(RedirectView, SuperAdminOrThisSiteMixin):
     """Redirects to either an existing user if one exists, or to the create user page"""
 
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
         users_on_site = site.users
         if users_on_site.exists():
             if self.request.user in users_on_site:
@@ -2654,7 +2791,7 @@ class UserRedirect(RedirectView, SuperAdminOrThisSiteMixin):
 
 class UsersMixin(object):
     def add_site_to_context(self, context):
-        self.site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        self.site = get_site_access(self.request, self.kwargs["slug"]).site
         context["site"] = self.site
         return context
 
@@ -2677,9 +2814,7 @@ class UsersMixin(object):
                 user_profile__sitemembership__site_user_type=SiteMembership.CUSTOMER_ADMIN
             )
         # Add information about outstanding security events.
-        no_of_sec_events = SecurityEvent.objects.priority_events_for_site(
-            self.site
-        ).count()
+        no_of_sec_events = SecurityEventCounter.outstanding_for_site(self.site)
         context["sec_events"] = no_of_sec_events
         return context
 
@@ -2688,9 +2823,7 @@ class UsersMixin(object):
             self.add_userlist_to_context(context)
         request_user = self.request.user
         user_profile = request_user.user_profile
-        site_membership = user_profile.sitemembership_set.filter(
-            site=context["site"]
-        ).first()
+        site_membership = get_site_access(self.request, self.kwargs["slug"]).membership
 
         if site_membership:
             loginusertype = site_membership.site_user_type
@@ -2712,14 +2845,12 @@ class UserLink(FormView, UsersMixin, SuperAdminOrThisSiteMixin):
         Overwrite the get method to ensure that non-customer
         admins can't directly access the UserLink URL.
         """
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
 
         if (
             not self.request.user.is_superuser
-            and self.request.user.user_profile.sitemembership_set.get(
-                site=site
-            ).site_user_type
-            != SiteMembership.CUSTOMER_ADMIN
+            and access.site_user_type != SiteMembership.CUSTOMER_ADMIN
         ):
             raise PermissionDenied
         response = super().get(request, *args, **kwargs)
@@ -2747,14 +2878,12 @@ class UserLink(FormView, UsersMixin, SuperAdminOrThisSiteMixin):
         return context
 
     def form_valid(self, form):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
         # Ensure that only customer admins can use this functionality
         if (
             not self.request.user.is_superuser
-            and self.request.user.user_profile.sitemembership_set.get(
-                site=site
-            ).site_user_type
-            != SiteMembership.CUSTOMER_ADMIN
+            and access.site_user_type != SiteMembership.CUSTOMER_ADMIN
         ):
             raise PermissionDenied
         selected_users = form.cleaned_data["linked_users"]
@@ -2809,10 +2938,9 @@ class UserCreate(CreateView, UsersMixin, SuperAdminOrThisSiteMixin):
         return context
 
     def form_valid(self, form):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        site_membership = self.request.user.user_profile.sitemembership_set.filter(
-            site=site
-        ).first()
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        site_membership = access.membership
 
         if self.request.user.is_superuser:
             site_membership = self.request.user.user_profile.sitemembership_set.first()
@@ -2908,16 +3036,15 @@ class UserUpdate(UpdateView, UsersMixin, SuperAdminOrThisSiteMixin):
 
     def get_form_kwargs(self):
         kwargs = super(UserUpdate, self).get_form_kwargs()
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         kwargs["site"] = site
 
         return kwargs
 
     def form_valid(self, form):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        site_membership_req_user = (
-            self.request.user.user_profile.sitemembership_set.filter(site=site).first()
-        )
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        site_membership_req_user = access.membership
         if (
             self.request.user.is_superuser
             or site_membership_req_user.site_user_type
@@ -3033,10 +3160,9 @@ class UserDelete(DeleteView, UsersMixin, SuperAdminOrThisSiteMixin):
         return reverse("users", kwargs={"slug": self.kwargs["slug"]})
 
     def form_valid(self, form, *args, **kwargs):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        site_membership = self.request.user.user_profile.sitemembership_set.filter(
-            site_id=site.id
-        ).first()
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        site_membership = access.membership
         if (
             not self.request.user.is_superuser
             and site_membership.site_user_type < site_membership.SITE_ADMIN
@@ -3064,7 +3190,7 @@ class ConfigurationEntryCreate(SiteMixin, CreateView, SuperAdminOrThisSiteMixin)
     form_class = ConfigurationEntryForm
 
     def form_valid(self, form):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         self.object = form.save(commit=False)
         self.object.owner_configuration = site.configuration
 
@@ -3084,7 +3210,7 @@ class ConfigurationEntryUpdate(SiteMixin, UpdateView, SuperAdminOrThisSiteMixin)
 
 class PCGroupRedirect(RedirectView, SuperAdminOrThisSiteMixin):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
 
         pc_groups = PCGroup.objects.filter(site=site)
 
@@ -3118,7 +3244,7 @@ class PCGroupCreate(SiteMixin, CreateView, SuperAdminOrThisSiteMixin):
             return super(PCGroupCreate, self).render_to_response(context)
 
     def form_valid(self, form):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         self.object = form.save(commit=False)
         self.object.site = site
 
@@ -3131,7 +3257,7 @@ class PCGroupUpdate(SiteMixin, SuperAdminOrThisSiteMixin, UpdateView):
     model = PCGroup
 
     def get_object(self, queryset=None):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         try:
             # Groups used to be identified by a string UID, so sometimes we get lookups for a string which caused a
             # server error. Hence this explicit attempt to convert it to an int first.
@@ -3173,9 +3299,7 @@ class PCGroupUpdate(SiteMixin, SuperAdminOrThisSiteMixin, UpdateView):
         form.fields["pcs"].queryset = pc_queryset
 
         selected_pc_ids = form["pcs"].value()
-        context["available_pcs"] = pc_queryset.exclude(
-            pk__in=selected_pc_ids
-        ).values_list("pk", "name", "uid")
+        # The available PCs are picked from the PC search
         context["selected_pcs"] = pc_queryset.filter(
             pk__in=selected_pc_ids
         ).values_list("pk", "name", "uid")
@@ -3218,22 +3342,21 @@ class PCGroupUpdate(SiteMixin, SuperAdminOrThisSiteMixin, UpdateView):
             selected_pcs = form.cleaned_data["pcs"]
             new_pcs = set(selected_pcs).difference(members_pre)
             # Find the pcs being added that belong to a different wake plan
-            pcs_with_other_plans_pk = []
-            other_plans_names = []
-            for pc in new_pcs:
-                other_groups = pc.pc_groups.exclude(pk=self.object.pk)
-                for g in other_groups:
-                    if (
-                        g.wake_week_plan
-                        and g.wake_week_plan != self.object.wake_week_plan
-                    ):
-                        pcs_with_other_plans_pk.append(pc.pk)
-                        pcs_with_other_plans_names.append(pc.name)
-                        other_plans_names.append(g.wake_week_plan.name)
-                        break
-            pcs_with_other_plans = PC.objects.filter(pk__in=pcs_with_other_plans_pk)
+            pcs_with_other_plans = pcs_in_other_plans(
+                [pc.pk for pc in new_pcs],
+                self.object.wake_week_plan,
+                exclude_group_ids=[self.object.pk],
+            )
+            pcs_with_other_plans_names = [
+                pc_name for pc_name, _plan_name in pcs_with_other_plans.values()
+            ]
+            other_plans_names = [
+                plan_name for _pc_name, plan_name in pcs_with_other_plans.values()
+            ]
             # Only add the pcs that do not belong to a different wake plan
-            form.cleaned_data["pcs"] = selected_pcs.difference(pcs_with_other_plans)
+            form.cleaned_data["pcs"] = selected_pcs.exclude(
+                pk__in=list(pcs_with_other_plans)
+            )
 
         try:
             with transaction.atomic():
@@ -3275,23 +3398,19 @@ class PCGroupUpdate(SiteMixin, SuperAdminOrThisSiteMixin, UpdateView):
                 # If the group belongs to an active wake plan
                 if self.object.wake_week_plan and self.object.wake_week_plan.enabled:
                     if new_members or removed_members:
-                        # Find the other groups belonging to the same wake plan as this one
-                        other_wake_plan_groups = (
-                            self.object.wake_week_plan.groups.exclude(pk=self.object.pk)
-                        )
                         # Find the pcs in the other groups belonging to the same wake plan as this group
-                        pcs_in_other_wake_plan_groups = PC.objects.none()
-                        for g in other_wake_plan_groups:
-                            pcs_in_other_wake_plan_groups = (
-                                pcs_in_other_wake_plan_groups.union(g.pcs.all())
-                            )
+                        pcs_in_other_wake_plan_groups = plan_pc_ids(
+                            self.object.wake_week_plan,
+                            exclude_group_ids=[self.object.pk],
+                        )
                     # If the group has new members that do not already belong to the wake plan
                     # via a different group, set the wake plan on those members
                     if new_members:
-                        new_wake_plan_members = []
-                        for member in new_members:
-                            if member not in pcs_in_other_wake_plan_groups:
-                                new_wake_plan_members.append(member.pk)
+                        new_wake_plan_members = [
+                            member.pk
+                            for member in new_members
+                            if member.pk not in pcs_in_other_wake_plan_groups
+                        ]
                         if new_wake_plan_members:
                             args_set = self.object.wake_week_plan.get_script_arguments()
                             pcs_to_be_set = PC.objects.filter(
@@ -3308,10 +3427,11 @@ class PCGroupUpdate(SiteMixin, SuperAdminOrThisSiteMixin, UpdateView):
                     # If pcs have been removed from the group that do not still belong to the wake plan
                     # via a different group, remove the wake plan from those pcs
                     if removed_members:
-                        removed_wake_plan_members = []
-                        for member in removed_members:
-                            if member not in pcs_in_other_wake_plan_groups:
-                                removed_wake_plan_members.append(member.pk)
+                        removed_wake_plan_members = [
+                            member.pk
+                            for member in removed_members
+                            if member.pk not in pcs_in_other_wake_plan_groups
+                        ]
                         if removed_wake_plan_members:
                             pcs_to_be_reset = PC.objects.filter(
                                 pk__in=removed_wake_plan_members
@@ -3389,7 +3509,7 @@ class PCGroupDelete(SiteMixin, SuperAdminOrThisSiteMixin, DeleteView):
     model = PCGroup
 
     def get_object(self, queryset=None):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         try:
             # Groups used to be identified by a string UID, so sometimes we get lookups for a string which caused a
             # server error. Hence this explicit attempt to convert it to an int first.
@@ -3417,19 +3537,13 @@ class PCGroupDelete(SiteMixin, SuperAdminOrThisSiteMixin, DeleteView):
             and self_object.wake_week_plan.enabled
             and members
         ):
-            # Find the other groups belonging to the same wake plan as this group
-            other_wake_plan_groups = self_object.wake_week_plan.groups.exclude(
-                pk=self_object.pk
-            )
             # Find the pcs in the other groups belonging to the same wake plan as this group
-            pcs_in_other_wake_plan_groups = PC.objects.none()
-            for g in other_wake_plan_groups:
-                pcs_in_other_wake_plan_groups = pcs_in_other_wake_plan_groups.union(
-                    g.pcs.all()
-                )
+            pcs_in_other_wake_plan_groups = plan_pc_ids(
+                self_object.wake_week_plan, exclude_group_ids=[self_object.pk]
+            )
             # If this group had members that do not still belong to the wake plan
             # via a different group, remove the wake plan from those members
-            pcs_to_be_reset = members.difference(pcs_in_other_wake_plan_groups)
+            pcs_to_be_reset = members.exclude(pk__in=pcs_in_other_wake_plan_groups)
             if pcs_to_be_reset:
                 run_wake_plan_script(
                     self_object.site, pcs_to_be_reset, [], self.request.user
@@ -3442,7 +3556,7 @@ class PCGroupDelete(SiteMixin, SuperAdminOrThisSiteMixin, DeleteView):
 
 class EventRuleRedirect(RedirectView, SuperAdminOrThisSiteMixin):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
 
         # TODO: Make these related_names plural :/
         security_problem = site.securityproblem.all().order_by("name").first()
@@ -3559,10 +3673,9 @@ class SecurityProblemDelete(SiteMixin, DeleteView, SuperAdminOrThisSiteMixin):
         return reverse("event_rules", args=[self.kwargs["slug"]])
 
     def form_valid(self, form, *args, **kwargs):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        site_membership = self.request.user.user_profile.sitemembership_set.filter(
-            site_id=site.id
-        ).first()
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        site_membership = access.membership
         if (
             not self.request.user.is_superuser
             and site_membership.site_user_type < site_membership.SITE_ADMIN
@@ -3609,10 +3722,9 @@ class EventRuleServerDelete(SiteMixin, DeleteView, SuperAdminOrThisSiteMixin):
         return reverse("event_rules", args=[self.kwargs["slug"]])
 
     def form_valid(self, form, *args, **kwargs):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        site_membership = self.request.user.user_profile.sitemembership_set.filter(
-            site_id=site.id
-        ).first()
+        access = get_site_access(self.request, self.kwargs["slug"])
+        site = access.site
+        site_membership = access.membership
         if (
             not self.request.user.is_superuser
             and site_membership.site_user_type < site_membership.SITE_ADMIN
@@ -3658,11 +3770,19 @@ class SecurityEventsView(SiteView):
         return context
 
 
-class SecurityEventSearch(SiteMixin, JSONResponseMixin, BaseListView):
+class SecurityEventSearch(
+    SiteMixin, JSONResponseMixin, KeysetPaginationMixin, BaseListView
+):
     paginate_by = 20
     http_method_names = ["get"]
     VALID_ORDER_BY = []
-    for i in ["pk", "problem__name", "occurred_time", "assigned_user__username"]:
+    for i in [
+        "pk",
+        "problem__name",
+        "rule_name",
+        "occurred_time",
+        "assigned_user__username",
+    ]:
         VALID_ORDER_BY.append(i)
         VALID_ORDER_BY.append("-" + i)
 
@@ -3670,69 +3790,39 @@ class SecurityEventSearch(SiteMixin, JSONResponseMixin, BaseListView):
         return self.render_to_json_response(context, **response_kwargs)
 
     def get_queryset(self):
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
-        queryset = SecurityEvent.objects.filter(
-            Q(problem__site=site) | Q(event_rule_server__site=site)
-        )
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         params = self.request.GET
-
-        if "level" in params:
-            queryset = queryset.filter(
-                Q(problem__level__in=params.getlist("level"))
-                | Q(event_rule_server__level__in=params.getlist("level"))
+        queryset = (
+            SecurityEvent.objects.search(
+                site,
+                levels=params.getlist("level"),
+                statuses=params.getlist("status"),
             )
-
-        if "status" in params:
-            queryset = queryset.filter(status__in=params.getlist("status"))
+            .select_related("problem", "event_rule_server", "pc", "assigned_user")
+            .annotate(rule_name=Coalesce("problem__name", "event_rule_server__name"))
+        )
 
         orderby = params.get("orderby", "-occurred_time")
-        if orderby == "name":
-            queryset = sorted(queryset, key=lambda t: t.namestr)
-        elif orderby == "-name":
-            queryset = sorted(queryset, key=lambda t: t.namestr, reverse=True)
-        else:
-            if orderby not in SecurityEventSearch.VALID_ORDER_BY:
-                orderby = "-occurred_time"
+        # The name of an event is the name of its problem or server rule
+        if orderby in ["name", "-name"]:
+            orderby = orderby.replace("name", "rule_name")
+        if orderby not in SecurityEventSearch.VALID_ORDER_BY:
+            orderby = "-occurred_time"
 
-            queryset = queryset.order_by(orderby, "pk")
+        queryset = queryset.order_by(orderby, "pk")
 
         return queryset
 
     def get_data(self, context):
         site = context["site"]
         page_obj = context["page_obj"]
-        paginator = context["paginator"]
-        adjacent_pages = 2
-        page_numbers = [
-            n
-            for n in range(
-                page_obj.number - adjacent_pages, page_obj.number + adjacent_pages + 1
-            )
-            if n > 0 and n <= paginator.num_pages
-        ]
-
-        result = {
-            "count": paginator.count,
-            "num_pages": paginator.num_pages,
-            "page": page_obj.number,
-            "page_numbers": page_numbers,
-            "has_next": page_obj.has_next(),
-            "next_page_number": (
-                page_obj.next_page_number() if page_obj.has_next() else None
-            ),
-            "has_previous": page_obj.has_previous(),
-            "previous_page_number": (
-                page_obj.previous_page_number() if page_obj.has_previous() else None
-            ),
-            "results": [
+        result = self.get_page_data(context)
+        result.update(
+            results=[
                 {
                     "pk": event.pk,
                     "slug": site.uid,
-                    "problem_name": (
-                        event.problem.name
-                        if event.problem
-                        else event.event_rule_server.name
-                    ),
+                    "problem_name": event.rule_name,
                     "problem_url": (
                         reverse(
                             "event_rule_security_problem",
@@ -3778,19 +3868,70 @@ class SecurityEventSearch(SiteMixin, JSONResponseMixin, BaseListView):
                     "note": event.note,
                 }
                 for event in page_obj
-            ],
-        }
+            ]
+        )
 
         return result
 
 
+class SecurityEventExport(SuperAdminOrThisSiteMixin, SecurityEventSearch):
+    """Download the events matching the filters of the event list, as CSV or
+    as NDJSON."""
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format", CSV)
+        if export_format not in CONTENT_TYPES:
+            raise Http404
+        site = get_site_access(request, kwargs["slug"]).site
+        return export_response(
+            self.get_queryset(),
+            SECURITY_EVENT_COLUMNS,
+            export_format,
+            export_filename("events", site),
+        )
+
+
+class LoginLogExport(SuperAdminOrThisSiteMixin, View):
+    """Download the login log of a site, optionally from and to a date, as CSV
+    or as NDJSON."""
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.has_perm("system.view_loginlog"):
+            raise PermissionDenied
+        export_format = request.GET.get("format", CSV)
+        if export_format not in CONTENT_TYPES:
+            raise Http404
+        site = get_site_access(request, kwargs["slug"]).site
+
+        login_logs = LoginLog.objects.filter(site=site)
+        try:
+            from_date = parse_date(request.GET.get("from_date", ""))
+            to_date = parse_date(request.GET.get("to_date", ""))
+        except ValueError:
+            # Well formed, but not a date, such as 2024-02-30
+            return HttpResponseBadRequest(_("Invalid date"))
+        if from_date:
+            login_logs = login_logs.filter(date__gte=from_date)
+        if to_date:
+            login_logs = login_logs.filter(date__lte=to_date)
+
+        return export_response(
+            login_logs.order_by("date", "login_time", "pk"),
+            LOGIN_LOG_COLUMNS,
+            export_format,
+            export_filename("login_log", site),
+        )
+
+
 class SecurityEventsUpdate(SiteMixin, SuperAdminOrThisSiteMixin, ListView):
     http_method_names = ["post"]
     model = SecurityEvent
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
         params = self.request.POST
         ids = params.getlist("ids")
         queryset = queryset.filter(id__in=ids, pc__site=site)
@@ -3934,9 +4075,10 @@ class DocView(TemplateView, LoginRequiredMixin):
 
         return context
 
+
 class ImageVersionRedirect(RedirectView):
     def get_redirect_url(self, **kwargs):
-        site = get_object_or_404(Site, uid=kwargs["slug"])
+        site = get_site_access(self.request, kwargs["slug"]).site
 
         return reverse(
             "images-product",
@@ -3956,7 +4098,7 @@ class ImageVersionView(SiteMixin, SuperAdminOrThisSiteMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super(ImageVersionView, self).get_context_data(**kwargs)
 
-        site = get_object_or_404(Site, uid=self.kwargs["slug"])
+        site = get_site_access(self.request, self.kwargs["slug"]).site
 
         selected_product = get_object_or_404(Product, id=self.kwargs.get("product_id"))
 
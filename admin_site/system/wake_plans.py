@@ -0,0 +1,224 @@
+"""Which PCs and exceptions belong to which wake plan.
+
+A PC follows the wake plan of the groups it is in, and it may only be in
+groups of one wake plan. The functions here work out the members of plans,
+and the PCs kept out of a plan by another plan, with a fixed number of
+queries on the PC-group memberships, rather than by going through the
+groups of each PC.
+
+The exceptions (wake change events) of a plan may not overlap. They are
+checked by a sweep over the exceptions sorted by date, rather than by
+comparing each exception with all the others.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+from django.db.models import Exists, OuterRef, Q
+
+from system.models import PC, PCGroup, WakeChangeEvent
+
+PCGroupMembership = PC.pc_groups.through
+WakeWeekPlanEvents = WakeChangeEvent.wake_week_plans.through
+
+
+def group_members(group_ids):
+    """Return a dict of group id to the set of ids of the PCs in the group."""
+    members = {group_id: set() for group_id in group_ids}
+    for group_id, pc_id in PCGroupMembership.objects.filter(
+        pcgroup_id__in=group_ids
+    ).values_list("pcgroup_id", "pc_id"):
+        members[group_id].add(pc_id)
+    return members
+
+
+def plan_pc_ids(plan, exclude_group_ids=()):
+    """Return the set of ids of the PCs in the groups of plan, leaving out
+    the groups with exclude_group_ids."""
+    return set(
+        PCGroupMembership.objects.filter(pcgroup__wake_week_plan=plan)
+        .exclude(pcgroup_id__in=exclude_group_ids)
+        .values_list("pc_id", flat=True)
+    )
+
+
+def pcs_in_other_plans(pc_ids, plan, exclude_group_ids=()):
+    """Return the PCs among pc_ids which are in a group of a wake plan other
+    than plan, leaving out the groups with exclude_group_ids.
+
+    The result is a dict of PC id to (PC name, name of the other plan). If a
+    PC is in groups of several other plans, the plan of the first of those
+    groups by name is given."""
+    memberships = PCGroupMembership.objects.filter(
+        pc_id__in=pc_ids, pcgroup__wake_week_plan__isnull=False
+    ).exclude(pcgroup_id__in=exclude_group_ids)
+    if plan is not None:
+        memberships = memberships.exclude(pcgroup__wake_week_plan=plan)
+    blocked = {}
+    for pc_id, pc_name, plan_name in memberships.order_by(
+        "pcgroup__name", "pcgroup_id"
+    ).values_list("pc_id", "pc__name", "pcgroup__wake_week_plan__name"):
+        blocked.setdefault(pc_id, (pc_name, plan_name))
+    return blocked
+
+
+@dataclass
+class PlanGroups:
+    """The groups selected for a wake plan, split into those which may join
+    it and those which may not, because they have PCs in other plans."""
+
+    groups: list
+    verified: list = field(default_factory=list)
+    invalid: list = field(default_factory=list)
+    # PC id to (PC name, name of the other plan) for the PCs in other plans
+    blocked: dict = field(default_factory=dict)
+    # Group id to the ids of its PCs
+    members: dict = field(default_factory=dict)
+
+    @property
+    def verified_pc_ids(self):
+        return set().union(*(self.members[group.id] for group in self.verified))
+
+
+def verify_plan_groups(plan, group_ids):
+    """Split the groups with group_ids into those which may join plan and
+    those which have PCs that are in groups of another plan. The selected
+    groups themselves don't count, as they will be leaving their plans."""
+    group_ids = [int(group_id) for group_id in group_ids]
+    groups = list(PCGroup.objects.filter(pk__in=group_ids))
+    members = group_members([group.id for group in groups])
+    pc_ids = set().union(*members.values())
+    blocked = pcs_in_other_plans(pc_ids, plan, exclude_group_ids=group_ids)
+    result = PlanGroups(groups=groups, blocked=blocked, members=members)
+    for group in groups:
+        if members[group.id].isdisjoint(blocked):
+            result.verified.append(group)
+        else:
+            result.invalid.append(group)
+    return result
+
+
+@dataclass
+class PCGroups:
+    """The groups selected for a PC, split into those it may join and those
+    it may not, because they belong to another wake plan than the other
+    groups of the PC."""
+
+    verified: list = field(default_factory=list)
+    invalid: list = field(default_factory=list)
+    # The wake plan of the PC before and after the change
+    previous_wake_plan: object = None
+    wake_plan: object = None
+    # Whether one of the new groups brings a wake plan the PC didn't have
+    joins_wake_plan: bool = False
+
+
+def verify_pc_groups(pc, selected_groups):
+    """Split selected_groups into those the PC may be in and those it may
+    not. The groups the PC is already in stay, and decide its wake plan if
+    any of them has one. The new groups are then taken by name, and a new
+    group is refused if it has another wake plan than the one decided so
+    far."""
+    groups_pre = list(pc.pc_groups.select_related("wake_week_plan"))
+    selected = list(
+        selected_groups.select_related("wake_week_plan").order_by("name", "pk")
+    )
+    pre_ids = {group.id for group in groups_pre}
+    result = PCGroups()
+    result.previous_wake_plan = next(
+        (group.wake_week_plan for group in groups_pre if group.wake_week_plan), None
+    )
+    result.verified = [group for group in selected if group.id in pre_ids]
+    result.wake_plan = next(
+        (group.wake_week_plan for group in result.verified if group.wake_week_plan),
+        None,
+    )
+    for group in selected:
+        if group.id in pre_ids:
+            continue
+        if result.wake_plan is None:
+            if group.wake_week_plan:
+                result.wake_plan = group.wake_week_plan
+                result.joins_wake_plan = result.wake_plan != result.previous_wake_plan
+        elif group.wake_week_plan and group.wake_week_plan != result.wake_plan:
+            result.invalid.append(group)
+            continue
+        result.verified.append(group)
+    return result
+
+
+def non_overlapping_events(verified, candidates):
+    """Split candidates into those which overlap neither the verified
+    exceptions nor the candidates accepted before them, and the rest.
+
+    The candidates are taken in the order given. Both dates of an exception
+    are included, and the start is not after the end, as the exception form
+    makes sure of. Return the two lists (accepted, rejected)."""
+    # The verified exceptions may overlap each other, so merge them into
+    # disjoint date ranges, sorted by start. Accepted candidates overlap no
+    # range, and are inserted as ranges of their own, so the ranges stay
+    # disjoint, and their ends are sorted as well as their starts.
+    ranges = []
+    for event in sorted(verified, key=lambda event: event.date_start):
+        if ranges and event.date_start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], event.date_end)
+        else:
+            ranges.append([event.date_start, event.date_end])
+    starts = [start for start, _end in ranges]
+    ends = [end for _start, end in ranges]
+
+    accepted = []
+    rejected = []
+    for event in candidates:
+        # Only the last range starting on or before the end of the event can
+        # reach it, as the ranges before it end earlier
+        i = bisect_right(starts, event.date_end)
+        if i and ends[i - 1] >= event.date_start:
+            rejected.append(event)
+            continue
+        accepted.append(event)
+        starts.insert(i, event.date_start)
+        ends.insert(i, event.date_end)
+    return accepted, rejected
+
+
+def verify_plan_events(plan, event_ids):
+    """Split the exceptions with event_ids into those plan may have and those
+    it may not. The exceptions plan already has stay, and the new ones are
+    taken in the order of the list of exceptions, newest first, and refused
+    if they overlap an exception kept so far.
+
+    Return the two lists (verified, invalid)."""
+    events = list(
+        WakeChangeEvent.objects.filter(pk__in=event_ids)
+        .annotate(
+            in_plan=Exists(
+                WakeWeekPlanEvents.objects.filter(
+                    wakeweekplan_id=plan.pk, wakechangeevent_id=OuterRef("pk")
+                )
+            )
+        )
+        .order_by("-date_start", "name", "pk")
+    )
+    verified = [event for event in events if event.in_plan]
+    accepted, invalid = non_overlapping_events(
+        verified, [event for event in events if not event.in_plan]
+    )
+    return verified + accepted, invalid
+
+
+def find_overlapping_event(event):
+    """Return the first exception sharing a wake plan with event which
+    overlaps it, as a tuple (exception name, plan name), or None."""
+    return (
+        WakeChangeEvent.objects.filter(
+            Q(date_start__lte=event.date_start, date_end__gte=event.date_start)
+            | Q(date_start__lte=event.date_end, date_end__gte=event.date_end)
+            | Q(date_start__gte=event.date_start, date_start__lte=event.date_end),
+            wake_week_plans__in=event.wake_week_plans.all(),
+        )
+        .exclude(pk=event.pk)
+        .order_by("wake_week_plans__pk", "date_start", "pk")
+        .values_list("name", "wake_week_plans__name")
+        .first()
+    )